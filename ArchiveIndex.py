@@ -0,0 +1,211 @@
+#!/usr/bin/python
+
+"""
+Index of the screenshots archive, so consumers select screenshots by device, locale and name instead of
+walking <dev>_<lang> folders and parsing names which makeExpandFriendlyPath mangled beyond recovery,
+e.g. "iPad Pro (9.7 inch)" -> "iPad_Pro__9.7_inch_".
+
+The index is a json lines file .archiveIndex.jsonl in the archive root. The orchestrator appends a line
+whenever a screenshot lands in the archive, so keeping it current costs one small write per file:
+	{ "op": "add", "path": <relative path>, "run", "dev", "lang", "name", "width", "height", "bytes", "hash", "mtime" }
+	{ "op": "remove", "path": <relative path> }		a file is gone, or the files below a folder, e.g. of a combo
+The last line about a path wins. compact() rewrites the file when most lines are outdated.
+
+Standalone usage:
+	ArchiveIndex.py -r <archive root> query [--dev P] [--lang P] [--name P] [--run P] [--json]
+	ArchiveIndex.py -r <archive root> rebuild	index an archive from before the index, from the folder names
+	ArchiveIndex.py -r <archive root> compact
+P is an fnmatch pattern.
+"""
+
+import argparse
+import fnmatch
+import hashlib
+import inspect
+import json
+import os
+import re
+import struct
+import sys
+import threading
+import time
+
+g_indexFileName		= '.archiveIndex.jsonl'
+g_pngSignature		= b'\x89PNG\r\n\x1a\n'
+g_comboDirRegex		= re.compile( r'^(?P<dev>.+?)_(?P<lang>[a-z]{2,3}(?:[_-][A-Za-z]{2,4})?)$' )
+g_queryFields		= [ 'dev', 'lang', 'name', 'run' ]
+
+def _dbx ( text ):
+    sys.stdout.write( '  Debug(%s - Ln %d): %s\n' % ( inspect.stack()[1][3], inspect.stack()[1][2], text ) )
+
+def _errorExit ( text ):
+    sys.stderr.write( '\nERROR raised from %s - Ln %d: %s\n' % ( inspect.stack()[1][3], inspect.stack()[1][2], text ) )
+    sys.exit(1)
+
+def pngDimensions( path ):
+	"""return ( width, height ) from the IHDR chunk, ( None, None ) for anything but a png"""
+	with open( path, 'rb' ) as fh:
+		header = fh.read( 24 )
+	if len( header ) < 24 or not header.startswith( g_pngSignature ) or header[ 12:16 ] != b'IHDR':
+		return None, None
+	return struct.unpack( '>II', header[ 16:24 ] )
+
+def fileHash( path ):
+	digest = hashlib.sha1()
+	with open( path, 'rb' ) as fh:
+		for block in iter( lambda: fh.read( 1024 * 1024 ), b'' ):
+			digest.update( block )
+	return digest.hexdigest()
+
+class ArchiveIndex( object ):
+
+	def __init__( self, archiveRoot ):
+		self.archiveRoot = archiveRoot
+		self.path = os.path.join( archiveRoot, g_indexFileName )
+		self._lock = threading.Lock() # screenshot watchers of parallel combos record at the same time
+
+	def _append( self, lines ):
+		with self._lock:
+			with open( self.path, 'a' ) as fh:
+				fh.write( ''.join( json.dumps( line, sort_keys= True ) + '\n' for line in lines ) )
+
+	def _describe( self, path, dev, lang, run ):
+		st = os.stat( path )
+		width, height = pngDimensions( path )
+		return { 'op': 'add', 'path': os.path.relpath( path, self.archiveRoot ), 'run': run, 'dev': dev, 'lang': lang
+			, 'name': os.path.basename( path ), 'width': width, 'height': height, 'bytes': st.st_size
+			, 'hash': fileHash( path ), 'mtime': st.st_mtime }
+
+	def record( self, path, dev, lang, run ):
+		"""add or replace the entry of the archived file path"""
+		self._append( [ self._describe( path, dev, lang, run ) ] )
+
+	def forgetDir( self, dirPath ):
+		"""drop the entries below dirPath, e.g. when the folder of a combo is emptied"""
+		self._append( [ { 'op': 'remove', 'path': os.path.relpath( dirPath, self.archiveRoot ) } ] )
+
+	def _readLines( self ):
+		lines = []
+		if not os.path.isfile( self.path ):
+			return lines
+		with open( self.path, 'r' ) as fh:
+			for text in fh:
+				try:
+					lines.append( json.loads( text ) )
+				except ValueError:
+					pass # a line cut short by a killed run
+		return lines
+
+	def entries( self ):
+		"""return dictionary relative path -> entry of the files in the archive as last recorded"""
+		current = {}
+		pathsOfDir = {} # directory -> relative paths in current, so a remove costs the number of directories
+		for line in self._readLines():
+			relPath = line.get( 'path' )
+			if line.get( 'op' ) == 'add':
+				current[ relPath ] = line
+				pathsOfDir.setdefault( os.path.dirname( relPath ), set() ).add( relPath )
+			elif line.get( 'op' ) == 'remove':
+				if relPath in current: # a file
+					del current[ relPath ]
+					pathsOfDir[ os.path.dirname( relPath ) ].discard( relPath )
+				prefix = relPath.rstrip( os.sep ) + os.sep
+				for dirName in [ dirName for dirName in pathsOfDir if dirName == relPath or dirName.startswith( prefix ) ]:
+					for removed in pathsOfDir.pop( dirName ):
+						del current[ removed ]
+		return current
+
+	def select( self, **patterns ):
+		"""return the entries whose dev, lang, name and run match the given fnmatch patterns, ordered by path"""
+		selected = []
+		for relPath, entry in sorted( self.entries().items() ):
+			if all( fnmatch.fnmatchcase( entry.get( field ) or '', pattern ) for field, pattern in patterns.items() if pattern != None ):
+				selected.append( entry )
+		return selected
+
+	def refresh( self ):
+		"""
+		record again the entries whose file changed since, e.g. by PngOptimizer, and drop those of deleted
+		files. Only stats the indexed files. return the number of changed entries
+		"""
+		lines = []
+		for relPath, entry in self.entries().items():
+			path = os.path.join( self.archiveRoot, relPath )
+			try:
+				st = os.stat( path )
+			except OSError:
+				lines.append( { 'op': 'remove', 'path': relPath } )
+				continue
+			if st.st_size != entry[ 'bytes' ] or st.st_mtime != entry[ 'mtime' ]:
+				lines.append( self._describe( path, entry[ 'dev' ], entry[ 'lang' ], entry[ 'run' ] ) )
+		if len( lines ) > 0: self._append( lines )
+		return len( lines )
+
+	def compact( self, force= False ):
+		"""rewrite the index with the current entries only, when it has more outdated lines than current ones"""
+		cntLines = len( self._readLines() )
+		current = self.entries()
+		if not force and cntLines <= 2 * len( current ):
+			return False
+		with self._lock:
+			tmpPath = self.path + '.tmp'
+			with open( tmpPath, 'w' ) as fh:
+				for relPath in sorted( current ):
+					fh.write( json.dumps( current[ relPath ], sort_keys= True ) + '\n' )
+			os.rename( tmpPath, self.path )
+		return True
+
+	def rebuild( self, run= None ):
+		"""
+		index the combo folders from scratch. The device name is guessed from the folder name, brackets
+		cannot be recovered. return the number of files
+		"""
+		lines = []
+		for dirName in sorted( os.listdir( self.archiveRoot ) ):
+			match = g_comboDirRegex.match( dirName )
+			dirPath = os.path.join( self.archiveRoot, dirName )
+			if dirName.startswith( '.' ) or match == None or not os.path.isdir( dirPath ): continue
+			for name in sorted( os.listdir( dirPath ) ):
+				if name.lower().endswith( '.png' ):
+					lines.append( self._describe( os.path.join( dirPath, name ), match.group( 'dev' ).replace( '_', ' ' ), match.group( 'lang' ), run ) )
+		with self._lock:
+			if os.path.exists( self.path ): os.remove( self.path )
+		self._append( lines )
+		return len( lines )
+
+#
+#MARK: Standalone
+#
+
+def parseCmdLine() :
+	parser = argparse.ArgumentParser( description= "Query the index of a screenshots archive" )
+	parser.add_argument( '-r', '--archiveRoot', help='root of the screenshots archive', required= True )
+	subParsers = parser.add_subparsers( dest= 'command' )
+	queryParser = subParsers.add_parser( 'query', help='list the screenshots matching all given patterns' )
+	for field in g_queryFields:
+		queryParser.add_argument( '--' + field, help='fnmatch pattern for the %s' % field )
+	queryParser.add_argument( '--json', action= 'store_true', help='print the entries as json lines instead of paths' )
+	subParsers.add_parser( 'rebuild', help='index the archive from its folders' )
+	subParsers.add_parser( 'compact', help='drop the outdated lines of the index' )
+	return parser.parse_args()
+
+def main():
+	argObject = parseCmdLine()
+	if not os.path.isdir( argObject.archiveRoot ):
+		_errorExit( "Archive root '%s' is not a directory" % argObject.archiveRoot )
+	startTime = time.time()
+	index = ArchiveIndex( argObject.archiveRoot )
+	if argObject.command == 'rebuild':
+		print( "Indexed %d file(s)" % index.rebuild() )
+	elif argObject.command == 'compact':
+		print( "Compacted" if index.compact( force= True ) else "Nothing to compact" )
+	else:
+		for entry in index.select( **dict( ( field, getattr( argObject, field ) ) for field in g_queryFields ) ):
+			if argObject.json:
+				print( json.dumps( entry, sort_keys= True ) )
+			else:
+				print( os.path.join( argObject.archiveRoot, entry[ 'path' ] ) )
+	sys.stderr.write( "(%.0f ms)\n" % ( ( time.time() - startTime ) * 1000 ) )
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,276 @@
+#!/usr/bin/python
+
+"""
+Measure the overhead of UITestAutomation.py itself, separated from Xcode.
+
+UITestAutomation.py is run end to end against stub xcrun, xcodebuild, osascript and sips executables
+(see BenchmarkStubTool.py) for matrices of increasing size. The stubs log the time they spend, so
+whatever remains of the wall clock time is orchestration overhead.
+
+Reported per matrix size:
+	* orchestration overhead per combo: (wall time - time spent in stubs - countdown) / combos
+	* peak RSS of the orchestrator process
+Reported once, in process:
+	* throughput of the pass/fail parsers (checkXcbAllTestsPassed, RetryPolicy.parseTestCaseResults) in MB/s
+	* throughput of moveScreenshots, archive index included, in MB/s and files/s
+
+Example:
+	./BenchmarkOrchestrator.py --combos 1,10,100,1000 --testDelay 0.2 --testOutputKB 256
+"""
+
+import argparse
+import glob
+import inspect
+import json
+import math
+import os
+import shutil
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+g_repoDir = os.path.dirname( os.path.abspath( __file__ ) )
+g_stubbedTools = [ 'xcrun', 'xcodebuild', 'osascript', 'sips' ]
+g_maxLangs = 10 # matrices are built as devices x langs with at most that many langs
+
+def _dbx ( text ):
+    sys.stdout.write( '  Debug(%s - Ln %d): %s\n' % ( inspect.stack()[1][3], inspect.stack()[1][2], text ) )
+
+def _infoTs ( text, withTS = False ):
+	if withTS:
+		print( '\n%s (Ln %d) %s' % ( time.strftime("%H:%M:%S"), inspect.stack()[1][2], text ) )
+	else :
+		print( '\nINFO (Ln %d) %s' % ( inspect.stack()[1][2], text ) )
+
+def _errorExit ( text ):
+    sys.stderr.write( '\nERROR raised from %s - Ln %d: %s\n' % ( inspect.stack()[1][3], inspect.stack()[1][2], text ) )
+    sys.exit(1)
+
+def parseCmdLine() :
+	parser = argparse.ArgumentParser()
+	parser.add_argument( '--combos', default= '1,10,100', help='comma separated matrix sizes, e.g. 1,10,100,1000' )
+	parser.add_argument( '--testDelay', type= float, default= 0.2, help='seconds each stubbed xcodebuild test takes' )
+	parser.add_argument( '--testOutputKB', type= int, default= 64, help='stdout size of each stubbed xcodebuild test' )
+	parser.add_argument( '--buildOutputKB', type= int, default= 256, help='stdout size of each stubbed xcodebuild build' )
+	parser.add_argument( '--screenshots', type= int, default= 5, help='screenshots written per combo' )
+	parser.add_argument( '--screenshotKB', type= int, default= 500, help='approximate size of each screenshot' )
+	parser.add_argument( '--failRate', type= float, default= 0.0, help='fraction of combos whose first attempt fails' )
+	parser.add_argument( '--parserMB', type= int, default= 20, help='size of the synthetic output fed to the parsers' )
+	parser.add_argument( '--python', default= sys.executable, help='interpreter used to run UITestAutomation.py and the stubs' )
+	parser.add_argument( '--orchestratorArgs', default= '', help='extra arguments passed to UITestAutomation.py, space separated' )
+	parser.add_argument( '--keep', action= 'store_true', help='keep the scratch directory for inspection' )
+	parser.add_argument( '--json', help='also write the results to this file' )
+	return parser.parse_args()
+
+#
+#MARK: Synthetic inputs
+#
+
+def makePng( path, targetBytes ):
+	"""write a valid rgb png of roughly targetBytes. The pixels are noise, so zlib cannot shrink them much
+	"""
+	width = 256
+	height = max( 1, targetBytes // ( width * 3 ) )
+	rows = b''.join( b'\x00' + os.urandom( width * 3 ) for _ in range( height ) )
+	def chunk( chunkType, payload ):
+		return struct.pack( '>I4s', len( payload ), chunkType ) + payload + struct.pack( '>I', zlib.crc32( chunkType + payload ) & 0xffffffff )
+	with open( path, 'wb' ) as fh:
+		fh.write( b'\x89PNG\r\n\x1a\n' + chunk( b'IHDR', struct.pack( '>IIBBBBB', width, height, 8, 2, 0, 0, 0 ) )
+			+ chunk( b'IDAT', zlib.compress( rows, 1 ) ) + chunk( b'IEND', b'' ) )
+
+def installStubs( binDir, python ):
+	stubSource = open( os.path.join( g_repoDir, 'BenchmarkStubTool.py' ), 'r' ).read()
+	body = stubSource.split( '\n', 1 )[1] # replace the shebang with the interpreter we benchmark with
+	for tool in g_stubbedTools:
+		path = os.path.join( binDir, tool )
+		with open( path, 'w' ) as fh:
+			fh.write( '#!%s\n%s' % ( python, body ) )
+		os.chmod( path, os.stat( path ).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH )
+
+def matrixShape( combos ):
+	langCnt = min( combos, g_maxLangs )
+	devCnt = int( math.ceil( combos / float( langCnt ) ) )
+	devs = [ 'Bench Device %03d' % ix for ix in range( devCnt ) ]
+	langs = [ '%s%s_BN' % ( chr( ord( 'a' ) + ix // 26 ), chr( ord( 'a' ) + ix % 26 ) ) for ix in range( langCnt ) ]
+	return devs, langs
+
+def writeProject( scratchDir, devs, langs ):
+	projectDir = os.path.join( scratchDir, 'project' )
+	os.makedirs( os.path.join( projectDir, 'Bench.xcodeproj' ) )
+	schemePath = os.path.join( projectDir, 'Bench.xcscheme' )
+	with open( schemePath, 'w' ) as fh:
+		fh.write( '<Scheme>\n<EnvironmentVariables>\n<EnvironmentVariable\n key = "TARGET_LANG"\n value = "en_US"\n isEnabled = "YES">\n'
+			'</EnvironmentVariable>\n<EnvironmentVariable\n key = "SCREENSHOTS_DIR"\n value = ""\n isEnabled = "YES">\n</EnvironmentVariable>\n'
+			'</EnvironmentVariables>\n</Scheme>\n' )
+	langDevPath = os.path.join( scratchDir, 'langDev.txt' )
+	with open( langDevPath, 'w' ) as fh:
+		fh.write( ''.join( 'lang:%s\n' % lang for lang in langs ) )
+		fh.write( ''.join( 'dev:%s\n' % dev for dev in devs ) )
+	return projectDir, 'Bench.xcscheme', langDevPath
+
+#
+#MARK: Measuring
+#
+
+def readPeakRss( pid ):
+	"""return peak ( or current where the peak is not available ) RSS of pid in kB, None when gone
+	"""
+	try:
+		with open( '/proc/%d/status' % pid, 'r' ) as fh:
+			for line in fh:
+				if line.startswith( 'VmHWM:' ):
+					return int( line.split()[1] )
+	except IOError:
+		pass
+	try:
+		output = subprocess.check_output( [ 'ps', '-o', 'rss=', '-p', str( pid ) ] )
+		return int( output.strip() ) if output.strip() else None
+	except ( OSError, subprocess.CalledProcessError, ValueError ):
+		return None
+
+class RssSampler( threading.Thread ):
+	def __init__( self, pid, interval= 0.05 ):
+		threading.Thread.__init__( self )
+		self.daemon = True
+		self.pid = pid
+		self.interval = interval
+		self.peakKB = 0
+		self.stopEvent = threading.Event()
+
+	def run( self ):
+		while not self.stopEvent.wait( self.interval ):
+			rss = readPeakRss( self.pid )
+			if rss != None: self.peakKB = max( self.peakKB, rss )
+
+def runMatrix( argObject, combos, scratchRoot ):
+	scratchDir = os.path.join( scratchRoot, 'matrix_%d' % combos )
+	binDir = os.path.join( scratchDir, 'bin' )
+	homeDir = os.path.join( scratchDir, 'home' )
+	for path in ( binDir, homeDir ): os.makedirs( path )
+	installStubs( binDir, argObject.python )
+	devs, langs = matrixShape( combos )
+	projectDir, schemeFile, langDevPath = writeProject( scratchDir, devs, langs )
+	pngPath = os.path.join( scratchDir, 'template.png' )
+	makePng( pngPath, argObject.screenshotKB * 1024 )
+	stubLog = os.path.join( scratchDir, 'stubTimes.log' )
+
+	childEnv = dict( os.environ )
+	childEnv.update( { 'PATH': binDir + os.pathsep + os.environ.get( 'PATH', '' ), 'HOME': homeDir
+		, 'BENCH_FIXTURE_DIR': g_repoDir, 'BENCH_STUB_LOG': stubLog
+		, 'BENCH_TEST_DELAY': str( argObject.testDelay ), 'BENCH_TEST_OUTPUT_KB': str( argObject.testOutputKB )
+		, 'BENCH_BUILD_OUTPUT_KB': str( argObject.buildOutputKB ), 'BENCH_SCREENSHOTS': str( argObject.screenshots )
+		, 'BENCH_SCREENSHOT_PNG': pngPath, 'BENCH_FAIL_RATE': str( argObject.failRate )
+		, 'BENCH_DEVICE_NAMES': '|'.join( devs ) } )
+	cmdArgs = [ argObject.python, os.path.join( g_repoDir, 'UITestAutomation.py' ), '-a', 'Bench', '-p', projectDir
+		, '-o', os.path.join( scratchDir, 'derivedData' ), '-s', os.path.join( scratchDir, 'archive' )
+		, '--schemeFile', schemeFile, '--langDevFile', langDevPath, '--legacyScreenshotDir', os.path.join( scratchDir, 'noLegacy' )
+		, '--batch', '--countdown', '0' ] + argObject.orchestratorArgs.split()
+
+	consoleLog = os.path.join( scratchDir, 'orchestrator.log' )
+	startTime = time.time()
+	with open( consoleLog, 'w' ) as logFh:
+		proc = subprocess.Popen( cmdArgs, stdout= logFh, stderr= subprocess.STDOUT, env= childEnv, cwd= scratchDir )
+		sampler = RssSampler( proc.pid )
+		sampler.start()
+		proc.wait()
+		sampler.stopEvent.set()
+		sampler.join()
+	wallSeconds = time.time() - startTime
+	if proc.returncode != 0:
+		_errorExit( "UITestAutomation.py failed with rc %d, see '%s'" % ( proc.returncode, consoleLog ) )
+
+	stubSeconds = {}
+	with open( stubLog, 'r' ) as fh:
+		for line in fh:
+			tool, seconds = line.split()
+			stubSeconds[ tool ] = stubSeconds.get( tool, 0.0 ) + float( seconds )
+	actualCombos = len( devs ) * len( langs )
+	overhead = wallSeconds - sum( stubSeconds.values() )
+	return { 'combos': actualCombos, 'wallSeconds': wallSeconds, 'stubSeconds': stubSeconds
+		, 'overheadPerCombo': overhead / actualCombos, 'peakRssKB': sampler.peakKB, 'consoleLog': consoleLog }
+
+def synthesizeTestOutput( targetBytes ):
+	lines = open( os.path.join( g_repoDir, 'xcb_test_output.log' ), 'r' ).read().splitlines( True )
+	body = [ line for line in lines if not line.startswith( ( 'Test Case', 'Test Suite', 'Executed' ) ) ]
+	tail = [ line for line in lines if line.startswith( ( 'Test Case', 'Test Suite', 'Executed' ) ) ]
+	bodyText = ''.join( body )
+	return bodyText * max( 1, targetBytes // len( bodyText ) ) + ''.join( tail )
+
+def measureInProcess( argObject, scratchRoot ):
+	"""throughput of parsers and screenshot moves, measured by importing the orchestrator
+	"""
+	sys.path.insert( 0, g_repoDir )
+	savedStdout = sys.stdout
+	sys.stdout = open( os.devnull, 'w' ) # the functions are chatty
+	try:
+		import RetryPolicy
+		import UITestAutomation
+
+		text = synthesizeTestOutput( argObject.parserMB * 1024 * 1024 )
+		megaBytes = len( text ) / ( 1024.0 * 1024.0 )
+		results = {}
+		startTime = time.time()
+		passed = UITestAutomation.checkXcbAllTestsPassed( xcbStdout= text )
+		results[ 'checkXcbAllTestsPassedMBps' ] = megaBytes / ( time.time() - startTime )
+		startTime = time.time()
+		testResults = RetryPolicy.parseTestCaseResults( text, 'BenchUITests' )
+		results[ 'parseTestCaseResultsMBps' ] = megaBytes / ( time.time() - startTime )
+
+		srcDir = os.path.join( scratchRoot, 'moveSrc' ); tgtDir = os.path.join( scratchRoot, 'moveTgt' )
+		os.makedirs( srcDir ); os.makedirs( tgtDir )
+		pngPath = os.path.join( scratchRoot, 'move.png' )
+		makePng( pngPath, argObject.screenshotKB * 1024 )
+		cntFiles = 200
+		for ix in range( cntFiles ):
+			shutil.copyfile( pngPath, os.path.join( srcDir, 'shot%03d.png' % ix ) )
+		UITestAutomation.g_archiveIndex = UITestAutomation.ArchiveIndex.ArchiveIndex( scratchRoot ) # indexing is part of the move
+		startTime = time.time()
+		UITestAutomation.moveScreenshots( srcRoot= srcDir, tgtDir= tgtDir, dev= 'iPhone 8', lang= 'en_US' )
+		seconds = time.time() - startTime
+		results[ 'moveScreenshotsMBps' ] = cntFiles * os.path.getsize( pngPath ) / ( 1024.0 * 1024.0 ) / seconds
+		results[ 'moveScreenshotsFilesPerSec' ] = cntFiles / seconds
+	finally:
+		sys.stdout.close()
+		sys.stdout = savedStdout
+	if not passed or len( testResults ) == 0:
+		_errorExit( "Parsers did not recognise the synthetic output" )
+	return results
+
+def main():
+	argObject = parseCmdLine()
+	sizes = [ int( size ) for size in argObject.combos.split( ',' ) ]
+	scratchRoot = tempfile.mkdtemp( prefix= 'uitaBench_' )
+	_infoTs( "Scratch directory: %s" % scratchRoot )
+
+	report = { 'settings': vars( argObject ), 'matrices': [] }
+	try:
+		report[ 'inProcess' ] = measureInProcess( argObject, scratchRoot )
+		for size in sizes:
+			_infoTs( "Running matrix of %d combo(s) ..." % size, True )
+			report[ 'matrices' ].append( runMatrix( argObject, size, scratchRoot ) )
+	finally:
+		if not argObject.keep:
+			shutil.rmtree( scratchRoot, ignore_errors= True )
+
+	lines = [ "Benchmark results:" ]
+	inProcess = report[ 'inProcess' ]
+	lines.append( "checkXcbAllTestsPassed: %8.1f MB/s" % inProcess[ 'checkXcbAllTestsPassedMBps' ] )
+	lines.append( "parseTestCaseResults:   %8.1f MB/s" % inProcess[ 'parseTestCaseResultsMBps' ] )
+	lines.append( "moveScreenshots:        %8.1f MB/s, %.0f files/s" % ( inProcess[ 'moveScreenshotsMBps' ], inProcess[ 'moveScreenshotsFilesPerSec' ] ) )
+	lines.append( "%8s %10s %10s %14s %12s" % ( 'combos', 'wall s', 'stubs s', 'overhead/combo', 'peak RSS MB' ) )
+	for matrix in report[ 'matrices' ]:
+		lines.append( "%8d %10.1f %10.1f %14.3f %12.1f" % ( matrix[ 'combos' ], matrix[ 'wallSeconds' ], sum( matrix[ 'stubSeconds' ].values() )
+			, matrix[ 'overheadPerCombo' ], matrix[ 'peakRssKB' ] / 1024.0 ) )
+	_infoTs( '\n'.join( lines ) )
+
+	if argObject.json != None:
+		with open( argObject.json, 'w' ) as fh:
+			json.dump( report, fh, indent= 1, sort_keys= True )
+
+if __name__ == '__main__':
+	main()
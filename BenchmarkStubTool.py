@@ -0,0 +1,133 @@
+#!/usr/bin/python
+
+"""
+Stand-in for xcrun, xcodebuild, osascript and sips used by BenchmarkOrchestrator.py. The benchmark installs
+this file under each of these names into a directory it puts first on PATH; the name we are called by
+decides what we pretend to be.
+
+xcodebuild replays output synthesised from the fixtures of this repository: xcb_test_output.log for test
+actions and compileIssuesTestFile for build actions, scaled up to the requested size. Test actions also
+write screenshots into the sink passed in TEST_RUNNER_SCREENSHOTS_DIR.
+
+Everything is configured through environment variables set by the benchmark:
+	BENCH_FIXTURE_DIR		where the fixtures live
+	BENCH_STUB_LOG			each invocation appends "<tool> <seconds>" here
+	BENCH_TEST_DELAY		seconds a test action takes, spread over its output
+	BENCH_TEST_OUTPUT_KB	size of the stdout of a test action
+	BENCH_BUILD_OUTPUT_KB	size of the stdout of a build action
+	BENCH_SCREENSHOTS		screenshots written per test action
+	BENCH_SCREENSHOT_PNG	png file copied as screenshot
+	BENCH_FAIL_RATE			fraction of test actions which report a failed test case
+	BENCH_DEVICE_NAMES		device names separated by | for simctl list
+"""
+
+import hashlib
+import json
+import os
+import random
+import shutil
+import sys
+import time
+
+g_startTime = time.time()
+
+def env( key, default ):
+	return type( default )( os.environ.get( key, default ) )
+
+def fixtureLines( name ):
+	with open( os.path.join( os.environ[ 'BENCH_FIXTURE_DIR' ], name ), 'r' ) as fh:
+		return fh.read().splitlines( True )
+
+def scaledOutput( bodyLines, targetBytes ):
+	"""repeat bodyLines, numbering each repetition, until targetBytes are reached
+	"""
+	chunks = []
+	size = 0
+	repetition = 0
+	while size < targetBytes:
+		repetition += 1
+		for line in bodyLines:
+			line = line.replace( '0x600000168a00', '0x6%011x' % repetition )
+			chunks.append( line )
+			size += len( line )
+	return chunks
+
+def emitSlowly( chunks, seconds ):
+	"""write the chunks spreading seconds over them in a few bursts, like xcodebuild does
+	"""
+	bursts = 10
+	perBurst = max( 1, len( chunks ) // bursts )
+	for start in range( 0, len( chunks ), perBurst ):
+		sys.stdout.write( ''.join( chunks[ start : start + perBurst ] ) )
+		sys.stdout.flush()
+		time.sleep( seconds / float( bursts ) )
+
+def argValue( args, flag ):
+	return args[ args.index( flag ) + 1 ] if flag in args else ''
+
+def xcodebuild( args ):
+	if 'build-for-testing' in args or 'build' in args:
+		lines = fixtureLines( 'compileIssuesTestFile' )
+		warningsOnly = [ line for line in lines if ': error:' not in line ]
+		emitSlowly( scaledOutput( warningsOnly, env( 'BENCH_BUILD_OUTPUT_KB', 64 ) * 1024 ), 0.0 )
+		sys.stdout.write( '** TEST BUILD SUCCEEDED **\n' if 'build-for-testing' in args else '** BUILD SUCCEEDED **\n' )
+		if 'test' not in args and 'test-without-building' not in args:
+			return 0
+
+	destination = argValue( args, '-destination' )
+	rng = random.Random( destination + str( time.time() ) )
+	lines = fixtureLines( 'xcb_test_output.log' )
+	body = [ line for line in lines if not line.startswith( ( 'Test Case', 'Test Suite', 'Executed' ) ) ]
+	chunks = scaledOutput( body, env( 'BENCH_TEST_OUTPUT_KB', 32 ) * 1024 )
+
+	sinkDir = os.environ.get( 'TEST_RUNNER_SCREENSHOTS_DIR' )
+	pngPath = os.environ.get( 'BENCH_SCREENSHOT_PNG' )
+	if sinkDir and pngPath:
+		cntShots = env( 'BENCH_SCREENSHOTS', 5 )
+		for ix in range( cntShots ):
+			shutil.copyfile( pngPath, os.path.join( sinkDir, 'P__BenchShot%02d.png' % ix ) )
+
+	emitSlowly( chunks, env( 'BENCH_TEST_DELAY', 0.5 ) )
+
+	failed = rng.random() < env( 'BENCH_FAIL_RATE', 0.0 ) and not any( arg.startswith( '-only-testing' ) for arg in args )
+	status = 'failed' if failed else 'passed'
+	sys.stdout.write( "Test Case '-[BenchUITests.BenchUITests test001_Bench]' %s (12.504 seconds).\n" % status )
+	if failed:
+		sys.stdout.write( "Test Suite 'All tests' failed at 2017-02-18 18:12:45.605.\n** TEST FAILED **\n" )
+		sys.stderr.write( "Testing failed:\n\tBench assertion failed\n" )
+		return 65
+	sys.stdout.write( "Test Suite 'All tests' passed at 2017-02-18 18:12:45.605.\n"
+		"Executed 1 test, with 0 failures (0 unexpected) in 12.504 (12.507) seconds\n** TEST SUCCEEDED **\n" )
+	return 0
+
+def simctl( args ):
+	if len( args ) > 0 and args[0] == 'list':
+		devices = []
+		for name in os.environ.get( 'BENCH_DEVICE_NAMES', '' ).split( '|' ):
+			if name == '': continue
+			udid = hashlib.md5( name.encode( 'utf-8' ) ).hexdigest().upper()
+			udid = '-'.join( [ udid[0:8], udid[8:12], udid[12:16], udid[16:20], udid[20:32] ] )
+			devices.append( { 'name': name, 'udid': udid, 'state': 'Shutdown', 'isAvailable': True, 'availability': '(available)' } )
+		json.dump( { 'devices': { 'com.apple.CoreSimulator.SimRuntime.iOS-10-2': devices }
+			, 'runtimes': [ { 'identifier': 'com.apple.CoreSimulator.SimRuntime.iOS-10-2', 'name': 'iOS 10.2', 'version': '10.2', 'isAvailable': True } ] }
+			, sys.stdout, indent= 2 )
+	return 0
+
+def main():
+	tool = os.path.basename( sys.argv[0] )
+	args = sys.argv[ 1: ]
+	rc = 0
+	if tool == 'xcodebuild':
+		rc = xcodebuild( args )
+	elif tool == 'xcrun' and len( args ) > 0 and args[0] == 'simctl':
+		rc = simctl( args[ 1: ] )
+	# osascript, sips and anything else: succeed silently
+
+	logPath = os.environ.get( 'BENCH_STUB_LOG' )
+	if logPath:
+		with open( logPath, 'a' ) as fh:
+			fh.write( '%s %.4f\n' % ( tool, time.time() - g_startTime ) )
+	return rc
+
+if __name__ == '__main__':
+	sys.exit( main() )
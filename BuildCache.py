@@ -0,0 +1,257 @@
+#!/usr/bin/python
+
+"""
+Cache of built app and test bundles across runs, keyed by a fingerprint of what went into the build.
+
+The fingerprint covers
+	* the files below the project root, except derived data, version control and per-user Xcode state
+	* the scheme file without its environment variables, which we rewrite per combo, but with its build
+	  configuration
+	* the scheme name, the sdk and the output of "xcodebuild -version"
+File hashes are remembered by size and mtime, so fingerprinting an unchanged tree only costs a walk. They
+are kept in one file per project root, so the projects sharing a cache neither drop nor reuse the
+hashes of each other.
+
+After a successful build-for-testing the Build/Products directory of the derived data is stored under
+<cacheDir>/<fingerprint>. When a later run comes up with the same fingerprint the products are put back
+into its derived data and the build is skipped. Restoring uses clones where the file system has them
+( cp -c on APFS ), hardlinks otherwise and copies across devices. Because a hardlinked file would be
+changed in the cache too when xcodebuild writes into it, a restored Products directory is marked and
+thrown away before the next real build.
+
+Entries are evicted least recently used first once the cache grows above its disk budget.
+"""
+
+import errno
+import hashlib
+import inspect
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+
+g_excludedDirNames		= set( [ '.git', '.svn', '.hg', 'build', 'DerivedData', 'xcuserdata' ] )
+g_excludedFileNames		= set( [ '.DS_Store' ] )
+g_restoredMarker		= '.restoredFromBuildCache'
+g_indexName				= 'index.json'
+g_fileHashesName		= 'fileHashes_%s.json' # sha1 of the real path of the project root
+
+def _dbx ( text ):
+    print( '  Debug(%s - Ln %d): %s' % ( inspect.stack()[1][3], inspect.stack()[1][2], text ) )
+
+def _loadJson( path ):
+	if not os.path.isfile( path ):
+		return {}
+	try:
+		with open( path, 'r' ) as fh:
+			content = json.load( fh )
+	except ( IOError, ValueError ) as exc:
+		_dbx( "Ignoring unreadable '%s': %s" % ( path, exc ) )
+		return {}
+	return content if isinstance( content, dict ) else {}
+
+def _saveJson( path, content ):
+	tmpPath = path + '.tmp'
+	with open( tmpPath, 'w' ) as fh:
+		json.dump( content, fh, indent= 1, sort_keys= True )
+	os.rename( tmpPath, path )
+
+def treeBytes( rootDir ):
+	total = 0
+	for dirPath, dirNames, fileNames in os.walk( rootDir ):
+		for fileName in fileNames:
+			path = os.path.join( dirPath, fileName )
+			if not os.path.islink( path ): total += os.path.getsize( path )
+	return total
+
+#
+#MARK: Fingerprint
+#
+
+def xcodeVersion():
+	try:
+		return subprocess.check_output( [ 'xcodebuild', '-version' ], universal_newlines= True, stderr= subprocess.STDOUT )
+	except ( OSError, subprocess.CalledProcessError ):
+		return 'unknown'
+
+def schemeDigestText( schemeFilePath ):
+	"""the scheme file without its environment variables"""
+	with open( schemeFilePath, 'r' ) as fh:
+		text = fh.read()
+	return re.sub( r'<EnvironmentVariables>.*?</EnvironmentVariables>', '', text, flags= re.DOTALL )
+
+def walkSources( projectRoot, excludedPaths ):
+	"""yield ( relative path, path, stat ) of the source files below projectRoot in a stable order
+	"""
+	excluded = set( os.path.realpath( path ) for path in excludedPaths if path != None )
+	for dirPath, dirNames, fileNames in os.walk( projectRoot ):
+		dirNames[:] = sorted( name for name in dirNames if name not in g_excludedDirNames and not name.endswith( '.xcuserdatad' )
+			and os.path.realpath( os.path.join( dirPath, name ) ) not in excluded )
+		for fileName in sorted( fileNames ):
+			path = os.path.join( dirPath, fileName )
+			if fileName in g_excludedFileNames or os.path.realpath( path ) in excluded or os.path.islink( path ):
+				continue
+			try:
+				stat = os.stat( path )
+			except OSError:
+				continue # vanished, e.g. an editor's temporary file
+			yield os.path.relpath( path, projectRoot ), path, stat
+
+def treeSnapshot( projectRoot, excludedPaths= [] ):
+	"""return dictionary relative path -> ( size, mtime ) of the source files"""
+	return dict( ( relPath, ( stat.st_size, stat.st_mtime ) ) for relPath, _, stat in walkSources( projectRoot, excludedPaths ) )
+
+def changedPaths( before, after ):
+	"""return the sorted relative paths added, removed or modified between two snapshots"""
+	return sorted( relPath for relPath in set( before ) | set( after ) if before.get( relPath ) != after.get( relPath ) )
+
+def fingerprint( projectRoot, schemeFilePath, keys, fileHashes, excludedPaths= [] ):
+	"""
+	return the hex digest over the project tree, the scheme and keys, a list of strings like scheme name
+	and sdk. fileHashes maps relative path -> [ size, mtime, sha1 ] and is updated in place
+	"""
+	digest = hashlib.sha1()
+	for key in keys:
+		digest.update( ( 'key:%s\n' % key ).encode( 'utf-8' ) )
+	if schemeFilePath != None:
+		digest.update( schemeDigestText( schemeFilePath ).encode( 'utf-8' ) )
+
+	seen = set()
+	for relPath, path, stat in walkSources( projectRoot, excludedPaths + [ schemeFilePath ] ):
+		known = fileHashes.get( relPath )
+		if known == None or known[0] != stat.st_size or known[1] != stat.st_mtime:
+			fileDigest = hashlib.sha1()
+			with open( path, 'rb' ) as fh:
+				for block in iter( lambda: fh.read( 1 << 20 ), b'' ):
+					fileDigest.update( block )
+			known = [ stat.st_size, stat.st_mtime, fileDigest.hexdigest() ]
+			fileHashes[ relPath ] = known
+		seen.add( relPath )
+		digest.update( ( '%s\0%s\n' % ( relPath, known[2] ) ).encode( 'utf-8' ) )
+	for relPath in list( fileHashes.keys() ):
+		if relPath not in seen: del fileHashes[ relPath ]
+	return digest.hexdigest()
+
+#
+#MARK: Tree cloning
+#
+
+def cloneTree( srcDir, tgtDir, allowHardlinks ):
+	"""
+	reproduce srcDir as tgtDir which must not exist yet. return the method used: 'cloned', 'linked' or 'copied'
+	"""
+	if sys.platform == 'darwin':
+		with open( os.devnull, 'w' ) as devNull:
+			cpStatus = subprocess.call( [ 'cp', '-cR', srcDir, tgtDir ], stderr= devNull )
+		if cpStatus == 0:
+			return 'cloned'
+		if os.path.exists( tgtDir ): shutil.rmtree( tgtDir )
+	if not allowHardlinks:
+		shutil.copytree( srcDir, tgtDir, symlinks= True )
+		return 'copied'
+
+	method = 'linked'
+	for dirPath, dirNames, fileNames in os.walk( srcDir ):
+		tgtDirPath = os.path.join( tgtDir, os.path.relpath( dirPath, srcDir ) )
+		os.makedirs( tgtDirPath )
+		for name in dirNames + fileNames:
+			srcPath = os.path.join( dirPath, name )
+			tgtPath = os.path.join( tgtDirPath, name )
+			if os.path.islink( srcPath ):
+				os.symlink( os.readlink( srcPath ), tgtPath )
+				if name in dirNames: dirNames.remove( name )
+			elif name in fileNames:
+				try:
+					os.link( srcPath, tgtPath )
+				except OSError as exc:
+					if exc.errno not in ( errno.EXDEV, errno.EPERM, errno.EMLINK ):
+						raise
+					shutil.copy2( srcPath, tgtPath )
+					method = 'copied'
+	return method
+
+#
+#MARK: Cache
+#
+
+class BuildCache( object ):
+
+	def __init__( self, cacheDir, budgetMB ):
+		self.cacheDir = cacheDir
+		self.budgetBytes = int( budgetMB * 1024 * 1024 )
+		if not os.path.isdir( cacheDir ): os.makedirs( cacheDir )
+		self.indexPath = os.path.join( cacheDir, g_indexName )
+		self.index = _loadJson( self.indexPath )
+
+	def fingerprint( self, projectRoot, schemeFilePath, keys, excludedPaths= [] ):
+		rootDigest = hashlib.sha1( os.path.realpath( projectRoot ).encode( 'utf-8' ) ).hexdigest()[ :12 ]
+		hashesPath = os.path.join( self.cacheDir, g_fileHashesName % rootDigest )
+		fileHashes = _loadJson( hashesPath )
+		result = fingerprint( projectRoot, schemeFilePath, keys, fileHashes, excludedPaths )
+		_saveJson( hashesPath, fileHashes )
+		return result
+
+	def restore( self, key, productsDir ):
+		"""
+		put the cached products for key into productsDir, replacing what is there. return the method used,
+		None when the cache has no entry for key
+		"""
+		entryDir = os.path.join( self.cacheDir, key )
+		if key not in self.index or not os.path.isdir( entryDir ):
+			return None
+		if os.path.exists( productsDir ): shutil.rmtree( productsDir )
+		parentDir = os.path.dirname( productsDir )
+		if not os.path.isdir( parentDir ): os.makedirs( parentDir )
+		method = cloneTree( entryDir, productsDir, allowHardlinks= True )
+		if method != 'cloned': # even a 'copied' tree may have some hardlinked files
+			with open( os.path.join( productsDir, g_restoredMarker ), 'w' ) as fh:
+				fh.write( key + '\n' )
+		self.index[ key ][ 'lastUsed' ] = time.time()
+		_saveJson( self.indexPath, self.index )
+		return method
+
+	def detachProducts( self, productsDir ):
+		"""
+		remove productsDir when it shares files with the cache, before xcodebuild gets to write into them
+		"""
+		if os.path.isfile( os.path.join( productsDir, g_restoredMarker ) ):
+			shutil.rmtree( productsDir )
+			return True
+		return False
+
+	def store( self, key, productsDir ):
+		"""
+		copy productsDir into the cache as entry for key and evict old entries over budget. return the list of
+		evicted keys
+		"""
+		entryDir = os.path.join( self.cacheDir, key )
+		tmpDir = entryDir + '.tmp'
+		for path in ( tmpDir, entryDir ):
+			if os.path.exists( path ): shutil.rmtree( path )
+		cloneTree( productsDir, tmpDir, allowHardlinks= False ) # xcodebuild may rewrite files of the derived data in place
+		marker = os.path.join( tmpDir, g_restoredMarker )
+		if os.path.exists( marker ): os.remove( marker )
+		os.rename( tmpDir, entryDir )
+		self.index[ key ] = { 'bytes': treeBytes( entryDir ), 'created': time.time(), 'lastUsed': time.time() }
+		evicted = self.evict( keep= key )
+		_saveJson( self.indexPath, self.index )
+		return evicted
+
+	def evict( self, keep= None ):
+		"""drop the least recently used entries until the cache fits its budget. keep is never evicted
+		"""
+		evicted = []
+		byAge = sorted( self.index.keys(), key= lambda key: self.index[ key ][ 'lastUsed' ] )
+		total = sum( entry[ 'bytes' ] for entry in self.index.values() )
+		for key in byAge:
+			if total <= self.budgetBytes: break
+			if key == keep: continue
+			total -= self.index[ key ][ 'bytes' ]
+			del self.index[ key ]
+			entryDir = os.path.join( self.cacheDir, key )
+			if os.path.exists( entryDir ): shutil.rmtree( entryDir )
+			evicted.append( key )
+		return evicted
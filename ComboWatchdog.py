@@ -0,0 +1,285 @@
+#!/usr/bin/python
+
+"""
+Hang watchdog for the child processes started by the UI test automation (xcodebuild, simctl).
+
+A wedged Simulator or XCTest run used to block proc.communicate() forever. Here the child is started
+in its own process group, its stdout and stderr are drained by reader threads and two budgets are
+checked while it runs:
+	* inactivity: seconds without a single new output line
+	* total: seconds since the child was started
+
+When a budget is exceeded we capture the last lines of output and the process tree as diagnostics,
+kill the whole process group and report the combo as timed out so the caller can move on.
+
+Since the children run in sessions of their own, Ctl-c in the terminal does not reach them. The process
+groups of the running children are kept, so the caller can kill them on an interrupt, see killLiveGroups().
+
+The budgets per combo are derived from the durations of previous successful runs which are kept in
+a small json file, see deriveBudgets().
+"""
+
+import inspect
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+g_minTotalBudget		= 120 # never give a combo less than this many seconds in total
+g_minInactivityBudget	= 60  # never kill a combo for less than this many seconds of silence
+g_maxHistoryEntries		= 20  # durations kept per combo key
+g_killGraceSeconds		= 5   # between SIGTERM and SIGKILL
+g_readerJoinSeconds		= 10  # a grandchild outside our process group may keep the pipes open
+g_pollSeconds			= 0.5
+
+g_liveGroups		= {} # pid -> Popen of the children running right now, each leading its own process group
+g_liveGroupsLock	= threading.Lock()
+
+def _dbx ( text ):
+    sys.stdout.write( '  Debug(%s - Ln %d): %s\n' % ( inspect.stack()[1][3], inspect.stack()[1][2], text ) )
+
+#
+#MARK: Duration history and budgets
+#
+
+def loadDurationHistory( path ):
+	"""return the dictionary combo key -> list of run records. A missing or unreadable file yields an empty history
+	"""
+	if not os.path.isfile( path ):
+		return {}
+	try:
+		with open( path, 'r' ) as fh:
+			history = json.load( fh )
+	except ( IOError, ValueError ) as exc:
+		_dbx( "Ignoring unreadable duration history '%s': %s" % ( path, exc ) )
+		return {}
+	if not isinstance( history, dict ):
+		return {}
+	return history
+
+def saveDurationHistory( path, history ):
+	tmpPath = path + '.tmp'
+	with open( tmpPath, 'w' ) as fh:
+		json.dump( history, fh, indent= 1, sort_keys= True )
+	os.rename( tmpPath, path )
+
+def recordDuration( history, comboKey, seconds, maxSilence, outcome, resources= None ):
+	"""
+	append one run record to the history of the combo, keeping only the most recent entries. resources is
+	the usage of ResourceMonitor, if measured
+	"""
+	entries = history.setdefault( comboKey, [] )
+	entries.append( { 'seconds': round( seconds, 1 ), 'maxSilence': round( maxSilence, 1 ), 'outcome': outcome, 'at': int( time.time() ) } )
+	if resources: entries[-1][ 'resources' ] = resources
+	del entries[ : -g_maxHistoryEntries ]
+
+def _percentile( values, fraction ):
+	ordered = sorted( values )
+	ix = int( round( fraction * ( len( ordered ) - 1 ) ) )
+	return ordered[ ix ]
+
+def deriveBudgets( history, comboKey, maxTotal, maxInactivity, factor ):
+	"""
+	return ( totalBudget, inactivityBudget ) in seconds for the given combo.
+
+	Only runs which did not time out count. The total budget is factor times the 90th percentile of the
+	observed durations, the inactivity budget is factor times the longest silence observed. Both are
+	clamped between the g_min* floors and the configured maxima. Without history of the combo itself we
+	fall back to the runs of all combos and finally to the configured maxima.
+	"""
+	def usable( entries ):
+		return [ e for e in entries if e.get( 'outcome' ) != 'timed out' ]
+
+	entries = usable( history.get( comboKey, [] ) )
+	if len( entries ) == 0:
+		entries = [ e for key in history for e in usable( history[ key ] ) ]
+	if len( entries ) == 0:
+		return maxTotal, maxInactivity
+
+	totalBudget = factor * _percentile( [ e[ 'seconds' ] for e in entries ], 0.9 )
+	inactivityBudget = factor * max( e.get( 'maxSilence', 0 ) for e in entries )
+
+	totalBudget = min( maxTotal, max( g_minTotalBudget, totalBudget ) )
+	inactivityBudget = min( maxInactivity, max( g_minInactivityBudget, inactivityBudget ) )
+	return totalBudget, inactivityBudget
+
+def expectedDuration( history, comboKey ):
+	"""return the median duration in seconds of the runs of comboKey which did not time out, None without any
+	"""
+	seconds = [ e[ 'seconds' ] for e in history.get( comboKey, [] ) if e.get( 'outcome' ) != 'timed out' ]
+	if len( seconds ) == 0:
+		return None
+	return _percentile( seconds, 0.5 )
+
+#
+#MARK: Running a child process under supervision
+#
+
+def _drainPipe( pipe, lines, state, lock ):
+	for line in iter( pipe.readline, '' ):
+		with lock:
+			lines.append( line )
+			now = time.time()
+			state[ 'maxSilence' ] = max( state[ 'maxSilence' ], now - state[ 'lastActivity' ] )
+			state[ 'lastActivity' ] = now
+	pipe.close()
+
+def describeProcessTree( rootPid ):
+	"""return a ps listing of rootPid and all its descendants as text
+	"""
+	try:
+		proc = subprocess.Popen( [ 'ps', '-A', '-o', 'pid=,ppid=,pgid=,etime=,command=' ], stdout= subprocess.PIPE, stderr= subprocess.PIPE, universal_newlines= True )
+		psOutput, _ = proc.communicate()
+	except OSError as exc:
+		return "ps not available: %s" % exc
+
+	childrenOf = {}
+	lineOf = {}
+	for line in psOutput.splitlines():
+		fields = line.split( None, 2 )
+		if len( fields ) < 3: continue
+		try:
+			pid, ppid = int( fields[0] ), int( fields[1] )
+		except ValueError:
+			continue
+		childrenOf.setdefault( ppid, [] ).append( pid )
+		lineOf[ pid ] = line.strip()
+
+	treeLines = []
+	todo = [ ( rootPid, 0 ) ]
+	while len( todo ) > 0:
+		pid, depth = todo.pop()
+		treeLines.append( '%s%s' % ( '  ' * depth, lineOf.get( pid, '%d (gone)' % pid ) ) )
+		for child in reversed( childrenOf.get( pid, [] ) ):
+			todo.append( ( child, depth + 1 ) )
+	return '\n'.join( treeLines )
+
+def killProcessGroup( proc ):
+	"""SIGTERM the process group of proc, then SIGKILL whatever is left after the grace period
+	"""
+	for sig in ( signal.SIGTERM, signal.SIGKILL ):
+		try:
+			os.killpg( proc.pid, sig )
+		except OSError:
+			return # group is gone already
+		deadline = time.time() + g_killGraceSeconds
+		while time.time() < deadline:
+			if proc.poll() is not None:
+				break
+			time.sleep( 0.1 )
+	proc.wait()
+
+def killLiveGroups():
+	"""
+	SIGTERM the process groups of all children still running, then SIGKILL whatever is left after the grace
+	period. For the main thread on Ctl-c or SIGTERM, before the script exits. return the number of groups
+	"""
+	with g_liveGroupsLock:
+		procs = list( g_liveGroups.values() )
+		g_liveGroups.clear()
+	for sig in ( signal.SIGTERM, signal.SIGKILL ):
+		for proc in procs:
+			try:
+				os.killpg( proc.pid, sig )
+			except OSError:
+				pass # group is gone already
+		deadline = time.time() + g_killGraceSeconds
+		while sig == signal.SIGTERM and time.time() < deadline and any( proc.poll() is None for proc in procs ):
+			time.sleep( 0.1 )
+	return len( procs )
+
+def pollWithUsage( proc ):
+	"""
+	like proc.poll(), but reaps the child with wait4 so the CPU time and peak RSS of the child and of the
+	descendants it reaped are not lost with it. return the rusage once the child has ended, else None
+	"""
+	if proc.returncode is not None:
+		return None
+	try:
+		pid, status, rusage = os.wait4( proc.pid, os.WNOHANG )
+	except OSError: # reaped already
+		proc.poll()
+		return None
+	if pid == 0:
+		return None
+	proc.returncode = -os.WTERMSIG( status ) if os.WIFSIGNALED( status ) else os.WEXITSTATUS( status )
+	return rusage
+
+def formatDiagnostics( cmdArgs, reason, elapsed, totalBudget, inactivityBudget, outLines, errLines, tailLines, processTree ):
+	parts = []
+	parts.append( "Watchdog killed process group after %s budget was exceeded" % reason )
+	parts.append( "Command: %s" % " ".join( cmdArgs ) )
+	parts.append( "Elapsed: %.1f s, total budget: %.0f s, inactivity budget: %.0f s" % ( elapsed, totalBudget, inactivityBudget ) )
+	parts.append( "\n--- process tree at time of kill ---\n%s" % processTree )
+	parts.append( "\n--- last %d stdout lines ---\n%s" % ( tailLines, ''.join( outLines[ -tailLines: ] ) ) )
+	parts.append( "\n--- last %d stderr lines ---\n%s" % ( tailLines, ''.join( errLines[ -tailLines: ] ) ) )
+	return '\n'.join( parts )
+
+def runWatched( cmdArgs, totalBudget, inactivityBudget, tailLines= 50, cwd= None, env= None, monitor= None ):
+	"""
+	Run cmdArgs like Popen(...).communicate() would, but kill it when one of the budgets is exceeded.
+	monitor is an optional ResourceMonitor.ResourceMonitor to sample the process tree of the child.
+
+	return a dictionary with keys
+		returncode, stdout, stderr: as from communicate()
+		timedOut: None, 'inactivity' or 'total'
+		elapsed, maxSilence: seconds
+		diagnostics: text to be saved by the caller when timedOut is set, else None
+		resources: usage reported by the monitor, else None
+	"""
+	startTime = time.time()
+	devNull = open( os.devnull, 'r' )
+	proc = subprocess.Popen( cmdArgs, stdin= devNull, stdout= subprocess.PIPE, stderr= subprocess.PIPE
+		, cwd= cwd, env= env, universal_newlines= True, preexec_fn= os.setsid, close_fds= True )
+	devNull.close()
+	with g_liveGroupsLock:
+		g_liveGroups[ proc.pid ] = proc
+	if monitor != None: monitor.start( proc.pid )
+
+	outLines = []; errLines = []
+	lock = threading.Lock()
+	state = { 'lastActivity': startTime, 'maxSilence': 0.0 }
+	readers = [ threading.Thread( target= _drainPipe, args= ( proc.stdout, outLines, state, lock ) )
+		, threading.Thread( target= _drainPipe, args= ( proc.stderr, errLines, state, lock ) ) ]
+	for reader in readers:
+		reader.daemon = True
+		reader.start()
+
+	timedOut = None
+	diagnostics = None
+	rootUsage = None
+	while True:
+		rootUsage = pollWithUsage( proc )
+		if proc.returncode is not None: break
+		time.sleep( g_pollSeconds )
+		now = time.time()
+		with lock:
+			silence = now - state[ 'lastActivity' ]
+		if silence > inactivityBudget:
+			timedOut = 'inactivity'
+		elif now - startTime > totalBudget:
+			timedOut = 'total'
+		if timedOut:
+			processTree = describeProcessTree( proc.pid )
+			killProcessGroup( proc )
+			with lock:
+				diagnostics = formatDiagnostics( cmdArgs, timedOut, now - startTime, totalBudget, inactivityBudget
+					, outLines, errLines, tailLines, processTree )
+			break
+	with g_liveGroupsLock: # left in there when interrupted, for killLiveGroups()
+		g_liveGroups.pop( proc.pid, None )
+
+	for reader in readers:
+		reader.join( g_readerJoinSeconds )
+	resources = monitor.stop( rootUsage ) if monitor != None else None
+
+	with lock:
+		elapsed = time.time() - startTime
+		maxSilence = max( state[ 'maxSilence' ], time.time() - state[ 'lastActivity' ] ) if timedOut else state[ 'maxSilence' ]
+		return { 'returncode': proc.returncode
+			, 'stdout': ''.join( outLines ), 'stderr': ''.join( errLines )
+			, 'timedOut': timedOut, 'elapsed': elapsed, 'maxSilence': maxSilence
+			, 'diagnostics': diagnostics, 'resources': resources }
@@ -0,0 +1,219 @@
+#!/usr/bin/python
+
+"""
+Errors and warnings of the compiler in xcodebuild output, with a baseline of the warnings we already know.
+
+The parser is a port of LsCompileIssues.swift: an issue starts with "<file>:<line>:<col>: error:" or
+"warning:", followed by the source line and the pin line, optionally by a "note:" with the referenced
+line and its pin.
+
+The baseline is a json file per app with the warnings known so far, keyed by a hash of file, message
+and a normalised location: the text of the source line instead of its number, so a warning does not
+look new just because code above it moved. After a build we report
+	* all errors
+	* new warnings, i.e. not in the baseline
+	* resolved warnings: known ones which did not show up again although their file was compiled
+and update the baseline. An incremental build compiles a few files only, so the warnings of the other
+files stay known. The baseline is indexed by file, so the diff costs time in proportion to the build
+output, not to the history.
+
+Standalone usage, e.g. on the fixture compileIssuesTestFile:
+	CompileIssues.py <build log> [--warnings] [--baseline FILE [--noUpdate]]
+"""
+
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import re
+import sys
+import time
+
+g_baselineVersion	= 1
+g_issueRegex		= re.compile( r'^(?P<file>.+?):(?P<line>\d+):(?P<column>\d+): (?P<kind>error|warning): (?P<message>.*)$' )
+g_noteRegex			= re.compile( r'^.+?:\d+:\d+: note: ' )
+g_compileStepRegex	= re.compile( r'^Compile(?:Swift|C)\s+\S+\s+\S+\s+(?P<file>.+?)(?:\s+\(in target.*\))?$' )
+g_sourceSuffixes	= ( '.swift', '.m', '.mm', '.c', '.cpp' )
+
+def _dbx ( text ):
+    print( '  Debug(%s - Ln %d): %s' % ( inspect.stack()[1][3], inspect.stack()[1][2], text ) )
+
+#
+#MARK: Parsing
+#
+
+def parseIssues( lines ):
+	"""
+	return the list of issues in lines as dictionaries with kind, file, line, column, message, srcLine,
+	srcPin, noteMsg and refLine. A state machine like the one of LsCompileIssues.swift
+	"""
+	issues = []
+	state = 'initial'
+	for lineText in lines:
+		lineText = lineText.rstrip( '\r\n' )
+		match = g_issueRegex.match( lineText )
+		if match != None and state != 'refLineExpected': # a diagnostic without source lines, e.g. <unknown>:0:0
+			issues.append( { 'kind': match.group( 'kind' ), 'file': match.group( 'file' ), 'line': int( match.group( 'line' ) )
+				, 'column': int( match.group( 'column' ) ), 'message': match.group( 'message' )
+				, 'srcLine': '', 'srcPin': '', 'noteMsg': '', 'refLine': '' } )
+			state = 'srcLineExpected'
+		elif state == 'srcLineExpected':
+			issues[-1][ 'srcLine' ] = lineText
+			state = 'srcPinExpected'
+		elif state == 'srcPinExpected':
+			issues[-1][ 'srcPin' ] = lineText
+			state = 'noteMsgExpected'
+		elif state == 'noteMsgExpected' and g_noteRegex.match( lineText ):
+			issues[-1][ 'noteMsg' ] = lineText
+			state = 'refLineExpected'
+		elif state == 'refLineExpected':
+			issues[-1][ 'refLine' ] = lineText
+			state = 'refPinExpected'
+		else:
+			state = 'initial' # also skips the pin of the referenced line
+	return issues
+
+def compiledFiles( lines ):
+	"""
+	return the set of source files the build compiled, from the CompileSwift/CompileC steps and the swiftc
+	command lines. Empty when the output does not tell
+	"""
+	files = set()
+	for lineText in lines:
+		lineText = lineText.strip()
+		match = g_compileStepRegex.match( lineText )
+		if match != None:
+			files.add( match.group( 'file' ).replace( '\\ ', ' ' ) )
+		elif re.search( r'/swiftc?\s', lineText ) and ' -c ' in lineText:
+			files.update( arg for arg in lineText.split() if arg.endswith( g_sourceSuffixes ) and arg.startswith( '/' ) )
+	return files
+
+#
+#MARK: Baseline
+#
+
+def relativeFile( path, projectRoot ):
+	if projectRoot != None:
+		projectRoot = os.path.abspath( projectRoot ).rstrip( os.sep ) + os.sep
+		if path.startswith( projectRoot ): return path[ len( projectRoot ): ]
+	return path
+
+def issueKey( relFile, message, srcLine ):
+	location = re.sub( r'\s+', ' ', srcLine ).strip()
+	return hashlib.sha1( ( '%s\0%s\0%s' % ( relFile, message, location ) ).encode( 'utf-8' ) ).hexdigest()[ :16 ]
+
+def loadBaseline( path ):
+	empty = { 'warnings': {}, 'byFile': {} }
+	if path == None or not os.path.isfile( path ):
+		return empty
+	try:
+		with open( path, 'r' ) as fh:
+			baseline = json.load( fh )
+	except ( IOError, ValueError ) as exc:
+		_dbx( "Ignoring unreadable compile baseline '%s': %s" % ( path, exc ) )
+		return empty
+	if baseline.get( 'version' ) != g_baselineVersion:
+		return empty
+	return baseline
+
+def saveBaseline( path, baseline ):
+	baseline[ 'version' ] = g_baselineVersion
+	tmpPath = path + '.tmp'
+	with open( tmpPath, 'w' ) as fh:
+		json.dump( baseline, fh, indent= 1, sort_keys= True )
+	os.rename( tmpPath, path )
+
+def diffAgainstBaseline( baseline, issues, compiled, projectRoot= None, update= True ):
+	"""
+	return ( errors, new warnings, resolved warnings ). The warnings are the baseline entries, dictionaries
+	with file, line, message and srcLine. Files not in compiled keep their known warnings; when compiled
+	is empty only the files with issues in this output count as compiled
+	"""
+	errors = [ issue for issue in issues if issue[ 'kind' ] == 'error' ]
+	current = {}
+	for issue in issues:
+		if issue[ 'kind' ] != 'warning': continue
+		relFile = relativeFile( issue[ 'file' ], projectRoot )
+		key = issueKey( relFile, issue[ 'message' ], issue[ 'srcLine' ] )
+		current[ key ] = { 'file': relFile, 'line': issue[ 'line' ], 'message': issue[ 'message' ], 'srcLine': issue[ 'srcLine' ].strip() }
+
+	warnings, byFile = baseline[ 'warnings' ], baseline[ 'byFile' ]
+	newWarnings = [ entry for key, entry in sorted( current.items() ) if key not in warnings ]
+	compiledRel = set( relativeFile( path, projectRoot ) for path in compiled ) or set( entry[ 'file' ] for entry in current.values() )
+	resolvedKeys = [ key for relFile in compiledRel for key in byFile.get( relFile, [] ) if key not in current ]
+	resolved = [ warnings[ key ] for key in resolvedKeys ]
+
+	if update:
+		now = time.time()
+		for key in resolvedKeys:
+			relFile = warnings.pop( key )[ 'file' ]
+			byFile[ relFile ].remove( key )
+			if len( byFile[ relFile ] ) == 0: del byFile[ relFile ]
+		for key, entry in current.items():
+			if key in warnings:
+				warnings[ key ].update( line= entry[ 'line' ], lastSeen= now )
+			else:
+				warnings[ key ] = dict( entry, firstSeen= now, lastSeen= now )
+				byFile.setdefault( entry[ 'file' ], [] ).append( key )
+	return errors, newWarnings, resolved
+
+def formatIssue( issue ):
+	lines = [ "%s:%d:%d: %s: %s" % ( issue[ 'file' ], issue[ 'line' ], issue[ 'column' ], issue[ 'kind' ], issue[ 'message' ] )
+		, issue[ 'srcLine' ], issue[ 'srcPin' ] ]
+	if issue[ 'noteMsg' ]: lines.append( issue[ 'noteMsg' ] )
+	if issue[ 'refLine' ]: lines.append( issue[ 'refLine' ] )
+	return "\n".join( lines )
+
+def formatReport( errors, newWarnings, resolved, cntKnown ):
+	lines = [ "Compile issues: %d error(s), %d new warning(s), %d resolved, %d known warning(s)"
+		% ( len( errors ), len( newWarnings ), len( resolved ), cntKnown ) ]
+	for issue in errors:
+		lines.append( formatIssue( issue ) )
+	for title, entries in ( ( "New warning", newWarnings ), ( "Resolved warning", resolved ) ):
+		for entry in entries:
+			lines.append( "%s %s:%d: %s\n\t%s" % ( title, entry[ 'file' ], entry[ 'line' ], entry[ 'message' ], entry[ 'srcLine' ] ) )
+	return "\n".join( lines )
+
+def reportBuild( buildOutput, baselinePath, projectRoot ):
+	"""diff buildOutput against the baseline at baselinePath, update it and return the report text"""
+	lines = buildOutput.splitlines()
+	baseline = loadBaseline( baselinePath )
+	errors, newWarnings, resolved = diffAgainstBaseline( baseline, parseIssues( lines ), compiledFiles( lines ), projectRoot )
+	saveBaseline( baselinePath, baseline )
+	return formatReport( errors, newWarnings, resolved, len( baseline[ 'warnings' ] ) )
+
+#
+#MARK: Standalone
+#
+
+def parseCmdLine() :
+	parser = argparse.ArgumentParser( description= "List errors and new warnings in xcodebuild or swiftc output" )
+	parser.add_argument( 'buildLog', help='file with the build output' )
+	parser.add_argument( '--warnings', action= 'store_true', help='list all warnings, not only the new ones' )
+	parser.add_argument( '--baseline', help='baseline file of known warnings. Without it every warning counts as new' )
+	parser.add_argument( '--projectRoot', help='paths below it are kept relative in the baseline' )
+	parser.add_argument( '--noUpdate', action= 'store_true', help='leave the baseline as it is' )
+	return parser.parse_args()
+
+def main():
+	argObject = parseCmdLine()
+	startTime = time.time()
+	with open( argObject.buildLog, 'r' ) as fh:
+		lines = fh.read().splitlines()
+	issues = parseIssues( lines )
+	if argObject.warnings:
+		for issue in issues:
+			if issue[ 'kind' ] == 'warning': print( formatIssue( issue ) )
+	baseline = loadBaseline( argObject.baseline )
+	errors, newWarnings, resolved = diffAgainstBaseline( baseline, issues, compiledFiles( lines ), argObject.projectRoot
+		, update= not argObject.noUpdate )
+	if argObject.baseline != None and not argObject.noUpdate:
+		saveBaseline( argObject.baseline, baseline )
+	print( formatReport( errors, newWarnings, resolved, len( baseline[ 'warnings' ] ) ) )
+	print( "(%.0f ms)" % ( ( time.time() - startTime ) * 1000 ) )
+	if len( errors ) > 0:
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
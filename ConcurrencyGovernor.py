@@ -0,0 +1,177 @@
+#!/usr/bin/python
+
+"""
+Decides how many combos may run at the same time, between the configured minimum and maximum.
+
+Too many simulators at once thrash CPU and memory and make every combo slower, too few waste the host.
+Every sampleSeconds the governor looks at
+	* the 1 minute load average per cpu
+	* the memory available to new processes
+	* the RSS of the processes below us ( xcodebuild, test runners ) and of the simulator processes
+and moves the limit by one step:
+	* down when the load per cpu is above maxLoadPerCpu or available memory is below minFreeMB
+	* up when all slots are in use, the load per cpu is below lowLoadFraction * maxLoadPerCpu and the
+	  available memory still leaves room for one more combo of the average observed size
+	* otherwise it holds
+After a change it waits cooldownSeconds before changing again, so the effect of the last step shows
+up in the load average first. Every decision is logged with the numbers it was based on.
+"""
+
+import inspect
+import multiprocessing
+import os
+import re
+import subprocess
+import sys
+import time
+
+g_keptDecisions		= 200 # most recent decisions kept in memory, governor.log has them all
+
+def _infoTs ( text, withTS = False ):
+	if withTS:
+		print( '\n%s (Ln %d) %s' % ( time.strftime("%H:%M:%S"), inspect.stack()[1][2], text ) )
+	else :
+		print( '\nINFO (Ln %d) %s' % ( inspect.stack()[1][2], text ) )
+
+#
+#MARK: System probes
+#
+
+def availableMemoryMB():
+	"""return memory available to new processes in MB, None when we do not know how to find out
+	"""
+	if os.path.isfile( '/proc/meminfo' ):
+		with open( '/proc/meminfo', 'r' ) as fh:
+			for line in fh:
+				if line.startswith( 'MemAvailable:' ):
+					return int( line.split()[1] ) / 1024.0
+		return None
+	try:
+		output = subprocess.check_output( [ 'vm_stat' ], universal_newlines= True )
+	except ( OSError, subprocess.CalledProcessError ):
+		return None
+	match = re.search( r'page size of (\d+) bytes', output )
+	pageSize = int( match.group(1) ) if match else 4096
+	pages = 0
+	for key in ( 'Pages free', 'Pages inactive', 'Pages speculative' ):
+		match = re.search( r'%s:\s+(\d+)' % key, output )
+		if match: pages += int( match.group(1) )
+	return pages * pageSize / ( 1024.0 * 1024.0 )
+
+def testProcessesRssMB( rootPid ):
+	"""
+	return ( RSS in MB summed over the descendants of rootPid and the simulator processes, number of
+	descendants directly below rootPid ) which we take as number of running combos
+	"""
+	try:
+		output = subprocess.check_output( [ 'ps', '-A', '-o', 'pid=,ppid=,rss=,command=' ], universal_newlines= True )
+	except ( OSError, subprocess.CalledProcessError ):
+		return 0.0, 0
+	childrenOf = {}
+	rssOf = {}
+	simulatorPids = []
+	for line in output.splitlines():
+		fields = line.split( None, 3 )
+		if len( fields ) < 4: continue
+		try:
+			pid, ppid, rss = int( fields[0] ), int( fields[1] ), int( fields[2] )
+		except ValueError:
+			continue
+		childrenOf.setdefault( ppid, [] ).append( pid )
+		rssOf[ pid ] = rss
+		if 'CoreSimulator' in fields[3] or 'launchd_sim' in fields[3]:
+			simulatorPids.append( pid )
+
+	seen = set()
+	todo = list( childrenOf.get( rootPid, [] ) ) + simulatorPids
+	while len( todo ) > 0:
+		pid = todo.pop()
+		if pid in seen: continue
+		seen.add( pid )
+		todo.extend( childrenOf.get( pid, [] ) )
+	return sum( rssOf.get( pid, 0 ) for pid in seen ) / 1024.0, len( childrenOf.get( rootPid, [] ) )
+
+def loadPerCpu():
+	try:
+		return os.getloadavg()[0] / multiprocessing.cpu_count()
+	except OSError:
+		return None
+
+#
+#MARK: Governor
+#
+
+class ConcurrencyGovernor( object ):
+
+	def __init__( self, minJobs, maxJobs, maxLoadPerCpu= 1.0, minFreeMB= 1024, sampleSeconds= 10, cooldownSeconds= 30
+			, lowLoadFraction= 0.7, logPath= None, probes= None ):
+		"""
+		probes: optional dictionary with 'load', 'freeMB' and 'rss' functions replacing the system probes,
+		e.g. for a simulation
+		"""
+		self.minJobs = max( 1, minJobs )
+		self.maxJobs = max( self.minJobs, maxJobs )
+		self.maxLoadPerCpu = maxLoadPerCpu
+		self.minFreeMB = minFreeMB
+		self.sampleSeconds = sampleSeconds
+		self.cooldownSeconds = cooldownSeconds
+		self.lowLoadFraction = lowLoadFraction
+		self.logPath = logPath
+		self.probes = probes or { 'load': loadPerCpu, 'freeMB': availableMemoryMB, 'rss': lambda: testProcessesRssMB( os.getpid() ) }
+		self.limit = self.minJobs
+		self.lastSample = 0.0
+		self.lastChange = 0.0
+		self.decisions = []
+
+	def currentLimit( self, running ):
+		"""
+		return the number of combos allowed to run now. Samples the system when the last sample is older
+		than sampleSeconds. running is the number of combos running right now
+		"""
+		now = time.time()
+		if self.minJobs == self.maxJobs or now - self.lastSample < self.sampleSeconds:
+			return self.limit
+		self.lastSample = now
+
+		load = self.probes[ 'load' ]()
+		freeMB = self.probes[ 'freeMB' ]()
+		rssMB, _ = self.probes[ 'rss' ]()
+		perComboMB = rssMB / running if running > 0 else 0.0
+
+		newLimit = self.limit
+		if load != None and load > self.maxLoadPerCpu:
+			newLimit, reason = self.limit - 1, "load per cpu %.2f above %.2f" % ( load, self.maxLoadPerCpu )
+		elif freeMB != None and freeMB < self.minFreeMB:
+			newLimit, reason = self.limit - 1, "available memory %.0f MB below %.0f MB" % ( freeMB, self.minFreeMB )
+		elif running < self.limit:
+			reason = "only %d of %d slots in use" % ( running, self.limit )
+		elif load != None and load > self.lowLoadFraction * self.maxLoadPerCpu:
+			reason = "load per cpu %.2f close to %.2f" % ( load, self.maxLoadPerCpu )
+		elif freeMB != None and freeMB - perComboMB < self.minFreeMB:
+			reason = "one more combo of %.0f MB would leave less than %.0f MB" % ( perComboMB, self.minFreeMB )
+		else:
+			newLimit, reason = self.limit + 1, "load per cpu %s and %s MB available leave room" % (
+				'n/a' if load == None else '%.2f' % load, 'n/a' if freeMB == None else '%.0f' % freeMB )
+
+		newLimit = min( self.maxJobs, max( self.minJobs, newLimit ) )
+		if newLimit != self.limit and now - self.lastChange < self.cooldownSeconds:
+			reason += ", but still cooling down from the last change"
+			newLimit = self.limit
+		self._log( newLimit, running, load, freeMB, rssMB, reason )
+		if newLimit != self.limit:
+			self.lastChange = now
+			self.limit = newLimit
+		return self.limit
+
+	def _log( self, newLimit, running, load, freeMB, rssMB, reason ):
+		verb = 'raise' if newLimit > self.limit else 'lower' if newLimit < self.limit else 'hold'
+		line = "%s governor %s %d -> %d: %s (running %d, load/cpu %s, free %s MB, test processes %.0f MB)" % ( time.strftime( "%H:%M:%S" )
+			, verb, self.limit, newLimit, reason, running, 'n/a' if load == None else '%.2f' % load
+			, 'n/a' if freeMB == None else '%.0f' % freeMB, rssMB )
+		self.decisions.append( line )
+		del self.decisions[ : -g_keptDecisions ]
+		if verb != 'hold':
+			_infoTs( line )
+		if self.logPath != None:
+			with open( self.logPath, 'a' ) as fh:
+				fh.write( line + '\n' )
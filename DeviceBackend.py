@@ -0,0 +1,376 @@
+#!/usr/bin/python
+
+"""
+All interaction with simulators goes through a DeviceBackend, so the orchestrator can be load tested
+without a Mac full of simulators.
+
+	SimctlBackend: the real thing, xcrun simctl, osascript and xcodebuild, each run under the watchdog
+	FakeSimBackend: an in-process model of simulators with boot latency, a limit on the number of booted
+	  devices, contention slowing down tests when many devices run at once and failure injection.
+	  runTests returns xcodebuild-like output and writes screenshots into the sink, so the rest of the
+	  orchestrator cannot tell the difference. Works on Linux
+
+Except for listDevices and runTests, methods return ( ok, stdOutput, errOutput ) like the simctl call
+they stand for.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import random
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+
+import ComboWatchdog
+
+g_simctlBudget	= 120 # seconds, for both total and inactivity budget of simctl commands
+g_fakeRuntime	= 'com.apple.CoreSimulator.SimRuntime.iOS-10-2'
+
+def _dbx ( text ):
+    sys.stdout.write( '  Debug(%s - Ln %d): %s\n' % ( inspect.stack()[1][3], inspect.stack()[1][2], text ) )
+
+def _errorExit ( text ):
+    sys.stderr.write( '\nERROR raised from %s - Ln %d: %s\n' % ( inspect.stack()[1][3], inspect.stack()[1][2], text ) )
+    sys.exit(1)
+
+def makeExpandFriendlyPath( string ):
+	# replace round brackets characters and space with underscore
+	return re.sub(  '[\(\) ]', '_', string )
+
+class DeviceBackend( object ):
+	"""interface, see the module docstring
+	"""
+	name = None
+
+	def boot( self, dev ): raise NotImplementedError
+	def shutdown( self, dev ): raise NotImplementedError
+	def install( self, dev, bundlePath ): raise NotImplementedError
+	def uninstall( self, dev, appId ): raise NotImplementedError
+	def clone( self, dev, newName ): raise NotImplementedError
+	def closeSimulatorApp( self ): raise NotImplementedError
+
+	def prepareForTests( self, dev ):
+		"""bring dev into the state xcodebuild test expects
+		"""
+		raise NotImplementedError
+
+	def listDevices( self ):
+		"""return the devices in the format of "xcrun simctl list -j": { 'devices': { runtime: [ { name, udid, state, isAvailable } ] }, 'runtimes': [ ... ] }
+		"""
+		raise NotImplementedError
+
+	def runTests( self, dev, cmdArgs, testEnv, budgets, tailLines, cwd, monitor= None ):
+		"""
+		Run the xcodebuild test command cmdArgs for dev. testEnv reaches the test runner, budgets is
+		( totalBudget, inactivityBudget ), monitor a ResourceMonitor for the processes of the test if
+		the backend has any. return a dictionary as ComboWatchdog.runWatched does
+		"""
+		raise NotImplementedError
+
+	def runBuild( self, cmdArgs, budgets, tailLines, cwd ):
+		"""
+		Run the xcodebuild build command cmdArgs which needs no device. return as runTests
+		"""
+		raise NotImplementedError
+
+#
+#MARK: Real simulators
+#
+
+class SimctlBackend( DeviceBackend ):
+	name = 'simctl'
+
+	def __init__( self, diagnosticsDir= None ):
+		self.diagnosticsDir = diagnosticsDir
+
+	def _run( self, cmdArgs ):
+		"""
+		simctl may hang as well when the Simulator is wedged, so it runs under the watchdog with a fixed budget
+		"""
+		result = ComboWatchdog.runWatched( cmdArgs, totalBudget= g_simctlBudget, inactivityBudget= g_simctlBudget )
+		if result[ 'timedOut' ] and self.diagnosticsDir != None:
+			path = os.path.join( self.diagnosticsDir, 'Watchdog_%s.log' % makeExpandFriendlyPath( '_'.join( cmdArgs[ 1: ] ) ) )
+			with open( path, 'w' ) as fh:
+				fh.write( result[ 'diagnostics' ] )
+			_dbx( "%s timed out. Diagnostics saved to '%s'" % ( ' '.join( cmdArgs ), path ) )
+		ok = result[ 'returncode' ] == 0 and not result[ 'timedOut' ]
+		return ok, result[ 'stdout' ], result[ 'stderr' ]
+
+	def boot( self, dev ):
+		return self._run( [ 'xcrun', 'simctl', 'boot', dev ] )
+
+	def shutdown( self, dev ):
+		return self._run( [ 'xcrun', 'simctl', 'shutdown', dev ] )
+
+	def install( self, dev, bundlePath ):
+		return self._run( [ 'xcrun', 'simctl', 'install', dev, bundlePath ] )
+
+	def uninstall( self, dev, appId ):
+		return self._run( [ 'xcrun', 'simctl', 'uninstall', dev, appId ] )
+
+	def clone( self, dev, newName ):
+		return self._run( [ 'xcrun', 'simctl', 'clone', dev, newName ] )
+
+	def closeSimulatorApp( self ):
+		return self._run( [ 'osascript', '-e', 'tell app "Simulator" to quit' ] )
+
+	def prepareForTests( self, dev ):
+		result = self.shutdown( dev ) # since xcodebuild complained about dev in booted state
+		time.sleep( 1 )
+		return result
+
+	def listDevices( self ):
+		ok, stdOutput, errOutput = self._run( [ 'xcrun', 'simctl', 'list', '-j' ] )
+		if not ok:
+			raise RuntimeError( "simctl list failed: %s" % errOutput.strip() )
+		return json.loads( stdOutput )
+
+	def runTests( self, dev, cmdArgs, testEnv, budgets, tailLines, cwd, monitor= None ):
+		xcbEnv = dict( os.environ )
+		for key, value in testEnv.items(): xcbEnv[ 'TEST_RUNNER_' + key ] = value
+		totalBudget, inactivityBudget = budgets
+		return ComboWatchdog.runWatched( cmdArgs, totalBudget= totalBudget, inactivityBudget= inactivityBudget
+			, tailLines= tailLines, cwd= cwd, env= xcbEnv, monitor= monitor )
+
+	def runBuild( self, cmdArgs, budgets, tailLines, cwd ):
+		totalBudget, inactivityBudget = budgets
+		return ComboWatchdog.runWatched( cmdArgs, totalBudget= totalBudget, inactivityBudget= inactivityBudget
+			, tailLines= tailLines, cwd= cwd )
+
+#
+#MARK: Fake simulators
+#
+
+def _tinyPng():
+	def chunk( chunkType, payload ):
+		return struct.pack( '>I4s', len( payload ), chunkType ) + payload + struct.pack( '>I', zlib.crc32( chunkType + payload ) & 0xffffffff )
+	return ( b'\x89PNG\r\n\x1a\n' + chunk( b'IHDR', struct.pack( '>IIBBBBB', 1, 1, 8, 2, 0, 0, 0 ) )
+		+ chunk( b'IDAT', zlib.compress( b'\x00\x00\x00\x00' ) ) + chunk( b'IEND', b'' ) )
+
+class FakeSimBackend( DeviceBackend ):
+	"""
+	Constructor arguments ( all times in seconds of the model, multiplied by timeScale before sleeping ):
+		devices: names of the simulators which exist
+		bootLatency, testDuration: ( min, max ) of a uniform distribution
+		runnerStartup: ( min, max ) seconds xcodebuild and the test runner need before the first test
+		capacity: maximum number of devices booted at the same time, more boots fail like on an exhausted host
+		contention: each additional booted device makes tests that much slower, 0.1 meaning 10%
+		failureRates: probabilities of 'boot', 'install', 'uninstall', 'test' failures and 'hang' of a test
+		screenshots: png files written into SCREENSHOTS_DIR per test run, into SCREENSHOTS_DIR/<lang> for each
+			of TARGET_LANGS when given. Each language then adds testDuration
+		testCases: number of test cases reported per run
+		timeScale: 0.001 runs the model a thousand times faster than real time
+		seed: for reproducible failure injection
+	"""
+	name = 'fake'
+
+	def __init__( self, devices, bootLatency= ( 5.0, 20.0 ), testDuration= ( 30.0, 90.0 ), capacity= 8, contention= 0.1
+			, failureRates= None, screenshots= 5, testCases= 3, timeScale= 1.0, seed= None, runnerStartup= ( 0.0, 0.0 ) ):
+		self.bootLatency = bootLatency
+		self.testDuration = testDuration
+		self.runnerStartup = runnerStartup
+		self.capacity = capacity
+		self.contention = contention
+		self.failureRates = failureRates or {}
+		self.screenshots = screenshots
+		self.testCases = testCases
+		self.timeScale = timeScale
+		self._random = random.Random( seed )
+		self._lock = threading.RLock()
+		self._devices = {}
+		for name in devices:
+			self._addDevice( name )
+		self._png = _tinyPng()
+		self.counters = { 'boot': 0, 'test': 0, 'injectedFailures': 0, 'capacityRejections': 0, 'maxBooted': 0 }
+
+	def _addDevice( self, name ):
+		udid = hashlib.md5( name.encode( 'utf-8' ) ).hexdigest().upper()
+		udid = '-'.join( [ udid[0:8], udid[8:12], udid[12:16], udid[16:20], udid[20:32] ] )
+		self._devices[ name ] = { 'name': name, 'udid': udid, 'state': 'Shutdown', 'isAvailable': True }
+		return udid
+
+	def _find( self, dev ):
+		for device in self._devices.values():
+			if dev in ( device[ 'name' ], device[ 'udid' ] ):
+				return device
+		return None
+
+	def _sleep( self, seconds ):
+		time.sleep( seconds * self.timeScale )
+
+	def _uniform( self, bounds ):
+		with self._lock:
+			return self._random.uniform( *bounds )
+
+	def _fails( self, what ):
+		with self._lock:
+			failed = self._random.random() < self.failureRates.get( what, 0.0 )
+			if failed: self.counters[ 'injectedFailures' ] += 1
+		return failed
+
+	def _bootedCount( self ):
+		return sum( 1 for device in self._devices.values() if device[ 'state' ] != 'Shutdown' )
+
+	def boot( self, dev ):
+		with self._lock:
+			device = self._find( dev )
+			if device == None:
+				return False, '', 'Invalid device: %s\n' % dev
+			if device[ 'state' ] != 'Shutdown':
+				return False, '', 'Unable to boot device in current state: Booted\n'
+			if self._bootedCount() >= self.capacity:
+				self.counters[ 'capacityRejections' ] += 1
+				return False, '', 'Unable to boot device: the host ran out of simulator capacity (%d booted)\n' % self.capacity
+			device[ 'state' ] = 'Booting'
+			self.counters[ 'boot' ] += 1
+			self.counters[ 'maxBooted' ] = max( self.counters[ 'maxBooted' ], self._bootedCount() )
+		self._sleep( self._uniform( self.bootLatency ) )
+		with self._lock:
+			if self._fails( 'boot' ):
+				device[ 'state' ] = 'Shutdown'
+				return False, '', 'Unable to boot device: injected failure\n'
+			device[ 'state' ] = 'Booted'
+		return True, '', ''
+
+	def shutdown( self, dev ):
+		with self._lock:
+			device = self._find( dev )
+			if device == None:
+				return False, '', 'Invalid device: %s\n' % dev
+			if device[ 'state' ] == 'Shutdown':
+				return False, '', 'Unable to shutdown device in current state: Shutdown\n'
+			device[ 'state' ] = 'Shutdown'
+		return True, '', ''
+
+	def install( self, dev, bundlePath ):
+		if self._find( dev ) == None:
+			return False, '', 'Invalid device: %s\n' % dev
+		if self._fails( 'install' ):
+			return False, '', 'An error was encountered processing the command (injected failure)\n'
+		return True, '', ''
+
+	def uninstall( self, dev, appId ):
+		if self._find( dev ) == None:
+			return False, '', 'Invalid device: %s\n' % dev
+		if self._fails( 'uninstall' ):
+			return False, '', 'An error was encountered processing the command (injected failure)\n'
+		return True, '', ''
+
+	def clone( self, dev, newName ):
+		with self._lock:
+			if self._find( dev ) == None:
+				return False, '', 'Invalid device: %s\n' % dev
+			if newName in self._devices:
+				return False, '', 'Device %s already exists\n' % newName
+			return True, self._addDevice( newName ) + '\n', ''
+
+	def closeSimulatorApp( self ):
+		with self._lock:
+			for device in self._devices.values(): device[ 'state' ] = 'Shutdown'
+		return True, '', ''
+
+	def prepareForTests( self, dev ):
+		return self.shutdown( dev )
+
+	def listDevices( self ):
+		with self._lock:
+			return { 'devices': { g_fakeRuntime: [ dict( device ) for device in self._devices.values() ] }
+				, 'runtimes': [ { 'identifier': g_fakeRuntime, 'name': 'iOS 10.2', 'version': '10.2', 'isAvailable': True } ] }
+
+	def runTests( self, dev, cmdArgs, testEnv, budgets, tailLines, cwd, monitor= None ):
+		totalBudget, inactivityBudget = budgets # no processes for the monitor to look at
+		startTime = time.time()
+		onlyTesting = [ arg.split( ':', 1 )[1] for arg in cmdArgs if arg.startswith( '-only-testing:' ) ]
+		result = { 'returncode': 0, 'stdout': '', 'stderr': '', 'timedOut': None, 'elapsed': 0.0, 'maxSilence': 0.0, 'diagnostics': None, 'resources': None }
+
+		if self._find( dev ) == None:
+			result.update( returncode= 70, stderr= 'xcodebuild: error: Unable to find a destination matching { name:%s }\n' % dev )
+		else:
+			wasBooted = self._find( dev )[ 'state' ] == 'Booted' # kept warm by the caller
+			ok, errOutput = True, ''
+			if not wasBooted:
+				ok, _, errOutput = self.boot( dev ) # like xcodebuild, which boots the destination itself
+			if not ok:
+				result.update( returncode= 65, stderr= 'Testing failed:\n\tUnable to boot the Simulator.\n' + errOutput )
+			else:
+				try:
+					self._runBootedTests( dev, onlyTesting, testEnv, totalBudget, inactivityBudget, result )
+				finally:
+					if not wasBooted: self.shutdown( dev )
+
+		result[ 'elapsed' ] = time.time() - startTime
+		result[ 'maxSilence' ] = max( result[ 'maxSilence' ], result[ 'elapsed' ] / max( 1, self.testCases ) )
+		with self._lock:
+			self.counters[ 'test' ] += 1
+		return result
+
+	def runBuild( self, cmdArgs, budgets, tailLines, cwd ):
+		return { 'returncode': 0, 'stdout': '** TEST BUILD SUCCEEDED **\n', 'stderr': '', 'timedOut': None
+			, 'elapsed': 0.0, 'maxSilence': 0.0, 'diagnostics': None, 'resources': None }
+
+	def _runBootedTests( self, dev, onlyTesting, testEnv, totalBudget, inactivityBudget, result ):
+		with self._lock:
+			slowDown = 1.0 + self.contention * ( self._bootedCount() - 1 )
+		sessionLangs = testEnv[ 'TARGET_LANGS' ].split( ',' ) if 'TARGET_LANGS' in testEnv else [ None ]
+		duration = self._uniform( self.runnerStartup ) + sum( self._uniform( self.testDuration ) for _ in sessionLangs ) * slowDown
+		if self._fails( 'hang' ):
+			self._sleep( inactivityBudget )
+			result.update( returncode= -15, timedOut= 'inactivity', maxSilence= inactivityBudget * self.timeScale
+				, diagnostics= 'Fake watchdog: simulated hang of %s\n' % dev )
+			return
+		if duration > totalBudget:
+			self._sleep( totalBudget )
+			result.update( returncode= -15, timedOut= 'total', diagnostics= 'Fake watchdog: %s needed %.0f s\n' % ( dev, duration ) )
+			return
+
+		sinkDir = testEnv.get( 'SCREENSHOTS_DIR' )
+		lines = []
+		testIds = onlyTesting or [ 'FakeUITests/FakeUITests/test%03d' % ( ix + 1 ) for ix in range( self.testCases ) ]
+		failedAny = False
+		for ix, testId in enumerate( testIds ):
+			self._sleep( duration / len( testIds ) )
+			for sessionLang in sessionLangs: # the test relaunches the app per language
+				if sinkDir == None or ix >= self.screenshots: break
+				langSinkDir = sinkDir if sessionLang == None else os.path.join( sinkDir, sessionLang )
+				with open( os.path.join( langSinkDir, 'P__Fake%s.png' % testId.split( '/' )[-1] ), 'wb' ) as fh:
+					fh.write( self._png )
+			module, className, method = testId.split( '/' )
+			status = 'failed' if self._fails( 'test' ) else 'passed'
+			failedAny = failedAny or status == 'failed'
+			lines.append( "Test Case '-[%s.%s %s]' %s (%.3f seconds).\n" % ( module, className, method, status, duration / len( testIds ) ) )
+		stamp = time.strftime( '%Y-%m-%d %H:%M:%S.000' )
+		if failedAny:
+			lines.append( "Test Suite 'All tests' failed at %s.\n** TEST FAILED **\n" % stamp )
+			result.update( returncode= 65, stderr= 'Testing failed:\n\tinjected failure\n' )
+		else:
+			lines.append( "Test Suite 'All tests' passed at %s.\nExecuted %d tests, with 0 failures (0 unexpected) in %.3f (%.3f) seconds\n"
+				% ( stamp, len( testIds ), duration, duration ) )
+		result[ 'stdout' ] = ''.join( lines )
+
+def createBackend( name, diagnosticsDir= None, fakeConfigPath= None, devices= [] ):
+	"""
+	return the backend called name. The fake one is configured from the json file fakeConfigPath holding
+	the FakeSimBackend constructor arguments. Without devices in there, the given devices exist. A key which
+	is no constructor argument ends the script, rather than a TypeError or a typo silently ignored
+	"""
+	if name == SimctlBackend.name:
+		return SimctlBackend( diagnosticsDir= diagnosticsDir )
+	if name == FakeSimBackend.name:
+		config = {}
+		if fakeConfigPath != None:
+			with open( fakeConfigPath, 'r' ) as fh:
+				config = json.load( fh )
+			if not isinstance( config, dict ):
+				_errorExit( "Fake backend config '%s' must be a json object" % fakeConfigPath )
+			allowedKeys = inspect.getargspec( FakeSimBackend.__init__ ).args[ 1: ]
+			for key in sorted( config ):
+				if key not in allowedKeys:
+					_errorExit( "Unknown key '%s' in fake backend config '%s', expected some of: %s" % ( key, fakeConfigPath, ', '.join( allowedKeys ) ) )
+		config.setdefault( 'devices', list( devices ) )
+		return FakeSimBackend( **config )
+	raise ValueError( "Unknown device backend '%s'" % name )
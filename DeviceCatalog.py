@@ -0,0 +1,218 @@
+#!/usr/bin/python
+
+"""
+Catalog of the simulators known to simctl, used to check the device list before anything slow starts.
+
+The devices in listOfLangsAndDevices.txt are human names like "iPad Pro (9.7 inch)". A misspelled name, or
+a simulator that is missing on this machine, used to show up only when xcodebuild failed on it, deep into
+the run. Here we ask "xcrun simctl list -j" once, keep the answer in a json file for ttlSeconds and
+resolve every name of the matrix to a UDID and runtime in one preflight step. With a warm cache this
+takes a few milliseconds, a cold one costs a single simctl call.
+
+A name may carry the runtime version to pick among simulators of the same name, e.g. "iPhone 6s (10.2)".
+Without a version the simulator with the newest available runtime wins.
+
+Standalone usage lists the catalog or checks device names:
+	DeviceCatalog.py [--refresh] [dev ...]
+"""
+
+import argparse
+import difflib
+import inspect
+import json
+import os
+import re
+import sys
+import time
+
+import DeviceBackend
+
+g_defaultTtlSeconds	= 3600
+g_runtimeSuffixRegex	= re.compile( r'^(.*\S)\s*\((\d+(?:\.\d+)*)\)$' ) # "iPhone 6s (10.2)", but not "iPad Pro (9.7 inch)"
+
+def _dbx ( text ):
+    print( '  Debug(%s - Ln %d): %s' % ( inspect.stack()[1][3], inspect.stack()[1][2], text ) )
+
+def _versionTuple( version ):
+	return tuple( int( part ) for part in re.findall( r'\d+', version or '' ) )
+
+def _runtimeVersion( runtimeKey, runtimeInfo ):
+	"""
+	return ( version, display name ) of a runtime key of the devices dictionary. Newer Xcode uses
+	identifiers like com.apple.CoreSimulator.SimRuntime.iOS-10-2, older ones "iOS 10.2"
+	"""
+	if runtimeKey in runtimeInfo:
+		info = runtimeInfo[ runtimeKey ]
+		return info.get( 'version', '' ), info.get( 'name', runtimeKey )
+	match = re.search( r'SimRuntime\.(\w+)-([\d-]+)$', runtimeKey )
+	if match:
+		version = match.group(2).replace( '-', '.' )
+		return version, '%s %s' % ( match.group(1), version )
+	match = re.search( r'(\d+(?:\.\d+)*)$', runtimeKey )
+	return ( match.group(1) if match else '' ), runtimeKey
+
+def parseSimctlList( listing ):
+	"""
+	return the list of devices in the json output of "simctl list -j" as dictionaries with name, udid,
+	state, runtime, runtimeVersion, available and availabilityError
+	"""
+	runtimeInfo = {}
+	for runtime in listing.get( 'runtimes', [] ):
+		for key in ( 'identifier', 'name' ):
+			if key in runtime: runtimeInfo[ runtime[ key ] ] = runtime
+	entries = []
+	for runtimeKey, devices in listing.get( 'devices', {} ).items():
+		version, runtimeName = _runtimeVersion( runtimeKey, runtimeInfo )
+		for device in devices:
+			available = device.get( 'isAvailable', True )
+			if 'availability' in device: # before Xcode 10
+				available = 'unavailable' not in device[ 'availability' ]
+			if available in ( 'YES', 'NO' ): available = available == 'YES'
+			entries.append( { 'name': device[ 'name' ], 'udid': device[ 'udid' ], 'state': device.get( 'state', '' )
+				, 'runtime': runtimeName, 'runtimeVersion': version, 'available': bool( available )
+				, 'availabilityError': device.get( 'availabilityError', device.get( 'availability', '' ) ) } )
+	return entries
+
+#
+#MARK: Catalog
+#
+
+class DeviceCatalog( object ):
+
+	def __init__( self, entries, fetchedAt, source ):
+		"""
+		source tells whether the entries come from the 'cache' or were just fetched from 'simctl'
+		"""
+		self.entries = entries
+		self.fetchedAt = fetchedAt
+		self.source = source
+
+	def resolve( self, dev ):
+		"""
+		return ( entry, problem ): the catalog entry dev stands for and None, or None and a message
+		saying what is wrong with dev
+		"""
+		name, version = dev, None
+		if dev not in [ entry[ 'name' ] for entry in self.entries ]:
+			match = g_runtimeSuffixRegex.match( dev )
+			if match: name, version = match.group(1), match.group(2)
+
+		byUdid = [ entry for entry in self.entries if entry[ 'udid' ] == dev ]
+		if len( byUdid ) > 0:
+			candidates = byUdid
+		else:
+			candidates = [ entry for entry in self.entries if entry[ 'name' ] == name
+				and ( version == None or entry[ 'runtimeVersion' ] == version ) ]
+		if len( candidates ) == 0:
+			names = sorted( set( entry[ 'name' ] for entry in self.entries if entry[ 'available' ] ) )
+			similar = difflib.get_close_matches( name, names, n= 3, cutoff= 0.6 )
+			problem = "no simulator named '%s'%s" % ( name, '' if version == None else ' with runtime %s' % version )
+			if len( similar ) > 0: problem += ". Did you mean: %s?" % ", ".join( similar )
+			return None, problem
+
+		available = [ entry for entry in candidates if entry[ 'available' ] ]
+		if len( available ) == 0:
+			reasons = sorted( set( entry[ 'availabilityError' ] for entry in candidates if entry[ 'availabilityError' ] ) )
+			return None, "simulator '%s' is not available%s" % ( dev, ': ' + '; '.join( reasons ) if reasons else '' )
+		available.sort( key= lambda entry: _versionTuple( entry[ 'runtimeVersion' ] ) )
+		return available[-1], None
+
+	def validateMatrix( self, devs ):
+		"""
+		return ( resolved, problems ): the dictionary dev -> catalog entry of the devices we found and
+		the list of messages about those we did not
+		"""
+		resolved = {}
+		problems = []
+		for dev in devs:
+			entry, problem = self.resolve( dev )
+			if entry != None:
+				resolved[ dev ] = entry
+			else:
+				problems.append( "%s: %s" % ( dev, problem ) )
+		return resolved, problems
+
+#
+#MARK: Cache
+#
+
+def _fetch( backend ):
+	return DeviceCatalog( parseSimctlList( backend.listDevices() ), time.time(), 'simctl' )
+
+def _readCache( cachePath, backendName, ttlSeconds ):
+	if not os.path.isfile( cachePath ):
+		return None
+	try:
+		with open( cachePath, 'r' ) as fh:
+			cached = json.load( fh )
+		if cached[ 'backend' ] != backendName or time.time() - cached[ 'fetchedAt' ] > ttlSeconds:
+			return None
+		return DeviceCatalog( cached[ 'entries' ], cached[ 'fetchedAt' ], 'cache' )
+	except ( IOError, ValueError, KeyError, TypeError ) as exc:
+		_dbx( "Ignoring unreadable device catalog '%s': %s" % ( cachePath, exc ) )
+		return None
+
+def _writeCache( cachePath, backendName, catalog ):
+	tmpPath = cachePath + '.tmp'
+	with open( tmpPath, 'w' ) as fh:
+		json.dump( { 'backend': backendName, 'fetchedAt': catalog.fetchedAt, 'entries': catalog.entries }, fh, indent= 1, sort_keys= True )
+	os.rename( tmpPath, cachePath )
+
+def loadCatalog( backend, cachePath, ttlSeconds= g_defaultTtlSeconds, refresh= False ):
+	"""return the catalog from the cache when it is younger than ttlSeconds, from simctl otherwise
+	"""
+	catalog = None if refresh else _readCache( cachePath, backend.name, ttlSeconds )
+	if catalog == None:
+		catalog = _fetch( backend )
+		_writeCache( cachePath, backend.name, catalog )
+	return catalog
+
+def preflight( backend, devs, cachePath, ttlSeconds= g_defaultTtlSeconds, refresh= False ):
+	"""
+	resolve all devs, return ( resolved, problems, seconds spent ) as DeviceCatalog.validateMatrix. When a cached
+	catalog does not know a device we ask simctl once more since the simulator may have been created since
+	"""
+	startTime = time.time()
+	catalog = loadCatalog( backend, cachePath, ttlSeconds, refresh )
+	resolved, problems = catalog.validateMatrix( devs )
+	if len( problems ) > 0 and catalog.source == 'cache':
+		catalog = loadCatalog( backend, cachePath, ttlSeconds, refresh= True )
+		resolved, problems = catalog.validateMatrix( devs )
+	return resolved, problems, time.time() - startTime
+
+#
+#MARK: Standalone
+#
+
+def parseCmdLine() :
+	parser = argparse.ArgumentParser( description= "List the simulators known to simctl or check device names against them" )
+	parser.add_argument( 'devs', nargs= '*', help='device names to resolve' )
+	parser.add_argument( '--cacheFile', default= os.path.join( os.path.expanduser( '~' ), ".UITestAutomation", "deviceCatalog_simctl.json" ) )
+	parser.add_argument( '--ttl', type= float, default= g_defaultTtlSeconds, help='seconds a cached catalog stays valid' )
+	parser.add_argument( '--refresh', action= 'store_true', help='ignore the cached catalog' )
+	return parser.parse_args()
+
+def main():
+	argObject = parseCmdLine()
+	cacheDir = os.path.dirname( argObject.cacheFile )
+	if not os.path.isdir( cacheDir ): os.makedirs( cacheDir )
+	backend = DeviceBackend.SimctlBackend()
+
+	if len( argObject.devs ) == 0:
+		catalog = loadCatalog( backend, argObject.cacheFile, argObject.ttl, argObject.refresh )
+		for entry in sorted( catalog.entries, key= lambda entry: ( entry[ 'name' ], _versionTuple( entry[ 'runtimeVersion' ] ) ) ):
+			print( "%-30s %-12s %s %s" % ( entry[ 'name' ], entry[ 'runtime' ], entry[ 'udid' ], '' if entry[ 'available' ] else '(unavailable)' ) )
+		return
+
+	resolved, problems, seconds = preflight( backend, argObject.devs, argObject.cacheFile, argObject.ttl, argObject.refresh )
+	for dev in argObject.devs:
+		if dev in resolved:
+			print( "%-30s -> %s (%s)" % ( dev, resolved[ dev ][ 'udid' ], resolved[ dev ][ 'runtime' ] ) )
+	for problem in problems:
+		print( "ERROR %s" % problem )
+	print( "Checked %d device(s) in %.3f s" % ( len( argObject.devs ), seconds ) )
+	if len( problems ) > 0:
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,335 @@
+#!/usr/bin/python
+
+"""
+Index of failure signatures across the logs of all runs, to answer triage questions without grepping.
+
+A run directory ( ~/UITestAutomatationRun_* ) holds UITest_StdOUT__*, UITest_StdERR__*, Watchdog__*,
+Build_Std* and ErrorFrom_* files. From these we extract failure lines:
+	test		Test Case '-[Module.Class testName]' failed
+	assertion	File.swift: -[Module.Class testName] : XCTAssertTrue failed - message
+	compile		File.swift: error: message
+	testing		the lines below "Testing failed:" in stderr
+	xcodebuild	xcodebuild: error: ...
+	simctl		errors of simctl and CoreSimulator
+	timeout		the watchdog killed the combo
+and normalise them into signatures: directories, line numbers, timestamps, durations, addresses and UUIDs
+are stripped so the same failure looks the same in every run.
+
+The index is a json file. A log file is parsed again only when its size or mtime changed, so updating
+after a run costs little more than a stat per file. Each file remembers the signatures it hit, so
+forgetting a changed or deleted file only touches those.
+
+Usage:
+	FailureIndex.py update								scan all run directories
+	FailureIndex.py [--update] list [--new] [--kind K]	signatures, --new: only those new since the last green run
+	FailureIndex.py [--update] show PATTERN				runs, devices and locales which hit the matching signatures
+list and show read the index as it is, unless --update scans the run directories first.
+"""
+
+import argparse
+import glob
+import hashlib
+import inspect
+import json
+import os
+import re
+import sys
+import time
+
+g_indexVersion	= 2 # bump when the extraction changes, so all logs are parsed again
+g_indexPath		= os.path.join( os.path.expanduser( '~' ), ".UITestAutomation", "failureIndex.json" )
+g_runDirsGlob	= os.path.join( os.path.expanduser( '~' ), "UITestAutomatationRun_*" )
+g_logPatterns	= [ 'UITest_StdOUT__*', 'UITest_StdERR__*', 'Watchdog__*', 'Build_StdOUT', 'Build_StdERR', 'ErrorFrom_*' ]
+g_comboFileRegex	= re.compile( r'^(UITest_StdOUT|UITest_StdERR|Watchdog)__(?P<combo>.+?)(?:_attempt(?P<attempt>\d+))?$' )
+g_localeRegex	= re.compile( r'^(?P<dev>.+?)_(?P<lang>[a-z]{2,3}(?:[_-][A-Za-z]{2,4})?)$' )
+
+g_normalisations = [
+	( re.compile( r'\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:\s?[+-]\d{4})?' ), '<TS>' ),
+	( re.compile( r'\b[0-9A-Fa-f]{8}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{12}\b' ), '<UUID>' ),
+	( re.compile( r'\b0x[0-9a-fA-F]+\b' ), '<ADDR>' ),
+	( re.compile( r'\s*\(\d+(?:\.\d+)? seconds\)' ), '' ),
+	( re.compile( r'(?:/[^/\s:\'"]+)+/([^/\s:\'"]+)' ), r'\1' ), # absolute paths: keep the file name
+	( re.compile( r'\b(pid|PID)[ =:]\s*\d+' ), r'\1 <PID>' ),
+	]
+
+g_lineRules = [ # ( kind, regex ), the first match wins; group 'text' is the signature text unless absent
+	( 'assertion', re.compile( r'^(?P<file>\S+?):\d+: error: (?P<text>-\[.*\] : .*)$' ) ),
+	( 'test', re.compile( r"^(?P<text>Test Case '-\[.*\]' failed)" ) ),
+	( 'compile', re.compile( r'^(?P<file>\S+?\.(?:swift|m|mm|h|c|cpp|storyboard|xib)):\d+(?::\d+)?: (?P<text>error: .*)$' ) ),
+	( 'xcodebuild', re.compile( r'^(?P<text>xcodebuild: error: .*)$' ) ),
+	( 'simctl', re.compile( r'^(?P<text>(?:An error was encountered processing the command|Invalid device|Unable to (?:boot|shutdown) device|Failed to (?:install|launch)).*)$' ) ),
+	]
+
+def _dbx ( text ):
+    print( '  Debug(%s - Ln %d): %s' % ( inspect.stack()[1][3], inspect.stack()[1][2], text ) )
+
+def makeExpandFriendlyPath( string ):
+	# replace round brackets characters and space with underscore
+	return re.sub(  '[\(\) ]', '_', string )
+
+def normalise( text ):
+	for regex, replacement in g_normalisations:
+		text = regex.sub( replacement, text )
+	return re.sub( r'\s+', ' ', text ).strip()
+
+def signatureId( kind, text ):
+	return hashlib.sha1( ( '%s\0%s' % ( kind, text ) ).encode( 'utf-8' ) ).hexdigest()[ :12 ]
+
+#
+#MARK: Extraction
+#
+
+def extractSignatures( text, fileName ):
+	"""return the set of ( kind, normalised text ) found in the log text of file fileName
+	"""
+	found = set()
+	if fileName.startswith( 'Watchdog__' ):
+		match = re.search( r'after (\w+) budget was exceeded', text )
+		reason = "%s budget exceeded" % match.group(1) if match else normalise( ( text.splitlines() or [ 'unknown' ] )[0] )
+		found.add( ( 'timeout', "watchdog killed the combo: %s" % reason ) )
+	inTestingFailed = False
+	for line in text.splitlines():
+		stripped = line.strip()
+		if inTestingFailed:
+			if line.startswith( '\t' ) and stripped != '':
+				found.add( ( 'testing', normalise( stripped ) ) )
+				continue
+			inTestingFailed = False
+		if stripped == 'Testing failed:':
+			inTestingFailed = True
+			continue
+		for kind, regex in g_lineRules:
+			match = regex.match( stripped )
+			if match:
+				signature = match.group( 'text' )
+				if 'file' in regex.groupindex:
+					signature = "%s: %s" % ( os.path.basename( match.group( 'file' ) ), signature )
+				found.add( ( kind, normalise( signature ) ) )
+				break
+	return found
+
+def comboOfFile( fileName, comboNames ):
+	"""
+	return ( dev, lang ) of a per-combo log file, ( None, None ) for other files. comboNames maps the
+	expand friendly "<dev>_<lang>" to the real names where the events of the run tell us
+	"""
+	match = g_comboFileRegex.match( fileName )
+	if match == None:
+		return None, None
+	combo = match.group( 'combo' )
+	if combo in comboNames:
+		return comboNames[ combo ]
+	match = g_localeRegex.match( combo )
+	if match == None:
+		return combo, None
+	return match.group( 'dev' ), match.group( 'lang' )
+
+def _comboNamesOfRun( runDir ):
+	names = {}
+	eventsPath = os.path.join( runDir, 'events.jsonl' )
+	if not os.path.isfile( eventsPath ):
+		return names
+	with open( eventsPath, 'r' ) as fh:
+		for line in fh:
+			try:
+				event = json.loads( line )
+			except ValueError:
+				continue
+			if event.get( 'event' ) == 'run_started':
+				for dev in event.get( 'devs', [] ):
+					for lang in event.get( 'langs', [] ):
+						names[ "%s_%s" % ( makeExpandFriendlyPath( dev ), makeExpandFriendlyPath( lang ) ) ] = ( dev, lang )
+				break
+	return names
+
+def _runOutcome( runDir ):
+	"""return 'green', 'red' or None when the run did not finish"""
+	summaryPath = os.path.join( runDir, 'test_summary.txt' )
+	if not os.path.isfile( summaryPath ):
+		return None
+	with open( summaryPath, 'r' ) as fh:
+		comboLines = [ line for line in fh if line.startswith( 'Combo ' ) ]
+	if any( re.search( r' (failed|timed out)\b', line.split( '. ' )[0] ) for line in comboLines ):
+		return 'red'
+	return 'green'
+
+#
+#MARK: Index
+#
+
+def loadIndex( path ):
+	empty = { 'files': {}, 'runs': {}, 'signatures': {} }
+	if not os.path.isfile( path ):
+		return empty
+	try:
+		with open( path, 'r' ) as fh:
+			index = json.load( fh )
+	except ( IOError, ValueError ) as exc:
+		_dbx( "Ignoring unreadable failure index '%s': %s" % ( path, exc ) )
+		return empty
+	if index.get( 'version' ) != g_indexVersion:
+		return empty
+	return index
+
+def saveIndex( path, index ):
+	index[ 'version' ] = g_indexVersion
+	tmpPath = path + '.tmp'
+	with open( tmpPath, 'w' ) as fh:
+		json.dump( index, fh, sort_keys= True )
+	os.rename( tmpPath, path )
+
+def _forgetFile( index, filePath ):
+	entry = index[ 'files' ].pop( filePath, None )
+	if entry == None:
+		return
+	for sigId in entry[ 'signatures' ]:
+		signature = index[ 'signatures' ].get( sigId )
+		if signature == None: continue
+		signature[ 'hits' ] = [ hit for hit in signature[ 'hits' ] if hit[ 'file' ] != filePath ]
+		if len( signature[ 'hits' ] ) == 0: del index[ 'signatures' ][ sigId ]
+
+def runDirectories( runDirsGlob ):
+	"""the directories below runDirsGlob holding log files, older runs used nested directories"""
+	runDirs = []
+	for topDir in glob.glob( runDirsGlob ):
+		for dirPath, dirNames, fileNames in os.walk( topDir ):
+			if any( not name.startswith( '.' ) for name in fileNames ): runDirs.append( dirPath )
+	return runDirs
+
+def updateIndex( index, runDirs, dropMissing= False ):
+	"""
+	parse new and changed log files of runDirs into index. dropMissing forgets runs whose directory is
+	gone. return the number of files parsed
+	"""
+	cntParsed = 0
+	for runDir in runDirs:
+		runId = os.path.abspath( runDir )
+		logPaths = [ path for pattern in g_logPatterns for path in glob.glob( os.path.join( runDir, pattern ) ) ]
+		mtimes = [ os.path.getmtime( path ) for path in logPaths ]
+		run = index[ 'runs' ].setdefault( runId, {} )
+		run[ 'startedAt' ] = min( mtimes ) if len( mtimes ) > 0 else os.path.getmtime( runDir )
+		run[ 'outcome' ] = _runOutcome( runDir )
+		comboNames = None
+		for logPath in logPaths:
+			stat = os.stat( logPath )
+			known = index[ 'files' ].get( logPath )
+			if known != None and known[ 'size' ] == stat.st_size and known[ 'mtime' ] == stat.st_mtime:
+				continue
+			if comboNames == None: comboNames = _comboNamesOfRun( runDir )
+			_forgetFile( index, logPath )
+			with open( logPath, 'r' ) as fh:
+				text = fh.read()
+			fileName = os.path.basename( logPath )
+			dev, lang = comboOfFile( fileName, comboNames )
+			sigIds = []
+			for kind, sigText in extractSignatures( text, fileName ):
+				sigId = signatureId( kind, sigText )
+				signature = index[ 'signatures' ].setdefault( sigId, { 'kind': kind, 'text': sigText, 'hits': [] } )
+				signature[ 'hits' ].append( { 'run': runId, 'dev': dev, 'lang': lang, 'file': logPath } )
+				sigIds.append( sigId )
+			index[ 'files' ][ logPath ] = { 'size': stat.st_size, 'mtime': stat.st_mtime, 'signatures': sorted( sigIds ) }
+			cntParsed += 1
+	if dropMissing:
+		for runId in list( index[ 'runs' ].keys() ):
+			if not os.path.isdir( runId ):
+				del index[ 'runs' ][ runId ]
+		for filePath in list( index[ 'files' ].keys() ):
+			if not os.path.isfile( filePath ): _forgetFile( index, filePath )
+	return cntParsed
+
+#
+#MARK: Queries
+#
+
+def newSinceLastGreen( index ):
+	"""
+	return ( last green run id or None, signature ids hit after the last green run and never before it )
+	"""
+	greenStarts = [ run[ 'startedAt' ] for run in index[ 'runs' ].values() if run.get( 'outcome' ) == 'green' ]
+	lastGreen = max( greenStarts ) if len( greenStarts ) > 0 else None
+	lastGreenId = None
+	for runId, run in index[ 'runs' ].items():
+		if run.get( 'outcome' ) == 'green' and run[ 'startedAt' ] == lastGreen: lastGreenId = runId
+	newIds = []
+	for sigId, signature in index[ 'signatures' ].items():
+		starts = [ index[ 'runs' ][ hit[ 'run' ] ][ 'startedAt' ] for hit in signature[ 'hits' ] if hit[ 'run' ] in index[ 'runs' ] ]
+		if len( starts ) > 0 and ( lastGreen == None or min( starts ) > lastGreen ):
+			newIds.append( sigId )
+	return lastGreenId, newIds
+
+def matchSignatures( index, pattern ):
+	"""signature ids equal to pattern or whose text contains it, case insensitive"""
+	if pattern in index[ 'signatures' ]:
+		return [ pattern ]
+	pattern = pattern.lower()
+	return [ sigId for sigId, signature in index[ 'signatures' ].items() if pattern in signature[ 'text' ].lower() ]
+
+def formatSignatureLine( index, sigId ):
+	signature = index[ 'signatures' ][ sigId ]
+	runs = set( hit[ 'run' ] for hit in signature[ 'hits' ] )
+	return "%s %-10s runs %3d hits %3d  %s" % ( sigId, signature[ 'kind' ], len( runs ), len( signature[ 'hits' ] ), signature[ 'text' ] )
+
+def formatHits( index, sigId ):
+	lines = [ formatSignatureLine( index, sigId ) ]
+	byRun = {}
+	for hit in index[ 'signatures' ][ sigId ][ 'hits' ]:
+		byRun.setdefault( hit[ 'run' ], set() ).add( ( hit[ 'dev' ] or '-', hit[ 'lang' ] or '-' ) )
+	for runId in sorted( byRun, key= lambda runId: index[ 'runs' ].get( runId, {} ).get( 'startedAt', 0 ) ):
+		run = index[ 'runs' ].get( runId, {} )
+		lines.append( "\t%s %s (%s): %s" % ( time.strftime( "%Y-%m-%d %H:%M", time.localtime( run.get( 'startedAt', 0 ) ) )
+			, os.path.basename( runId ), run.get( 'outcome' ) or 'unfinished'
+			, ", ".join( "%s - %s" % combo for combo in sorted( byRun[ runId ] ) ) ) )
+	return "\n".join( lines )
+
+#
+#MARK: Standalone
+#
+
+def parseCmdLine() :
+	parser = argparse.ArgumentParser( description= "Failure signatures across the UI test automation runs" )
+	parser.add_argument( '--index', default= g_indexPath, help='index file' )
+	parser.add_argument( '--runDirs', default= g_runDirsGlob, help='glob of the run directories' )
+	parser.add_argument( '--update', action= 'store_true', help='scan the run directories before the query' )
+	subParsers = parser.add_subparsers( dest= 'command' )
+	subParsers.add_parser( 'update', help='scan the run directories' )
+	listParser = subParsers.add_parser( 'list', help='list signatures, most frequent first' )
+	listParser.add_argument( '--new', action= 'store_true', help='only those new since the last green run' )
+	listParser.add_argument( '--kind', help='only signatures of this kind' )
+	showParser = subParsers.add_parser( 'show', help='runs, devices and locales which hit a signature' )
+	showParser.add_argument( 'pattern', help='signature id or part of the signature text' )
+	return parser.parse_args()
+
+def main():
+	argObject = parseCmdLine()
+	startTime = time.time()
+	index = loadIndex( argObject.index )
+	if argObject.command == 'update' or argObject.update:
+		cntParsed = updateIndex( index, runDirectories( argObject.runDirs ), dropMissing= True )
+		if cntParsed > 0 or argObject.command == 'update':
+			indexDir = os.path.dirname( argObject.index )
+			if not os.path.isdir( indexDir ): os.makedirs( indexDir )
+			saveIndex( argObject.index, index )
+		if argObject.command == 'update':
+			print( "Parsed %d log file(s), %d signature(s) in %d run(s)" % ( cntParsed, len( index[ 'signatures' ] ), len( index[ 'runs' ] ) ) )
+
+	if argObject.command == 'list':
+		sigIds = list( index[ 'signatures' ].keys() )
+		if argObject.new:
+			lastGreenId, sigIds = newSinceLastGreen( index )
+			print( "New since last green run %s:" % ( os.path.basename( lastGreenId ) if lastGreenId else "(none yet)" ) )
+		if argObject.kind != None:
+			sigIds = [ sigId for sigId in sigIds if index[ 'signatures' ][ sigId ][ 'kind' ] == argObject.kind ]
+		sigIds.sort( key= lambda sigId: -len( index[ 'signatures' ][ sigId ][ 'hits' ] ) )
+		for sigId in sigIds:
+			print( formatSignatureLine( index, sigId ) )
+	elif argObject.command == 'show':
+		sigIds = matchSignatures( index, argObject.pattern )
+		if len( sigIds ) == 0:
+			print( "No signature matches '%s'" % argObject.pattern )
+			sys.exit(1)
+		for sigId in sigIds:
+			print( formatHits( index, sigId ) )
+	print( "(%.0f ms)" % ( ( time.time() - startTime ) * 1000 ) )
+
+if __name__ == '__main__':
+	main()
@@ -3,6 +3,7 @@
 """
 Create a copy of file xyz under ther subdirectories iPad_Air_2_es_ES, iPhone_5_de_DE etc
 as  iPad_Air_2_es_ES__xyz, iPhone_5_de_DE___xyz etc
+When the root has an archive index (ArchiveIndex.py) only the indexed screenshots are copied
 """
 
 import argparse
@@ -14,6 +15,8 @@ import sys
 import tempfile
 import time
 
+import ArchiveIndex
+
 g_defaultRoot = '/Users/bmlam/Desktop/TestAuto_screenshots'
 
 def _dbx ( text ):
@@ -44,7 +47,16 @@ def main():
 	rootDir = argObject.rootPath
 	_dbx( rootDir )
 	cntFiles = 0
-	for root, dirs, files in os.walk( rootDir ):
+	indexEntries = ArchiveIndex.ArchiveIndex( rootDir ).entries()
+	for relPath in sorted( indexEntries ):
+		if not os.path.isfile( os.path.join( rootDir, relPath ) ):
+			_dbx( "Indexed file '%s' is gone" % relPath )
+			continue
+		cntFiles += 1
+		subDir, file = os.path.split( relPath )
+		shutil.copyfile( os.path.join( rootDir, relPath ), os.path.join( targetDir, subDir + '__' + file ) )
+	for root, dirs, files in ( os.walk( rootDir ) if len( indexEntries ) == 0 else [] ):
+		dirs[:] = [ dirName for dirName in dirs if not dirName.startswith( '.' ) ] # e.g. thumbnails of the gallery
 		subDir = os.path.basename( root )
 		_dbx( subDir )
 		for file in files:
@@ -0,0 +1,262 @@
+#!/usr/bin/python
+
+"""
+The matrix of devices and languages to run, read once from a config file and shared by the scripts.
+
+Two formats are understood. The legacy one, a text file with "lang:<lang>" and "dev:<dev>" lines
+crossed in full, e.g. listOfLangsAndDevices.txt. And a json file for matrices which are not a full cross:
+
+	{
+		"devs": [ "iPhone 7 Plus", "iPad Air 2", "iPhone 5" ],
+		"langs": [ "en_US", "de_DE", "zh-Hans" ],
+		"deviceLangs": { "iPhone 5": [ "en_US" ] },
+		"include": [ { "dev": "iPhone 5", "lang": "de_DE" } ],
+		"exclude": [ { "dev": "iPad*", "lang": "zh-Hans" } ],
+		"settings": [ { "dev": "iPad*", "priority": 10, "timeout": 900, "inactivityTimeout": 300 } ]
+	}
+
+A device runs the langs of its "deviceLangs" entry, all "langs" otherwise. "exclude" then drops combos,
+"include" adds them back or adds combos outside the cross. "settings" apply to all combos they match,
+later rules win. dev and lang of a rule are fnmatch patterns, a missing one matches everything but a rule
+needs at least one. Unknown keys and settings which are not numbers are an error.
+	priority			combos with a higher priority are started first, default 0
+	timeout				upper bound of the total budget of a combo in seconds, default the command line's
+	inactivityTimeout	same for the inactivity budget
+
+Standalone usage prints the combos a config expands to:
+	MatrixConfig.py <config file>
+"""
+
+import argparse
+import fnmatch
+import inspect
+import json
+import os
+import sys
+import time
+
+g_comboSettings		= [ 'priority', 'timeout', 'inactivityTimeout' ]
+g_jsonKeys			= set( [ 'devs', 'langs', 'deviceLangs', 'include', 'exclude', 'settings' ] )
+
+def _dbx ( text ):
+    print( '  Debug(%s - Ln %d): %s' % ( inspect.stack()[1][3], inspect.stack()[1][2], text ) )
+
+def _infoTs ( text, withTS = False ):
+	if withTS:
+		print( '\n%s (Ln %d) %s' % ( time.strftime("%H:%M:%S"), inspect.stack()[1][2], text ) )
+	else :
+		print( '\nINFO (Ln %d) %s' % ( inspect.stack()[1][2], text ) )
+
+def _errorExit ( text ):
+    print( 'ERROR raised from %s - Ln %d: %s' % ( inspect.stack()[1][3], inspect.stack()[1][2], text ) )
+    sys.exit(1)
+
+def _unique( values ):
+	result = []
+	for value in values:
+		if value not in result: result.append( value )
+	return result
+
+#
+#MARK: Matrix
+#
+
+class Matrix( object ):
+
+	def __init__( self, combos, source ):
+		"""
+		combos is the list of dictionaries with dev, lang, langs and the g_comboSettings, in the order to start them
+		"""
+		self.combos = combos
+		self.source = source
+
+	def devs( self ):
+		return _unique( combo[ 'dev' ] for combo in self.combos )
+
+	def langs( self ):
+		return _unique( lang for combo in self.combos for lang in combo[ 'langs' ] )
+
+	def select( self, onlyDevs= None, onlyLangs= None ):
+		"""
+		return the matrix reduced to the comma separated onlyDevs and onlyLangs, None meaning all. Names which
+		are not in the matrix are an error
+		"""
+		combos = self.combos
+		for selection, key, what in ( ( onlyDevs, 'dev', 'device' ), ( onlyLangs, 'lang', 'language' ) ):
+			if selection == None: continue
+			selected = [ value.strip() for value in selection.split( ',' ) ]
+			unknown = [ value for value in selected if value not in ( self.devs() if key == 'dev' else self.langs() ) ]
+			if len( unknown ) > 0:
+				_errorExit( "Selected %s(s) not in '%s': %s" % ( what, self.source, ', '.join( unknown ) ) )
+			combos = [ combo for combo in combos if combo[ key ] in selected ]
+		return Matrix( combos, self.source )
+
+	def perDevice( self ):
+		"""
+		return the matrix with one combo per device for --multiLocale: its 'langs' are those of the device's
+		combos, 'lang' is them joined by '+'. The highest priority counts, the timeouts add up
+		"""
+		combos = []
+		for dev in self.devs():
+			devCombos = [ combo for combo in self.combos if combo[ 'dev' ] == dev ]
+			langs = [ combo[ 'lang' ] for combo in devCombos ]
+			timeouts = [ combo[ 'timeout' ] for combo in devCombos ]
+			inactivityTimeouts = [ combo[ 'inactivityTimeout' ] for combo in devCombos if combo[ 'inactivityTimeout' ] != None ]
+			combos.append( { 'dev': dev, 'lang': '+'.join( langs ), 'langs': langs
+				, 'priority': max( combo[ 'priority' ] for combo in devCombos )
+				, 'timeout': None if None in timeouts else sum( timeouts )
+				, 'inactivityTimeout': max( inactivityTimeouts ) if len( inactivityTimeouts ) > 0 else None } )
+		combos.sort( key= lambda combo: -combo[ 'priority' ] )
+		return Matrix( combos, self.source )
+
+	def describe( self ):
+		"""one line per combo"""
+		lines = []
+		for combo in self.combos:
+			settings = ", ".join( "%s %s" % ( key, combo[ key ] ) for key in g_comboSettings if combo[ key ] not in ( None, 0 ) )
+			lines.append( "%s - %s%s" % ( combo[ 'dev' ], combo[ 'lang' ], " (%s)" % settings if settings else "" ) )
+		return lines
+
+def _checkRules( config, name, allowedKeys, source ):
+	"""
+	_errorExit unless config[ name ] is a list of rules with known keys, dev and/or lang, and numbers as settings.
+	A typo must not turn a rule into a wildcard
+	"""
+	rules = config.get( name, [] )
+	if not isinstance( rules, list ):
+		_errorExit( "'%s' in '%s' must be a list of rules" % ( name, source ) )
+	for rule in rules:
+		if not isinstance( rule, dict ):
+			_errorExit( "Each rule of '%s' in '%s' must be an object. Invalid: %s" % ( name, source, rule ) )
+		unknownKeys = set( rule.keys() ) - set( allowedKeys )
+		if len( unknownKeys ) > 0:
+			_errorExit( "Unknown key(s) %s in a rule of '%s' in '%s'. Valid: %s" % ( ', '.join( sorted( unknownKeys ) ), name, source, ', '.join( allowedKeys ) ) )
+		if 'dev' not in rule and 'lang' not in rule:
+			_errorExit( "Each rule of '%s' in '%s' needs 'dev' or 'lang'. Invalid: %s" % ( name, source, rule ) )
+		for key in g_comboSettings:
+			if key in rule and ( isinstance( rule[ key ], bool ) or not isinstance( rule[ key ], ( int, long, float ) ) ):
+				_errorExit( "'%s' in a rule of '%s' in '%s' must be a number. Invalid: %s" % ( key, name, source, rule ) )
+
+def _matches( rule, dev, lang ):
+	return fnmatch.fnmatchcase( dev, rule.get( 'dev', '*' ) ) and fnmatch.fnmatchcase( lang, rule.get( 'lang', '*' ) )
+
+def expandConfig( config, source ):
+	"""return the Matrix of a json config as documented above"""
+	unknownKeys = set( config.keys() ) - g_jsonKeys
+	if len( unknownKeys ) > 0:
+		_errorExit( "Unknown key(s) in '%s': %s" % ( source, ', '.join( sorted( unknownKeys ) ) ) )
+	devs = config.get( 'devs', [] )
+	langs = config.get( 'langs', [] )
+	for name, values in ( ( 'devs', devs ), ( 'langs', langs ) ):
+		if not isinstance( values, list ) or not all( isinstance( value, basestring ) for value in values ):
+			_errorExit( "'%s' in '%s' must be a list of names" % ( name, source ) )
+		dupes = sorted( set( value for value in values if values.count( value ) > 1 ) )
+		if len( dupes ) > 0:
+			_errorExit( "%s found more than once in '%s' of '%s'. Dupes are not permitted!" % ( ', '.join( dupes ), name, source ) )
+	deviceLangs = config.get( 'deviceLangs', {} )
+	if not isinstance( deviceLangs, dict ):
+		_errorExit( "'deviceLangs' in '%s' must map devices to lists of langs" % source )
+	for dev in deviceLangs:
+		if dev not in devs:
+			_errorExit( "Device '%s' of 'deviceLangs' in '%s' is not in 'devs'" % ( dev, source ) )
+		if not isinstance( deviceLangs[ dev ], list ):
+			_errorExit( "The langs of '%s' in 'deviceLangs' of '%s' must be a list" % ( dev, source ) )
+	_checkRules( config, 'exclude', [ 'dev', 'lang' ], source )
+	_checkRules( config, 'include', [ 'dev', 'lang' ], source )
+	_checkRules( config, 'settings', [ 'dev', 'lang' ] + g_comboSettings, source )
+
+	pairs = [ ( dev, lang ) for dev in devs for lang in deviceLangs.get( dev, langs ) ]
+	for rule in config.get( 'exclude', [] ):
+		pairs = [ ( dev, lang ) for dev, lang in pairs if not _matches( rule, dev, lang ) ]
+	for rule in config.get( 'include', [] ):
+		if 'dev' not in rule or 'lang' not in rule:
+			_errorExit( "Each include rule in '%s' needs 'dev' and 'lang'. Invalid: %s" % ( source, rule ) )
+		if ( rule[ 'dev' ], rule[ 'lang' ] ) not in pairs: pairs.append( ( rule[ 'dev' ], rule[ 'lang' ] ) )
+
+	combos = []
+	for dev, lang in pairs:
+		combo = { 'dev': dev, 'lang': lang, 'langs': [ lang ], 'priority': 0, 'timeout': None, 'inactivityTimeout': None }
+		for rule in config.get( 'settings', [] ):
+			if _matches( rule, dev, lang ):
+				combo.update( ( key, rule[ key ] ) for key in g_comboSettings if key in rule )
+		combos.append( combo )
+	combos.sort( key= lambda combo: -combo[ 'priority' ] ) # stable, so the file order within a priority
+	return Matrix( combos, source )
+
+def readLegacyFile( filePath ):
+	"""Decompose the lang: and dev: lines into list of languages and device types
+	"""
+	fieldSep = ':'
+	langLiteral = 'lang'
+	devLiteral  = 'dev'
+
+	try :
+		fh= open( filePath, 'r')
+	except IOError:
+		_errorExit( 'Could not read file %s' % filePath )
+
+	langs= []
+	devs= []
+
+	lineNo= 0
+	for lineIn in fh.readlines():
+		lineNo+= 1
+		line =lineIn.strip()
+		if not line.startswith("#"):
+			if len( line ) > 0:
+				fields = line .split ( fieldSep )
+				if len ( fields ) != 2:
+					_errorExit( "Each payload line in '%s' is must contain 2 fields separated by '%s'. Line %d is invalid" % ( filePath, fieldSep, lineNo) )
+
+				key, value = fields[0:2] # start from 0 and take 2
+				if key == devLiteral :
+					if value in devs :
+						_errorExit( "Device %s found again in line %d. Dupes are not permitted!" % (value, lineNo) )
+					devs.append( value )
+				elif key == langLiteral :
+					if value in langs :
+						_errorExit( "Lang %s found again in line %d. Dupes are not permitted!" % (value, lineNo) )
+					langs.append( value )
+				else:
+					_errorExit( "The keyword found in line %d of '%s' is invalid" % ( lineNo, filePath ) )
+	fh.close()
+	return devs, langs
+
+def loadMatrix( filePath ):
+	"""return the Matrix of a json config or of a legacy lang dev file"""
+	_infoTs( "Reading languages and devices to test from %s" % filePath )
+	try:
+		with open( filePath, 'r' ) as fh:
+			text = fh.read()
+	except IOError:
+		_errorExit( 'Could not read file %s' % filePath )
+	if not text.lstrip().startswith( '{' ):
+		devs, langs = readLegacyFile( filePath )
+		return expandConfig( { 'devs': devs, 'langs': langs }, filePath )
+	try:
+		config = json.loads( text )
+	except ValueError as exc:
+		_errorExit( "Could not parse matrix config '%s': %s" % ( filePath, exc ) )
+	return expandConfig( config, filePath )
+
+#
+#MARK: Standalone
+#
+
+def parseCmdLine() :
+	parser = argparse.ArgumentParser( description= "Print the device and language combos a matrix config expands to" )
+	parser.add_argument( 'configFile', help='json matrix config or legacy lang dev file' )
+	parser.add_argument( '--onlyDevs', help='comma separated devices to keep' )
+	parser.add_argument( '--onlyLangs', help='comma separated languages to keep' )
+	parser.add_argument( '--multiLocale', action= 'store_true', help='one session per device covering all its languages' )
+	return parser.parse_args()
+
+def main():
+	argObject = parseCmdLine()
+	matrix = loadMatrix( argObject.configFile ).select( argObject.onlyDevs, argObject.onlyLangs )
+	if argObject.multiLocale: matrix = matrix.perDevice()
+	print( "\n".join( matrix.describe() ) )
+	print( "%d combo(s) of %d device(s) and %d language(s)" % ( len( matrix.combos ), len( matrix.devs() ), len( matrix.langs() ) ) )
+
+if __name__ == '__main__':
+	main()
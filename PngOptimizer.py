@@ -0,0 +1,234 @@
+#!/usr/bin/python
+
+"""
+Lossless size reduction of the screenshots in an archive before it is uploaded.
+
+Per png file:
+	* metadata chunks are dropped (text, time, exif and Apple's iDOT which would be invalid after
+	  recompression anyway). Chunks which affect rendering like gAMA, sRGB, iCCP or pHYs are kept
+	* the IDAT stream is inflated and deflated again with a few zlib settings, the smallest result wins
+	* the file is only rewritten when it actually got smaller
+The pixel data is not touched, so decoders produce exactly the same image.
+
+Files are processed in a process pool. The content hashes of optimised files are kept in a cache file
+in the archive root, so a second pass over the archive skips them.
+
+Can be used standalone or from UITestAutomation.py with --optimizePngs.
+"""
+
+import argparse
+import hashlib
+import inspect
+import json
+import multiprocessing
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import zlib
+
+g_pngSignature		= b'\x89PNG\r\n\x1a\n'
+g_strippedChunks	= set( [ b'tEXt', b'zTXt', b'iTXt', b'tIME', b'eXIf', b'iDOT' ] )
+g_idatChunkSize		= 256 * 1024
+g_cacheFileName		= '.pngOptimized.json'
+#                   level, memLevel, strategy
+g_zlibSettings		= [ ( 9, 9, zlib.Z_DEFAULT_STRATEGY ), ( 9, 9, zlib.Z_FILTERED ), ( 9, 8, zlib.Z_DEFAULT_STRATEGY ) ]
+
+g_knownHashes = frozenset() # set in each pool worker by _initWorker
+
+def _dbx ( text ):
+    sys.stdout.write( '  Debug(%s - Ln %d): %s\n' % ( inspect.stack()[1][3], inspect.stack()[1][2], text ) )
+
+def _infoTs ( text, withTS = False ):
+	if withTS:
+		print( '\n%s (Ln %d) %s' % ( time.strftime("%H:%M:%S"), inspect.stack()[1][2], text ) )
+	else :
+		print( '\nINFO (Ln %d) %s' % ( inspect.stack()[1][2], text ) )
+
+def _errorExit ( text ):
+    sys.stderr.write( '\nERROR raised from %s - Ln %d: %s\n' % ( inspect.stack()[1][3], inspect.stack()[1][2], text ) )
+    sys.exit(1)
+
+#
+#MARK: png chunk handling
+#
+
+def readChunks( data ):
+	"""return list of ( type, payload ). Raises ValueError for anything which is not a well formed png
+	"""
+	if not data.startswith( g_pngSignature ):
+		raise ValueError( "not a png file" )
+	chunks = []
+	offset = len( g_pngSignature )
+	while offset < len( data ):
+		if offset + 8 > len( data ):
+			raise ValueError( "truncated chunk header at offset %d" % offset )
+		length, chunkType = struct.unpack( '>I4s', data[ offset : offset + 8 ] )
+		payload = data[ offset + 8 : offset + 8 + length ]
+		if len( payload ) != length:
+			raise ValueError( "truncated %s chunk at offset %d" % ( chunkType, offset ) )
+		chunks.append( ( chunkType, payload ) )
+		offset += 12 + length
+		if chunkType == b'IEND':
+			break
+	return chunks
+
+def writeChunk( chunkType, payload ):
+	crc = zlib.crc32( chunkType + payload ) & 0xffffffff
+	return struct.pack( '>I4s', len( payload ), chunkType ) + payload + struct.pack( '>I', crc )
+
+def smallestDeflate( raw ):
+	best = None
+	for level, memLevel, strategy in g_zlibSettings:
+		compressor = zlib.compressobj( level, zlib.DEFLATED, zlib.MAX_WBITS, memLevel, strategy )
+		candidate = compressor.compress( raw ) + compressor.flush()
+		if best == None or len( candidate ) < len( best ):
+			best = candidate
+	return best
+
+def optimizePngData( data ):
+	"""return the optimised png as bytes, which may be larger than the input. The caller decides
+	"""
+	chunks = readChunks( data )
+	idat = b''.join( payload for chunkType, payload in chunks if chunkType == b'IDAT' )
+	recompressed = smallestDeflate( zlib.decompress( idat ) )
+
+	parts = [ g_pngSignature ]
+	idatWritten = False
+	for chunkType, payload in chunks:
+		if chunkType in g_strippedChunks:
+			continue
+		if chunkType == b'IDAT':
+			if not idatWritten: # IDAT chunks are consecutive, so they all go where the first one was
+				for start in range( 0, len( recompressed ), g_idatChunkSize ):
+					parts.append( writeChunk( b'IDAT', recompressed[ start : start + g_idatChunkSize ] ) )
+				idatWritten = True
+			continue
+		parts.append( writeChunk( chunkType, payload ) )
+	return b''.join( parts )
+
+#
+#MARK: pool workers
+#
+
+def _initWorker( knownHashes ):
+	global g_knownHashes
+	g_knownHashes = knownHashes
+
+def optimizePngFile( path ):
+	"""
+	return dictionary with keys path, status ( 'cached', 'optimized', 'unchanged', 'error' ), bytesBefore,
+	bytesAfter, hash (content hash of the file as it is now on disk) and error
+	"""
+	result = { 'path': path, 'status': 'error', 'bytesBefore': 0, 'bytesAfter': 0, 'hash': None, 'error': None }
+	try:
+		with open( path, 'rb' ) as fh:
+			data = fh.read()
+		result[ 'bytesBefore' ] = result[ 'bytesAfter' ] = len( data )
+		contentHash = hashlib.sha1( data ).hexdigest()
+		result[ 'hash' ] = contentHash
+		if contentHash in g_knownHashes:
+			result[ 'status' ] = 'cached'
+			return result
+
+		optimized = optimizePngData( data )
+		if len( optimized ) >= len( data ):
+			result[ 'status' ] = 'unchanged'
+			return result
+
+		fd, tmpPath = tempfile.mkstemp( dir= os.path.dirname( path ), suffix= '.pngopt' )
+		with os.fdopen( fd, 'wb' ) as fh:
+			fh.write( optimized )
+		shutil.copymode( path, tmpPath )
+		os.rename( tmpPath, path )
+		result[ 'status' ] = 'optimized'
+		result[ 'bytesAfter' ] = len( optimized )
+		result[ 'hash' ] = hashlib.sha1( optimized ).hexdigest()
+	except ( IOError, OSError, ValueError, zlib.error ) as exc:
+		result[ 'error' ] = str( exc )
+	return result
+
+#
+#MARK: archive level processing
+#
+
+def loadCache( archiveRoot ):
+	path = os.path.join( archiveRoot, g_cacheFileName )
+	if not os.path.isfile( path ):
+		return set()
+	try:
+		with open( path, 'r' ) as fh:
+			return set( json.load( fh ) )
+	except ( IOError, ValueError ):
+		return set()
+
+def saveCache( archiveRoot, knownHashes ):
+	path = os.path.join( archiveRoot, g_cacheFileName )
+	with open( path + '.tmp', 'w' ) as fh:
+		json.dump( sorted( knownHashes ), fh )
+	os.rename( path + '.tmp', path )
+
+def listPngFiles( archiveRoot ):
+	pngFiles = []
+	for root, dirs, files in os.walk( archiveRoot ):
+		dirs[:] = [ name for name in dirs if not name.startswith( '.' ) ] # e.g. the thumbnails of RunGallery
+		pngFiles.extend( os.path.join( root, name ) for name in files if name.lower().endswith( '.png' ) )
+	return sorted( pngFiles )
+
+def optimizeArchive( archiveRoot, jobs= None ):
+	"""
+	Optimise all png files below archiveRoot in a pool of jobs processes ( default: number of cpus ).
+	return dictionary of counters, see formatReport()
+	"""
+	startTime = time.time()
+	knownHashes = loadCache( archiveRoot )
+	pngFiles = listPngFiles( archiveRoot )
+
+	stats = { 'files': len( pngFiles ), 'cached': 0, 'optimized': 0, 'unchanged': 0, 'error': 0
+		, 'bytesIn': 0, 'bytesBefore': 0, 'bytesAfter': 0, 'seconds': 0.0 }
+	if len( pngFiles ) > 0:
+		pool = multiprocessing.Pool( processes= jobs or multiprocessing.cpu_count(), initializer= _initWorker, initargs= ( frozenset( knownHashes ), ) )
+		try:
+			for result in pool.imap_unordered( optimizePngFile, pngFiles, chunksize= 4 ):
+				stats[ result[ 'status' ] ] += 1
+				if result[ 'status' ] == 'error':
+					_dbx( "Skipped '%s': %s" % ( result[ 'path' ], result[ 'error' ] ) )
+					continue
+				if result[ 'status' ] != 'cached':
+					stats[ 'bytesIn' ] += result[ 'bytesBefore' ]
+				stats[ 'bytesBefore' ] += result[ 'bytesBefore' ]
+				stats[ 'bytesAfter' ] += result[ 'bytesAfter' ]
+				knownHashes.add( result[ 'hash' ] )
+		finally:
+			pool.close()
+			pool.join()
+		saveCache( archiveRoot, knownHashes )
+
+	stats[ 'seconds' ] = time.time() - startTime
+	return stats
+
+def formatReport( stats ):
+	saved = stats[ 'bytesBefore' ] - stats[ 'bytesAfter' ]
+	percent = 100.0 * saved / stats[ 'bytesBefore' ] if stats[ 'bytesBefore' ] > 0 else 0.0
+	throughput = stats[ 'bytesIn' ] / ( 1024.0 * 1024.0 ) / stats[ 'seconds' ] if stats[ 'seconds' ] > 0 else 0.0
+	return ( "PNG optimisation: %d file(s), %d optimised, %d already optimal, %d skipped by hash, %d error(s). "
+		"Saved %d bytes (%.1f%%) in %.1f s, throughput %.1f MB/s" ) % ( stats[ 'files' ], stats[ 'optimized' ], stats[ 'unchanged' ]
+		, stats[ 'cached' ], stats[ 'error' ], saved, percent, stats[ 'seconds' ], throughput )
+
+def parseCmdLine() :
+	parser = argparse.ArgumentParser()
+	parser.add_argument( '-r', '--archiveRoot', help='root of the screenshots archive', required= True )
+	parser.add_argument( '-j', '--jobs', type= int, help='number of worker processes. Default: number of cpus' )
+	return parser.parse_args()
+
+def main():
+	argObject = parseCmdLine()
+	if not os.path.isdir( argObject.archiveRoot ):
+		_errorExit( "Archive root '%s' is not a directory" % argObject.archiveRoot )
+	stats = optimizeArchive( argObject.archiveRoot, argObject.jobs )
+	_infoTs( formatReport( stats ), True )
+
+if __name__ == '__main__':
+	main()
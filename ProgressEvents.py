@@ -0,0 +1,282 @@
+#!/usr/bin/python
+
+"""
+Structured progress of a matrix run, for people and tools watching an overnight run.
+
+The orchestrator publishes one json object per event to <run dir>/events.jsonl and, when asked to, to
+every client connected to a local Unix socket. Each event has 'ts' and 'event' plus fields of its own:
+	run_started		combos, devs, langs, runDir, jobs
+	build_started / build_finished	seconds, cached
+	combo_queued	dev, lang, attempt, expected ( seconds, from the duration history, may be null )
+	combo_started	dev, lang, attempt
+	phase			dev, lang, phase ( prepare, test, collect )
+	screenshot		dev, lang, file, bytes
+	combo_finished	dev, lang, attempt, outcome, seconds, final ( false when a retry follows ), resources ( when final,
+				see ResourceMonitor.combineUsage )
+	run_finished	seconds, outcomes
+In --watch mode every cycle is a run of its own, with a 'cycle' number in run_started and run_finished.
+A socket client first gets the events published so far, then the new ones as they happen. Each client
+is served by a thread of its own, so a stalled one never holds up the run; it is dropped once it falls
+g_clientBacklog events behind.
+
+"UITestAutomation.py status" renders a summary from the events file of the latest run, or of a socket:
+completed and total combos, throughput and an ETA from the durations observed so far.
+"""
+
+import argparse
+import glob
+import json
+import os
+import Queue
+import socket
+import sys
+import threading
+import time
+
+g_eventsFileName	= 'events.jsonl'
+g_clientBacklog		= 10000 # events a socket client may fall behind before it is dropped
+g_clientDrainSeconds	= 2 # at close, for the clients to take what is queued for them
+
+#
+#MARK: Publishing
+#
+
+class _SocketClient( object ):
+	"""sends the lines queued by the publisher from a thread of its own"""
+
+	def __init__( self, sock ):
+		self.sock = sock
+		self.queue = Queue.Queue( maxsize= g_clientBacklog )
+		self.closed = False
+		self.sender = threading.Thread( target= self._send )
+		self.sender.daemon = True
+		self.sender.start()
+
+	def put( self, text ):
+		"""queue text without blocking. return False when the client is too far behind"""
+		try:
+			self.queue.put_nowait( text )
+			return True
+		except Queue.Full:
+			return False
+
+	def drop( self ):
+		try:
+			self.sock.shutdown( socket.SHUT_RDWR ) # also wakes up a sendall blocked on a stalled client
+		except socket.error:
+			pass
+
+	def _send( self ):
+		try:
+			while True:
+				text = self.queue.get()
+				if text == None: break
+				self.sock.sendall( text.encode( 'utf-8' ) )
+		except socket.error: # client went away or was dropped
+			pass
+		self.closed = True
+		self.sock.close()
+
+class EventPublisher( object ):
+
+	def __init__( self, path, socketPath= None ):
+		self.path = path
+		self.socketPath = socketPath
+		self._lock = threading.Lock()
+		self._fh = open( path, 'a' )
+		self._lines = [] # replayed to socket clients when they connect
+		self._clients = []
+		self._server = None
+		if socketPath != None:
+			if os.path.exists( socketPath ): os.remove( socketPath ) # left by a run which did not end normally
+			self._server = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+			self._server.bind( socketPath )
+			self._server.listen( 5 )
+			acceptor = threading.Thread( target= self._accept )
+			acceptor.daemon = True
+			acceptor.start()
+
+	def _accept( self ):
+		while True:
+			try:
+				client, _ = self._server.accept()
+			except socket.error:
+				return # closed
+			with self._lock:
+				client = _SocketClient( client )
+				client.put( ''.join( self._lines ) ) # the events so far, ahead of those still to come
+				self._clients.append( client )
+
+	def emit( self, event, **fields ):
+		fields[ 'event' ] = event
+		fields[ 'ts' ] = round( time.time(), 3 )
+		line = json.dumps( fields, sort_keys= True ) + '\n'
+		with self._lock:
+			self._fh.write( line )
+			self._fh.flush()
+			self._lines.append( line )
+			for client in list( self._clients ):
+				if client.closed or not client.put( line ):
+					client.drop()
+					self._clients.remove( client )
+
+	def close( self ):
+		with self._lock:
+			self._fh.close()
+			for client in self._clients:
+				client.put( None )
+			deadline = time.time() + g_clientDrainSeconds
+			for client in self._clients:
+				client.sender.join( max( 0, deadline - time.time() ) )
+				if client.sender.is_alive():
+					client.drop()
+					client.sender.join()
+			self._clients = []
+			if self._server != None:
+				self._server.close()
+				os.remove( self.socketPath )
+				self._server = None
+
+#
+#MARK: Status
+#
+
+def summarize( events, now= None ):
+	"""
+	return a dictionary with total, completed, running, outcomes, elapsed, throughput ( combos per hour ),
+	eta ( seconds, None when we cannot tell yet ) and finished
+	"""
+	now = now or time.time()
+	total = 0
+	jobs = 1
+	startTs = None
+	running = {} # ( dev, lang ) -> start ts
+	completed = []
+	outcomes = {}
+	expected = {}
+	finished = False
+	busySeconds = 0.0
+	for event in events:
+		kind = event.get( 'event' )
+		if kind == 'run_started': # watch mode starts a new run for every cycle
+			total, jobs, startTs = event[ 'combos' ], max( 1, event.get( 'jobs', 1 ) ), event[ 'ts' ]
+			running, completed, outcomes, expected, finished, busySeconds = {}, [], {}, {}, False, 0.0
+		elif kind == 'combo_queued' and event.get( 'expected' ) != None:
+			expected[ ( event[ 'dev' ], event[ 'lang' ] ) ] = event[ 'expected' ]
+		elif kind == 'combo_started':
+			running[ ( event[ 'dev' ], event[ 'lang' ] ) ] = event[ 'ts' ]
+		elif kind == 'combo_finished':
+			running.pop( ( event[ 'dev' ], event[ 'lang' ] ), None )
+			busySeconds += event[ 'seconds' ]
+			if event.get( 'final', True ):
+				completed.append( event )
+				outcomes[ event[ 'outcome' ] ] = outcomes.get( event[ 'outcome' ], 0 ) + 1
+		elif kind == 'run_finished':
+			finished = True
+			finishedTs = event[ 'ts' ]
+
+	if finished: now = finishedTs
+	elapsed = now - startTs if startTs != None else 0.0
+	throughput = len( completed ) * 3600.0 / elapsed if elapsed > 0 and len( completed ) > 0 else None
+
+	# average seconds per combo, all attempts included, from this run or else from the history
+	perCombo = None
+	if len( completed ) > 0:
+		perCombo = busySeconds / len( completed )
+	elif len( expected ) > 0:
+		perCombo = sum( expected.values() ) / float( len( expected ) )
+
+	eta = None
+	if finished:
+		eta = 0.0
+	elif perCombo != None:
+		runningLeft = sum( max( 0.0, perCombo - ( now - startedTs ) ) for startedTs in running.values() )
+		queuedLeft = max( 0, total - len( completed ) - len( running ) ) * perCombo
+		# parallelism observed so far, at most the jobs configured
+		parallelism = min( jobs, max( 1.0, ( busySeconds + sum( now - ts for ts in running.values() ) ) / elapsed ) ) if elapsed > 0 else 1.0
+		eta = ( runningLeft + queuedLeft ) / parallelism
+	return { 'total': total, 'completed': len( completed ), 'running': sorted( running.keys() ), 'outcomes': outcomes
+		, 'elapsed': elapsed, 'throughput': throughput, 'eta': eta, 'finished': finished }
+
+def _hms( seconds ):
+	seconds = int( round( seconds ) )
+	return "%d:%02d:%02d" % ( seconds // 3600, seconds % 3600 // 60, seconds % 60 )
+
+def formatStatus( status ):
+	lines = []
+	lines.append( "Combos completed: %d of %d%s" % ( status[ 'completed' ], status[ 'total' ], " (run finished)" if status[ 'finished' ] else "" ) )
+	if len( status[ 'outcomes' ] ) > 0:
+		lines.append( "Outcomes: %s" % ", ".join( "%s %d" % ( outcome, cnt ) for outcome, cnt in sorted( status[ 'outcomes' ].items() ) ) )
+	if len( status[ 'running' ] ) > 0:
+		lines.append( "Running: %s" % ", ".join( "%s - %s" % combo for combo in status[ 'running' ] ) )
+	lines.append( "Elapsed: %s" % _hms( status[ 'elapsed' ] ) )
+	if status[ 'throughput' ] != None:
+		lines.append( "Throughput: %.1f combos per hour" % status[ 'throughput' ] )
+	if not status[ 'finished' ]:
+		lines.append( "ETA: %s" % ( "unknown yet" if status[ 'eta' ] == None
+			else "%s (at %s)" % ( _hms( status[ 'eta' ] ), time.strftime( "%H:%M:%S", time.localtime( time.time() + status[ 'eta' ] ) ) ) ) )
+	return "\n".join( lines )
+
+def readEvents( path ):
+	events = []
+	with open( path, 'r' ) as fh:
+		for line in fh:
+			try:
+				events.append( json.loads( line ) )
+			except ValueError:
+				pass # last line may still be written
+	return events
+
+def readSocketEvents( socketPath, seconds ):
+	"""collect the events a running orchestrator sends within seconds
+	"""
+	client = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+	client.connect( socketPath )
+	client.settimeout( 0.1 )
+	data = b''
+	deadline = time.time() + seconds
+	while time.time() < deadline:
+		try:
+			chunk = client.recv( 65536 )
+		except socket.timeout:
+			continue
+		if chunk == b'': break
+		data += chunk
+	client.close()
+	events = []
+	for line in data.decode( 'utf-8' ).splitlines():
+		try:
+			events.append( json.loads( line ) )
+		except ValueError:
+			pass
+	return events
+
+def latestEventsFile( runDirsGlob ):
+	candidates = glob.glob( os.path.join( runDirsGlob, g_eventsFileName ) )
+	if len( candidates ) == 0:
+		return None
+	return max( candidates, key= os.path.getmtime )
+
+def statusMain( argv, runDirsGlob ):
+	"""entry point of the status subcommand. runDirsGlob matches the run directories of the orchestrator
+	"""
+	parser = argparse.ArgumentParser( prog= 'UITestAutomation.py status', description= "Progress of the latest or a given matrix run" )
+	parser.add_argument( '--events', help='events file, default: the one of the latest run' )
+	parser.add_argument( '--socket', help='Unix socket of a running orchestrator, instead of an events file' )
+	parser.add_argument( '--follow', type= float, metavar= 'SECONDS', help='refresh every SECONDS until the run has finished' )
+	argObject = parser.parse_args( argv )
+
+	eventsPath = argObject.events
+	if argObject.socket == None and eventsPath == None:
+		eventsPath = latestEventsFile( runDirsGlob )
+		if eventsPath == None:
+			print( "No events file found in %s" % runDirsGlob )
+			sys.exit(1)
+	while True:
+		events = readSocketEvents( argObject.socket, 0.5 ) if argObject.socket != None else readEvents( eventsPath )
+		status = summarize( events )
+		print( "%s\n%s" % ( eventsPath or argObject.socket, formatStatus( status ) ) )
+		if argObject.follow == None or status[ 'finished' ]:
+			break
+		time.sleep( argObject.follow )
+		print( '' )
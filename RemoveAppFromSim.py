@@ -17,6 +17,11 @@ import sys
 import tempfile 
 import time 
 
+import DeviceBackend
+import MatrixConfig
+
+g_backend = DeviceBackend.SimctlBackend()
+
 #
 #MARK: Show script execution breadcrumbs
 #
@@ -94,32 +99,24 @@ def fileTextAndLog2Console( text, consoleMsgPrefix, outPath= None ):
 def closeSimulatorApp():
 	"""
 	"""
-	cmdArgs = [ 'osascript'
-		, '-e', 'tell app "Simulator" to quit'
-		]
-	_dbx( "Running: %s" % " ".join( cmdArgs ) )
+	_dbx( "Closing Simulator app" )
 
-	proc= subprocess.Popen( cmdArgs ,stdin=subprocess.PIPE ,stdout=subprocess.PIPE ,stderr=subprocess.PIPE)
-	stdOutput, errOutput= proc.communicate( )
+	ok, stdOutput, errOutput= g_backend.closeSimulatorApp()
 
 	outLines = stdOutput.split( "\n" )
 	if outLines > 0: _infoTs( "Last lines of stdout:\n%s\n" % ( '\n'.join( outLines[ -3: ] ) ) )
 
 	if len( errOutput ) > 0 :
 		errLines = errOutput.split( "\n" )
-		_infoTs( "Last lines of stdout:\n%s\n" % ( '\n'.join( outLines[ -3: ] ) ) )
+		_infoTs( "Last lines of stderr:\n%s\n" % ( '\n'.join( errLines[ -3: ] ) ) )
 		fileTextAndLog2Console( text= errOutput, consoleMsgPrefix= "Stderr saved to", outPath= None )
 
 def bootDevice( dev ):
 	"""
 	"""
-	cmdArgs = [ 'xcrun', 'simctl' 
-		, 'boot', dev
-		]
-	_dbx( "Running: %s" % " ".join( cmdArgs ) )
+	_dbx( "Booting %s" % dev )
 
-	proc= subprocess.Popen( cmdArgs ,stdin=subprocess.PIPE ,stdout=subprocess.PIPE ,stderr=subprocess.PIPE)
-	stdOutput, errOutput= proc.communicate( )
+	ok, stdOutput, errOutput= g_backend.boot( dev )
 
 	handleConsoleOutput ( text= stdOutput, isStderr= False, showLines= 2 )
 	if len( errOutput ) > 0 :
@@ -128,13 +125,7 @@ def bootDevice( dev ):
 def shutdownDevice( dev ):
 	"""
 	"""
-	cmdArgs = [ 'xcrun', 'simctl' 
-		, 'shutdown', dev
-		]
-	# _dbx( "Running: %s" % " ".join( cmdArgs ) )
-
-	proc= subprocess.Popen( cmdArgs ,stdin=subprocess.PIPE ,stdout=subprocess.PIPE ,stderr=subprocess.PIPE)
-	stdOutput, errOutput= proc.communicate( )
+	ok, stdOutput, errOutput= g_backend.shutdown( dev )
 
 	handleConsoleOutput ( text= stdOutput, isStderr= False, showLines= 2 )
 
@@ -145,11 +136,9 @@ def shutdownDevice( dev ):
 def removeAppFromDevice( dev, appId ):
 	"""
 	"""
-	cmdArgs = [ 'xcrun', 'simctl' , 'uninstall', dev, appId ]
-	_dbx( "Running: %s" % " ".join( cmdArgs ) )
+	_dbx( "Uninstalling %s from %s" % ( appId, dev ) )
 
-	proc= subprocess.Popen( cmdArgs ,stdin=subprocess.PIPE ,stdout=subprocess.PIPE ,stderr=subprocess.PIPE)
-	stdOutput, errOutput= proc.communicate( )
+	ok, stdOutput, errOutput= g_backend.uninstall( dev, appId )
 
 	handleConsoleOutput ( text= stdOutput, isStderr= False, showLines= 2 )
 
@@ -160,49 +149,6 @@ def removeAppFromDevice( dev, appId ):
 #
 #MARK: Other helpers
 #
-def getListOfLangsAndDevicesFromFile(filePath):
-	"""Decompose the file content into list of languages and device types 
-	"""
-	_infoTs( "Reading languages and devices to test from %s" % filePath )
-
-	fieldSep = ':'
-	langLiteral = 'lang'
-	devLiteral  = 'dev'
-
-	try :
-		fh= open( filePath, 'r')
-	except IOError:
-		_errorExit( 'Could not read file %s' % filePath )
-
-	langs= []
-	devs= []
-
-	lineNo= 0
-	for lineIn in fh.readlines():
-		lineNo+= 1
-		line =lineIn.strip()
-		if not line.startswith("#"):
-			if len( line ) > 0:
-				fields = line .split ( fieldSep )
-				# _dbx( len( fields ) )
-				if len ( fields ) != 2:
-
-					_errorExit( "Each payload line in '%s' is must contain 2 fields separated by '%s'. Line %d is invalid" % ( filePath, fieldSep, lineNo) )
-
-				key, value = fields[0:2] # start from 0 and take 2
-				if key == devLiteral :
-					if value in devs :
-						_errorExit( "Device %s found again in line %d. Dupes are not permitted!" % (value, lineNo) )
-					devs.append( value )
-				elif key == langLiteral :
-					if value in langs :
-						_errorExit( "Device %s found again in line %d. Dupes are not permitted!" % (value, lineNo) )
-					langs.append( value )
-				else:
-					_errorExit( "The keyword found in line %d of '%s' is invalid" % ( lineNo, filePath ) )
-
-	return devs, langs
-
 def main():
 
 	startTime= time.strftime("%H:%M:%S")
@@ -210,7 +156,7 @@ def main():
 
 	argObject = parseCmdLine()
 
-	devs, langs = getListOfLangsAndDevicesFromFile ( argObject.langDevFile )
+	devs = MatrixConfig.loadMatrix( argObject.langDevFile ).devs()
 	_infoTs( 'Will iterate over these dev(s) : \t%s'  % '__ ; __'.join( devs ) )
 
 	if True:
@@ -0,0 +1,235 @@
+#!/usr/bin/python
+
+"""
+What a combo costs: CPU seconds and peak RSS of xcodebuild, the test runner and the simulator, to size
+hosts and choose the concurrency.
+
+While xcodebuild runs under the watchdog a sampler thread looks at its process tree every intervalSeconds.
+The simulator processes are not below xcodebuild but below launchd_sim, which has the UDID of the device
+in its command line, so they are found through simulatorKey. Each process is counted under a role
+	runner		command line contains "Runner" or "xctest", wherever it is in the tree
+	simulator	below launchd_sim of the device
+	xcodebuild	xcodebuild and what it starts, e.g. the compilers of a test action
+CPU seconds are the cumulative CPU time of the processes at their last sample, minus what the processes
+found at the start had used already, so a simulator kept warm from an earlier combo is not billed again.
+What samples cannot see, the CPU time after the last sample and that of processes living shorter than
+the interval, is taken from the rusage of xcodebuild when the watchdog reaped it: it covers xcodebuild
+and all descendants it reaped. The difference to the sampled time of that tree goes to the xcodebuild
+role. Peak RSS is the largest sum over the processes of a role in one sample, at least the largest
+single process in the rusage.
+
+On Linux the collector reads /proc and reads the command line once per process; elsewhere it runs one
+ps per sample. The sampler reports the time it spent itself, so the overhead can be watched.
+
+The orchestrator adds the bytes it wrote to logs and the archive, see UITestAutomation.runComboAttempt.
+"""
+
+import inspect
+import os
+import subprocess
+import sys
+import threading
+import time
+
+g_roles				= [ 'xcodebuild', 'runner', 'simulator' ]
+g_runnerMarkers		= [ 'Runner', 'xctest' ]
+
+def _dbx ( text ):
+    sys.stdout.write( '  Debug(%s - Ln %d): %s\n' % ( inspect.stack()[1][3], inspect.stack()[1][2], text ) )
+
+#
+#MARK: Collectors
+#
+
+def parseCpuTime( text ):
+	"""return seconds of a ps time column: [[dd-]hh:]mm:ss with optional fraction"""
+	days = 0
+	if '-' in text:
+		days, text = text.split( '-', 1 )
+	seconds = 0.0
+	for part in text.split( ':' ):
+		seconds = seconds * 60 + float( part )
+	return int( days ) * 86400 + seconds
+
+class ProcCollector( object ):
+	"""reads /proc/<pid>/stat of all processes and /proc/<pid>/cmdline once per process"""
+
+	def __init__( self ):
+		self._ticks = float( os.sysconf( 'SC_CLK_TCK' ) )
+		self._pageKB = os.sysconf( 'SC_PAGE_SIZE' ) / 1024
+		self._commands = {} # ( pid, start time ) -> command line
+
+	def sample( self ):
+		"""return dictionary ( pid, start time ) -> ( ppid, cpu seconds, rss KB, command )"""
+		processes = {}
+		for name in os.listdir( '/proc' ):
+			if not name.isdigit(): continue
+			try:
+				with open( '/proc/%s/stat' % name, 'r' ) as fh:
+					stat = fh.read()
+			except IOError:
+				continue # gone meanwhile
+			fields = stat[ stat.rfind( ')' ) + 2: ].split() # the command in brackets may contain blanks
+			key = ( int( name ), fields[19] )
+			if key not in self._commands:
+				try:
+					with open( '/proc/%s/cmdline' % name, 'r' ) as fh:
+						self._commands[ key ] = fh.read().replace( '\0', ' ' ).strip()
+				except IOError:
+					continue
+			processes[ key ] = ( int( fields[1] ), ( int( fields[11] ) + int( fields[12] ) ) / self._ticks
+				, int( fields[21] ) * self._pageKB, self._commands[ key ] )
+		for key in [ key for key in self._commands if key not in processes ]:
+			del self._commands[ key ]
+		return processes
+
+class PsCollector( object ):
+	"""one ps per sample, for the Mac"""
+
+	def sample( self ):
+		try:
+			output = subprocess.check_output( [ 'ps', '-A', '-o', 'pid=,ppid=,rss=,lstart=,time=,command=' ], universal_newlines= True )
+		except ( OSError, subprocess.CalledProcessError ):
+			return {}
+		processes = {}
+		for line in output.splitlines():
+			fields = line.split( None, 9 ) # lstart is 5 words, e.g. Mon Oct 19 13:33:44 2026
+			if len( fields ) < 10: continue
+			try:
+				processes[ ( int( fields[0] ), ' '.join( fields[ 3:8 ] ) ) ] = ( int( fields[1] ), parseCpuTime( fields[8] ), int( fields[2] ), fields[9] )
+			except ValueError:
+				continue
+		return processes
+
+def createCollector():
+	return ProcCollector() if os.path.isfile( '/proc/self/stat' ) else PsCollector()
+
+#
+#MARK: Monitor
+#
+
+class ResourceMonitor( object ):
+
+	def __init__( self, intervalSeconds= 2.0, simulatorKey= None, collector= None ):
+		self.intervalSeconds = intervalSeconds
+		self.simulatorKey = simulatorKey
+		self.collector = collector or createCollector()
+		self._rootPid = None
+		self._thread = None
+		self._stopped = threading.Event()
+		self._baseCpu = {} # process key -> cpu seconds at its first sample
+		self._lastCpu = {} # process key -> cpu seconds at its latest sample
+		self._roleOf = {}
+		self._underRoot = set() # keys of the processes below rootPid, which its rusage covers
+		self._peakRssKB = dict( ( role, 0 ) for role in g_roles + [ 'total' ] )
+		self._samples = 0
+		self._samplerSeconds = 0.0
+
+	def start( self, rootPid ):
+		"""start sampling the tree of rootPid, e.g. the xcodebuild just spawned"""
+		self._rootPid = rootPid
+		self._sample()
+		self._thread = threading.Thread( target= self._run )
+		self._thread.daemon = True
+		self._thread.start()
+
+	def stop( self, rootUsage= None ):
+		"""
+		end sampling and return the usage, see combineUsage(). rootUsage is the resource.struct_rusage of
+		rootPid from os.wait4, if it was reaped that way
+		"""
+		if self._thread != None:
+			self._stopped.set()
+			self._thread.join()
+			self._sample() # whatever is still alive, e.g. the simulator
+		cpuByRole = dict( ( role, 0.0 ) for role in g_roles )
+		for key, cpu in self._lastCpu.items():
+			cpuByRole[ self._roleOf[ key ] ] += cpu - self._baseCpu[ key ]
+		if rootUsage != None:
+			sampledCpu = sum( self._lastCpu[ key ] - self._baseCpu[ key ] for key in self._underRoot )
+			cpuByRole[ 'xcodebuild' ] += max( 0.0, rootUsage.ru_utime + rootUsage.ru_stime - sampledCpu )
+			maxRssKB = rootUsage.ru_maxrss / 1024 if sys.platform == 'darwin' else rootUsage.ru_maxrss # bytes on the Mac
+			self._peakRssKB[ 'xcodebuild' ] = max( self._peakRssKB[ 'xcodebuild' ], maxRssKB )
+			self._peakRssKB[ 'total' ] = max( self._peakRssKB[ 'total' ], maxRssKB )
+		return { 'cpuSeconds': round( sum( cpuByRole.values() ), 2 )
+			, 'cpuByRole': dict( ( role, round( cpu, 2 ) ) for role, cpu in cpuByRole.items() )
+			, 'peakRssMB': round( self._peakRssKB[ 'total' ] / 1024.0, 1 )
+			, 'peakRssByRole': dict( ( role, round( self._peakRssKB[ role ] / 1024.0, 1 ) ) for role in g_roles )
+			, 'samples': self._samples, 'samplerSeconds': round( self._samplerSeconds, 3 ) }
+
+	def _run( self ):
+		while not self._stopped.wait( self.intervalSeconds ):
+			self._sample()
+
+	def _sample( self ):
+		startTime = time.time()
+		processes = self.collector.sample()
+		childrenOf = {}
+		for key, ( ppid, cpu, rssKB, command ) in processes.items():
+			childrenOf.setdefault( ppid, [] ).append( key )
+
+		todo = []
+		if self.simulatorKey: # xcodebuild has the UDID in its -destination as well
+			todo += [ ( key, 'simulator', False ) for key, process in processes.items() if 'launchd_sim' in process[3] and self.simulatorKey in process[3] ]
+		todo += [ ( key, 'xcodebuild', True ) for key in processes if key[0] == self._rootPid ]
+		rssKB = dict( ( role, 0 ) for role in g_roles )
+		seen = set()
+		while len( todo ) > 0:
+			key, role, underRoot = todo.pop()
+			if key in seen: continue
+			seen.add( key )
+			ppid, cpu, processRssKB, command = processes[ key ]
+			if any( marker in command for marker in g_runnerMarkers ): role = 'runner'
+			todo.extend( ( child, role, underRoot ) for child in childrenOf.get( key[0], [] ) )
+			# only processes found at the start had a life before this combo
+			self._baseCpu.setdefault( key, cpu if self._samples == 0 and not underRoot else 0.0 )
+			if underRoot: self._underRoot.add( key )
+			self._lastCpu[ key ] = cpu
+			self._roleOf[ key ] = role
+			rssKB[ role ] += processRssKB
+
+		for role, kb in rssKB.items():
+			self._peakRssKB[ role ] = max( self._peakRssKB[ role ], kb )
+		self._peakRssKB[ 'total' ] = max( self._peakRssKB[ 'total' ], sum( rssKB.values() ) )
+		self._samples += 1
+		self._samplerSeconds += time.time() - startTime
+
+#
+#MARK: Reporting
+#
+
+def combineUsage( usages ):
+	"""
+	return the usage of several attempts of a combo: CPU seconds and bytes add up, the peaks are the largest.
+	A usage is a dictionary with any of cpuSeconds, cpuByRole, peakRssMB, peakRssByRole, samples,
+	samplerSeconds ( from ResourceMonitor.stop ), logBytes and screenshotBytes
+	"""
+	def merge( key, old, value ):
+		if old == None: return value
+		if key.startswith( 'peak' ): return max( old, value )
+		return round( old + value, 3 ) if isinstance( value, float ) else old + value
+
+	total = {}
+	for usage in usages:
+		for key, value in ( usage or {} ).items():
+			if isinstance( value, dict ):
+				combined = total.setdefault( key, {} )
+				for role, roleValue in value.items():
+					combined[ role ] = merge( key, combined.get( role ), roleValue )
+			else:
+				total[ key ] = merge( key, total.get( key ), value )
+	return total
+
+def _size( nBytes ):
+	if nBytes < 1024 * 1024: return "%.0f KB" % ( nBytes / 1024.0 )
+	return "%.1f MB" % ( nBytes / ( 1024.0 * 1024.0 ) )
+
+def formatUsage( usage ):
+	"""one line for the test summary, empty when nothing was measured"""
+	parts = []
+	if 'cpuSeconds' in usage:
+		parts.append( "cpu %.1f s (%s)" % ( usage[ 'cpuSeconds' ], ", ".join( "%s %.1f" % ( role, usage[ 'cpuByRole' ].get( role, 0 ) ) for role in g_roles ) ) )
+		parts.append( "peak RSS %.0f MB" % usage[ 'peakRssMB' ] )
+	if 'logBytes' in usage or 'screenshotBytes' in usage:
+		parts.append( "written %s logs, %s screenshots" % ( _size( usage.get( 'logBytes', 0 ) ), _size( usage.get( 'screenshotBytes', 0 ) ) ) )
+	return ", ".join( parts )
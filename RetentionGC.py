@@ -0,0 +1,180 @@
+#!/usr/bin/python
+
+"""
+Keeps the disk usage of the UI test automation in bounds without making a run wait for it.
+
+Every run leaves a ~/UITestAutomatationRun_* directory with console logs and derived data accumulates per
+app below the build output root. Each of these locations is a pool of items ( top level directories ).
+An item goes when
+	* it is older than maxAgeDays, or
+	* all pools together use more than budgetMB, oldest items first
+but never when it is among the keepLast newest items of its pool or protected, e.g. in use by this run.
+
+Deleting a derived data tree takes long. So an item is only renamed into a .UITestAutomationReaping
+directory next to it, which is instant on the same file system, and a background thread removes it from
+there. Whatever the reaper did not get to before the process ended is picked up by the next run, which
+calls reapLeftovers() for the pools and for the screenshot archive, also when retention is off.
+"""
+
+import errno
+import glob
+import inspect
+import os
+import Queue
+import shutil
+import threading
+import time
+
+g_trashDirName	= '.UITestAutomationReaping'
+
+def _dbx ( text ):
+    print( '  Debug(%s - Ln %d): %s' % ( inspect.stack()[1][3], inspect.stack()[1][2], text ) )
+
+def _infoTs ( text, withTS = False ):
+	if withTS:
+		print( '\n%s (Ln %d) %s' % ( time.strftime("%H:%M:%S"), inspect.stack()[1][2], text ) )
+	else :
+		print( '\nINFO (Ln %d) %s' % ( inspect.stack()[1][2], text ) )
+
+def treeBytes( path ):
+	if not os.path.isdir( path ) or os.path.islink( path ):
+		return os.lstat( path ).st_size
+	total = 0
+	for dirPath, dirNames, fileNames in os.walk( path ):
+		for fileName in fileNames:
+			try:
+				total += os.lstat( os.path.join( dirPath, fileName ) ).st_size
+			except OSError:
+				pass # vanished while we looked
+	return total
+
+#
+#MARK: Reaper
+#
+
+class Reaper( threading.Thread ):
+	"""
+	removes discarded trees in the background. discard() returns as soon as the tree is out of the way
+	"""
+
+	def __init__( self ):
+		threading.Thread.__init__( self )
+		self.daemon = True
+		self.queue = Queue.Queue()
+		self.bytesReaped = 0
+		self.cntReaped = 0
+
+	def discard( self, path ):
+		"""move path into the trash directory of its parent and queue it for removal. return the new path
+		"""
+		path = os.path.abspath( path )
+		trashDir = os.path.join( os.path.dirname( path ), g_trashDirName )
+		try:
+			os.mkdir( trashDir )
+		except OSError as exc:
+			if exc.errno != errno.EEXIST: raise
+		trashPath = os.path.join( trashDir, "%s_%d_%d" % ( os.path.basename( path ), os.getpid(), int( time.time() * 1000000 ) ) )
+		os.rename( path, trashPath )
+		self.queue.put( trashPath )
+		return trashPath
+
+	def reapLeftovers( self, parentDirs ):
+		"""queue what earlier runs left in the trash directories below parentDirs
+		"""
+		for parentDir in parentDirs:
+			for trashPath in glob.glob( os.path.join( parentDir, g_trashDirName, '*' ) ):
+				self.queue.put( trashPath )
+
+	def run( self ):
+		while True:
+			trashPath = self.queue.get()
+			try:
+				size = treeBytes( trashPath )
+				if os.path.isdir( trashPath ) and not os.path.islink( trashPath ):
+					shutil.rmtree( trashPath )
+				else:
+					os.remove( trashPath )
+				self.bytesReaped += size
+				self.cntReaped += 1
+			except OSError as exc:
+				_dbx( "Could not remove '%s': %s" % ( trashPath, exc ) )
+			finally:
+				self.queue.task_done()
+
+#
+#MARK: Retention policy
+#
+
+def listPoolItems( pool ):
+	"""
+	return the items of pool, a dictionary with 'dir' and a glob 'pattern', as dictionaries with path,
+	mtime and bytes, newest first
+	"""
+	items = []
+	for path in glob.glob( os.path.join( pool[ 'dir' ], pool.get( 'pattern', '*' ) ) ):
+		if os.path.basename( path ).startswith( '.' ): continue
+		try:
+			items.append( { 'pool': pool[ 'name' ], 'path': path, 'mtime': os.lstat( path ).st_mtime, 'bytes': treeBytes( path ) } )
+		except OSError:
+			pass
+	items.sort( key= lambda item: item[ 'mtime' ], reverse= True )
+	return items
+
+def planPrune( pools, maxAgeDays, keepLast, budgetMB, now= None ):
+	"""
+	return the list of ( item, reason ) to discard. pools is a list of dictionaries with name, dir, pattern
+	and protected, a list of paths never to touch. None for maxAgeDays or budgetMB disables that rule
+	"""
+	now = now or time.time()
+	total = 0
+	candidates = []
+	for pool in pools:
+		protected = set( os.path.abspath( path ) for path in pool.get( 'protected', [] ) )
+		items = listPoolItems( pool )
+		total += sum( item[ 'bytes' ] for item in items )
+		for ix, item in enumerate( items ):
+			if ix < keepLast or os.path.abspath( item[ 'path' ] ) in protected: continue
+			candidates.append( item )
+
+	plan = []
+	remaining = []
+	for item in sorted( candidates, key= lambda item: item[ 'mtime' ] ):
+		ageDays = ( now - item[ 'mtime' ] ) / 86400.0
+		if maxAgeDays != None and ageDays > maxAgeDays:
+			plan.append( ( item, "%.0f days old" % ageDays ) )
+			total -= item[ 'bytes' ]
+		else:
+			remaining.append( item )
+	if budgetMB != None:
+		for item in remaining:
+			if total <= budgetMB * 1024 * 1024: break
+			plan.append( ( item, "%.0f MB over budget" % ( ( total - budgetMB * 1024 * 1024 ) / ( 1024.0 * 1024.0 ) ) ) )
+			total -= item[ 'bytes' ]
+	return plan
+
+def collectGarbage( pools, reaper, maxAgeDays, keepLast, budgetMB ):
+	"""plan and discard through reaper. return the plan
+	"""
+	reaper.reapLeftovers( [ pool[ 'dir' ] for pool in pools ] )
+	plan = planPrune( pools, maxAgeDays, keepLast, budgetMB )
+	for item, reason in plan:
+		try:
+			reaper.discard( item[ 'path' ] )
+		except OSError as exc:
+			_dbx( "Could not discard '%s': %s" % ( item[ 'path' ], exc ) )
+			continue
+		_dbx( "Discarded %s item '%s' (%.1f MB): %s" % ( item[ 'pool' ], item[ 'path' ], item[ 'bytes' ] / ( 1024.0 * 1024.0 ), reason ) )
+	return plan
+
+def startCollector( pools, reaper, maxAgeDays, keepLast, budgetMB ):
+	"""
+	run collectGarbage in a daemon thread since sizing the pools means walking big trees. return the thread
+	"""
+	def collect():
+		plan = collectGarbage( pools, reaper, maxAgeDays, keepLast, budgetMB )
+		if len( plan ) > 0:
+			_infoTs( "Retention: discarded %d item(s), %.0f MB" % ( len( plan ), sum( item[ 'bytes' ] for item, _ in plan ) / ( 1024.0 * 1024.0 ) ) )
+	collector = threading.Thread( target= collect )
+	collector.daemon = True
+	collector.start()
+	return collector
@@ -0,0 +1,174 @@
+#!/usr/bin/python
+
+"""
+Targeted retries of failed combos instead of rerunning the whole matrix.
+
+After a failed attempt we look at the test cases xcodebuild reported as failed and decide:
+	* all failed test cases are known to be flaky: retry them right away, using -only-testing
+	* some failed test cases are not known (yet): retry them with -only-testing at the end of the matrix,
+	  as long as there are retry slots left
+	* failed test cases which failed consistently in the previous runs are not retried at all
+	* no failed test case could be identified (build error, timeout): the whole combo is retried at the end,
+	  again only if there are retry slots left
+Attempts per combo are bounded by maxAttempts.
+
+The outcome of each test case in a combo is classified as pass, flaky (failed, then passed on a retry)
+or fail. These classifications are kept in a flake history json file which drives the decisions above.
+The history is kept per combo, i.e. by app, device and language plus test identifier, so a test failing
+on one device does not stop its retries on the others.
+The final outcome of a combo is taken from the classifications over all its attempts, not from the last
+one, which may have rerun only some of the test cases, see comboOutcome().
+"""
+
+import inspect
+import json
+import os
+import re
+import sys
+import time
+
+g_recentOutcomes	= 10 # classifications kept per test case
+g_consistentRuns	= 2  # that many fails in a row without any flaky outcome make a test "consistently failing"
+
+#                                 module (optional)  class    method        status
+g_testCasePattern = re.compile( r"^Test Case '-\[(?:(\w+)\.)?(\w+) (\w+)\]' (passed|failed)", re.MULTILINE )
+
+def _dbx ( text ):
+    sys.stdout.write( '  Debug(%s - Ln %d): %s\n' % ( inspect.stack()[1][3], inspect.stack()[1][2], text ) )
+
+def parseTestCaseResults( xcbStdout, defaultTarget ):
+	"""
+	Collect the outcome of each test case from lines like
+Test Case '-[ManyTimesUITests.ManyTimesUITests test003_AddNewTimer]' passed (12.504 seconds).
+
+	return dictionary of test identifier -> 'passed' or 'failed'. The identifier is in the format
+	expected by -only-testing, i.e. <test target>/<class>/<method>. The swift module name is used as test
+	target, for Objective-C test cases which have no module we fall back to defaultTarget
+	"""
+	results = {}
+	for match in g_testCasePattern.finditer( xcbStdout ):
+		module, className, method, status = match.groups()
+		testId = '%s/%s/%s' % ( module or defaultTarget, className, method )
+		results[ testId ] = status
+	return results
+
+#
+#MARK: Flake history
+#
+
+def loadFlakeHistory( path ):
+	if not os.path.isfile( path ):
+		return {}
+	try:
+		with open( path, 'r' ) as fh:
+			history = json.load( fh )
+	except ( IOError, ValueError ) as exc:
+		_dbx( "Ignoring unreadable flake history '%s': %s" % ( path, exc ) )
+		return {}
+	if not isinstance( history, dict ):
+		return {}
+	return dict( ( key, entry ) for key, entry in history.items() if '|' in key ) # not those from before the history was kept per combo
+
+def saveFlakeHistory( path, history ):
+	tmpPath = path + '.tmp'
+	with open( tmpPath, 'w' ) as fh:
+		json.dump( history, fh, indent= 1, sort_keys= True )
+	os.rename( tmpPath, path )
+
+def historyKey( comboKey, testId ):
+	"""comboKey is <app>|<dev>|<lang> like the keys of the duration history"""
+	return '%s|%s' % ( comboKey, testId )
+
+def recordClassification( history, comboKey, testId, classification ):
+	"""classification is one of 'pass', 'flaky', 'fail'
+	"""
+	entry = history.setdefault( historyKey( comboKey, testId ), { 'pass': 0, 'flaky': 0, 'fail': 0, 'recent': [] } )
+	entry[ classification ] += 1
+	entry[ 'recent' ].append( classification )
+	del entry[ 'recent' ][ : -g_recentOutcomes ]
+	entry[ 'at' ] = int( time.time() )
+
+def isKnownFlaky( history, comboKey, testId ):
+	return 'flaky' in history.get( historyKey( comboKey, testId ), {} ).get( 'recent', [] )
+
+def isConsistentlyFailing( history, comboKey, testId ):
+	recent = history.get( historyKey( comboKey, testId ), {} ).get( 'recent', [] )
+	if 'flaky' in recent or len( recent ) < g_consistentRuns:
+		return False
+	return recent[ -g_consistentRuns: ] == [ 'fail' ] * g_consistentRuns
+
+def classifyAttempts( attemptResults ):
+	"""
+	attemptResults: list of dictionaries testId -> 'passed'/'failed', one per attempt in chronological order
+	return dictionary testId -> 'pass', 'flaky' or 'fail'
+	"""
+	classifications = {}
+	for testId in set( tid for results in attemptResults for tid in results ):
+		statuses = [ results[ testId ] for results in attemptResults if testId in results ]
+		if 'failed' not in statuses:
+			classifications[ testId ] = 'pass'
+		elif statuses[ -1 ] == 'passed':
+			classifications[ testId ] = 'flaky'
+		else:
+			classifications[ testId ] = 'fail'
+	return classifications
+
+def comboOutcome( attemptResults, ranAll, timedOut ):
+	"""
+	return the final outcome of a combo over all its attempts: 'timed out' when the last attempt timed out,
+	'failed' when a test case is classified 'fail' or when not all test cases ran, i.e. no attempt ran the
+	whole combo to its end ( ranAll ), a partial rerun cannot reach those. Else 'flaky' after a retry and
+	'succeeded' otherwise
+	"""
+	if timedOut:
+		return 'timed out'
+	if not ranAll or 'fail' in classifyAttempts( attemptResults ).values():
+		return 'failed'
+	return 'flaky' if len( attemptResults ) > 1 else 'succeeded'
+
+#
+#MARK: Retry decisions
+#
+
+class RetryPolicy( object ):
+	"""
+	Decides if and when a failed attempt of a combo is retried. Retries of known flaky test cases do not
+	consume retry slots, all other retries do.
+	"""
+
+	def __init__( self, maxAttempts, retrySlots, flakeHistory ):
+		self.maxAttempts = maxAttempts
+		self.retrySlots = retrySlots
+		self.flakeHistory = flakeHistory
+
+	def planRetry( self, comboKey, attemptNo, testResults ):
+		"""
+		comboKey: <app>|<dev>|<lang> of the combo, see historyKey()
+		attemptNo: 1-based number of the attempt which just failed
+		testResults: as returned by parseTestCaseResults for that attempt
+
+		return ( when, onlyTesting ) with when one of 'now', 'deferred' or None (no retry) and onlyTesting
+		the list of test identifiers to rerun, None meaning the whole combo
+		"""
+		if attemptNo >= self.maxAttempts:
+			return None, None
+
+		failedTests = sorted( testId for testId, status in testResults.items() if status == 'failed' )
+		if len( failedTests ) == 0:
+			# nothing to pin the failure on, so rerun everything
+			return self._deferred( None )
+
+		candidates = [ testId for testId in failedTests if not isConsistentlyFailing( self.flakeHistory, comboKey, testId ) ]
+		if len( candidates ) == 0:
+			_dbx( "Not retrying consistently failing test(s): %s" % ', '.join( failedTests ) )
+			return None, None
+		if all( isKnownFlaky( self.flakeHistory, comboKey, testId ) for testId in candidates ):
+			return 'now', candidates
+		return self._deferred( candidates )
+
+	def _deferred( self, onlyTesting ):
+		if self.retrySlots <= 0:
+			_dbx( "No retry slots left" )
+			return None, None
+		self.retrySlots -= 1
+		return 'deferred', onlyTesting
@@ -0,0 +1,260 @@
+#!/usr/bin/python
+
+"""
+Static html contact sheet of the screenshots archive, to review a run without opening every png.
+
+The gallery is a grid with a column per device and locale ( <archiveRoot>/<device>_<locale> ) and a row
+per screenshot name. Each cell shows a thumbnail which links to the full size image.
+
+Thumbnails are made in a process pool and kept in <archiveRoot>/.galleryThumbs/<content hash>.png,
+so regenerating the gallery after a partial rerun only thumbnails the images that changed. Like in
+BuildCache, content hashes are remembered by size and mtime, so unchanged files are not even read.
+When the archive has an index (ArchiveIndex.py), columns, images and content hashes come from it, so
+devices keep their real names and nothing is hashed twice. A thumbnail is made with sips on the Mac, with PIL where it is installed and otherwise the gallery
+shows the original image scaled down by the browser.
+
+Can be used standalone or from UITestAutomation.py with --gallery.
+"""
+
+import argparse
+import hashlib
+import inspect
+import json
+import multiprocessing
+import os
+import re
+import subprocess
+import sys
+import time
+from xml.sax.saxutils import escape
+
+try:
+	from PIL import Image
+except ImportError:
+	Image = None
+
+import ArchiveIndex
+
+g_thumbDirName		= '.galleryThumbs'
+g_hashesFileName	= 'hashes.json'
+g_galleryFileName	= 'gallery.html'
+g_thumbPixels		= 240
+g_comboDirRegex		= re.compile( r'^(?P<dev>.+?)_(?P<lang>[a-z]{2,3}(?:[_-][A-Za-z]{2,4})?)$' )
+
+def _dbx ( text ):
+    sys.stdout.write( '  Debug(%s - Ln %d): %s\n' % ( inspect.stack()[1][3], inspect.stack()[1][2], text ) )
+
+def _infoTs ( text, withTS = False ):
+	if withTS:
+		print( '\n%s (Ln %d) %s' % ( time.strftime("%H:%M:%S"), inspect.stack()[1][2], text ) )
+	else :
+		print( '\nINFO (Ln %d) %s' % ( inspect.stack()[1][2], text ) )
+
+def _errorExit ( text ):
+    sys.stderr.write( '\nERROR raised from %s - Ln %d: %s\n' % ( inspect.stack()[1][3], inspect.stack()[1][2], text ) )
+    sys.exit(1)
+
+def makeExpandFriendlyPath( string ):
+	# replace round brackets characters and space with underscore
+	return re.sub(  '[\(\) ]', '_', string )
+
+def _loadJson( path ):
+	if not os.path.isfile( path ):
+		return {}
+	try:
+		with open( path, 'r' ) as fh:
+			return json.load( fh )
+	except ( IOError, ValueError ):
+		return {}
+
+#
+#MARK: pool workers
+#
+
+def _hasSips():
+	return sys.platform == 'darwin' and any( os.access( os.path.join( binDir, 'sips' ), os.X_OK )
+		for binDir in os.environ.get( 'PATH', '' ).split( os.pathsep ) )
+
+def makeThumbnail( job ):
+	"""
+	job is ( source path, known hash or None, thumbnail directory, pixels ). return dictionary with path, hash,
+	status ( 'cached', 'sips', 'pil', 'original', 'error' ) and error
+	"""
+	path, contentHash, thumbDir, pixels = job
+	result = { 'path': path, 'hash': contentHash, 'status': 'error', 'error': None }
+	if Image == None and not _hasSips():
+		result[ 'status' ] = 'original'
+		return result
+	try:
+		if contentHash == None:
+			digest = hashlib.sha1()
+			with open( path, 'rb' ) as fh:
+				for block in iter( lambda: fh.read( 1 << 20 ), b'' ):
+					digest.update( block )
+			contentHash = result[ 'hash' ] = digest.hexdigest()
+		thumbPath = os.path.join( thumbDir, contentHash + '.png' )
+		if os.path.isfile( thumbPath ):
+			result[ 'status' ] = 'cached'
+			return result
+		tmpPath = thumbPath + '.%d.tmp.png' % os.getpid()
+		sipsStatus = None
+		if _hasSips():
+			with open( os.devnull, 'w' ) as devNull:
+				sipsStatus = subprocess.call( [ 'sips', '-Z', str( pixels ), path, '--out', tmpPath ], stdout= devNull, stderr= subprocess.STDOUT )
+		if sipsStatus == 0 and os.path.isfile( tmpPath ):
+			result[ 'status' ] = 'sips'
+		elif Image != None:
+			image = Image.open( path )
+			image.thumbnail( ( pixels, pixels ) )
+			image.save( tmpPath, 'PNG' )
+			result[ 'status' ] = 'pil'
+		else:
+			result[ 'status' ] = 'original'
+			return result
+		os.rename( tmpPath, thumbPath )
+	except ( IOError, OSError, ValueError ) as exc:
+		result[ 'status' ] = 'error'
+		result[ 'error' ] = str( exc )
+	return result
+
+#
+#MARK: gallery
+#
+
+def listColumns( archiveRoot, devs= None, langs= None, indexEntries= None ):
+	"""
+	return the list of ( device, locale, directory name ) of the combo folders in archiveRoot. With devs
+	and langs, e.g. from the matrix, in their order. The folders are taken from the archive index entries
+	when there are some, otherwise the folder names are split at the locale
+	"""
+	if indexEntries:
+		columns = sorted( set( ( entry[ 'dev' ], entry[ 'lang' ], os.path.dirname( relPath ) ) for relPath, entry in indexEntries.items() ) )
+		if devs != None and langs != None:
+			position = lambda values, value: values.index( value ) if value in values else len( values )
+			columns.sort( key= lambda column: ( position( devs, column[0] ), position( langs, column[1] ) ) )
+		return columns
+	dirNames = sorted( name for name in os.listdir( archiveRoot )
+		if not name.startswith( '.' ) and os.path.isdir( os.path.join( archiveRoot, name ) ) )
+	if devs != None and langs != None:
+		columns = [ ( dev, lang, "%s_%s" % ( makeExpandFriendlyPath( dev ), makeExpandFriendlyPath( lang ) ) ) for dev in devs for lang in langs ]
+		return [ column for column in columns if column[2] in dirNames ]
+	columns = []
+	for dirName in dirNames:
+		match = g_comboDirRegex.match( dirName )
+		if match != None: columns.append( ( match.group( 'dev' ).replace( '_', ' ' ), match.group( 'lang' ), dirName ) )
+	return columns
+
+def renderHtml( columns, rows, cells, title ):
+	"""cells maps ( directory name, screenshot name ) -> ( image href, thumbnail src )
+	"""
+	devs = []
+	for dev, lang, dirName in columns:
+		if len( devs ) == 0 or devs[-1][0] != dev: devs.append( [ dev, 0 ] )
+		devs[-1][1] += 1
+	out = [ '<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>%s</title>' % escape( title )
+		, '<style>body{font-family:sans-serif} table{border-collapse:collapse} td,th{border:1px solid #ccc;padding:4px;text-align:center;vertical-align:top}'
+		  ' th.name{text-align:left;font-weight:normal} img{max-width:%dpx;max-height:%dpx}</style></head><body>' % ( g_thumbPixels, g_thumbPixels )
+		, '<h1>%s</h1><table>' % escape( title )
+		, '<tr><th rowspan="2">Screenshot</th>%s</tr>' % ''.join( '<th colspan="%d">%s</th>' % ( span, escape( dev ) ) for dev, span in devs )
+		, '<tr>%s</tr>' % ''.join( '<th>%s</th>' % escape( lang ) for dev, lang, dirName in columns ) ]
+	for name in rows:
+		line = [ '<tr><th class="name">%s</th>' % escape( name ) ]
+		for dev, lang, dirName in columns:
+			cell = cells.get( ( dirName, name ) )
+			if cell == None:
+				line.append( '<td>&ndash;</td>' )
+			else:
+				line.append( '<td><a href="%s"><img loading="lazy" src="%s" alt="%s"></a></td>'
+					% ( escape( cell[0], { '"': '&quot;' } ), escape( cell[1], { '"': '&quot;' } ), escape( "%s %s %s" % ( dev, lang, name ), { '"': '&quot;' } ) ) )
+		out.append( ''.join( line ) + '</tr>' )
+	out.append( '</table></body></html>\n' )
+	return '\n'.join( out )
+
+def buildGallery( archiveRoot, devs= None, langs= None, jobs= None, pixels= g_thumbPixels, title= None ):
+	"""
+	write <archiveRoot>/gallery.html, thumbnailing what is not in the cache yet. return dictionary of counters,
+	see formatReport()
+	"""
+	startTime = time.time()
+	thumbDir = os.path.join( archiveRoot, g_thumbDirName )
+	if not os.path.isdir( thumbDir ): os.makedirs( thumbDir )
+	hashesPath = os.path.join( thumbDir, g_hashesFileName )
+	knownHashes = _loadJson( hashesPath ) # relative path -> [ size, mtime, hash ]
+
+	indexEntries = dict( ( relPath, entry ) for relPath, entry in ArchiveIndex.ArchiveIndex( archiveRoot ).entries().items()
+		if os.path.isfile( os.path.join( archiveRoot, relPath ) ) ) # not those deleted by hand since
+	columns = listColumns( archiveRoot, devs, langs, indexEntries )
+	indexedNames = {} # directory name -> file names
+	for relPath in indexEntries:
+		indexedNames.setdefault( os.path.dirname( relPath ), [] ).append( os.path.basename( relPath ) )
+	jobList = []
+	for dev, lang, dirName in columns:
+		names = indexedNames[ dirName ] if indexEntries else os.listdir( os.path.join( archiveRoot, dirName ) )
+		for name in sorted( names ):
+			if not name.lower().endswith( '.png' ): continue
+			relPath = os.path.join( dirName, name )
+			st = os.stat( os.path.join( archiveRoot, relPath ) )
+			known = knownHashes.get( relPath )
+			if relPath in indexEntries:
+				indexed = indexEntries[ relPath ]
+				known = [ indexed[ 'bytes' ], indexed[ 'mtime' ], indexed[ 'hash' ] ]
+			contentHash = known[2] if known != None and known[0] == st.st_size and known[1] == st.st_mtime else None
+			jobList.append( ( relPath, st, contentHash ) )
+
+	stats = { 'images': len( jobList ), 'columns': len( columns ), 'cached': 0, 'sips': 0, 'pil': 0, 'original': 0, 'error': 0, 'seconds': 0.0 }
+	cells = {}
+	rows = set()
+	newHashes = {}
+	if len( jobList ) > 0:
+		pool = multiprocessing.Pool( processes= jobs or multiprocessing.cpu_count() )
+		try:
+			workerJobs = [ ( os.path.join( archiveRoot, relPath ), contentHash, thumbDir, pixels ) for relPath, st, contentHash in jobList ]
+			for ( relPath, st, _ ), result in zip( jobList, pool.imap( makeThumbnail, workerJobs, chunksize= 8 ) ):
+				stats[ result[ 'status' ] ] += 1
+				if result[ 'status' ] == 'error':
+					_dbx( "No thumbnail for '%s': %s" % ( relPath, result[ 'error' ] ) )
+				if result[ 'hash' ] != None:
+					newHashes[ relPath ] = [ st.st_size, st.st_mtime, result[ 'hash' ] ]
+				dirName, name = os.path.split( relPath )
+				thumbSrc = relPath if result[ 'status' ] in ( 'original', 'error' ) else os.path.join( g_thumbDirName, result[ 'hash' ] + '.png' )
+				cells[ ( dirName, name ) ] = ( relPath, thumbSrc )
+				rows.add( name )
+		finally:
+			pool.close()
+			pool.join()
+
+	with open( hashesPath + '.tmp', 'w' ) as fh:
+		json.dump( newHashes, fh ) # images gone from the archive are forgotten, and so are their thumbnails
+	os.rename( hashesPath + '.tmp', hashesPath )
+	inUse = set( entry[2] + '.png' for entry in newHashes.values() )
+	for name in os.listdir( thumbDir ):
+		if name.endswith( '.png' ) and name not in inUse: os.remove( os.path.join( thumbDir, name ) )
+	galleryPath = os.path.join( archiveRoot, g_galleryFileName )
+	with open( galleryPath + '.tmp', 'w' ) as fh:
+		fh.write( renderHtml( columns, sorted( rows ), cells, title or "Screenshots in %s" % archiveRoot ) )
+	os.rename( galleryPath + '.tmp', galleryPath )
+	stats[ 'path' ] = galleryPath
+	stats[ 'seconds' ] = time.time() - startTime
+	return stats
+
+def formatReport( stats ):
+	made = stats[ 'sips' ] + stats[ 'pil' ]
+	return ( "Gallery: %d image(s) in %d column(s), %d thumbnail(s) made, %d from cache, %d shown in full size, %d error(s) in %.1f s: %s"
+		% ( stats[ 'images' ], stats[ 'columns' ], made, stats[ 'cached' ], stats[ 'original' ], stats[ 'error' ], stats[ 'seconds' ], stats[ 'path' ] ) )
+
+def parseCmdLine() :
+	parser = argparse.ArgumentParser( description= "Write an html contact sheet of the screenshots archive" )
+	parser.add_argument( '-r', '--archiveRoot', help='root of the screenshots archive', required= True )
+	parser.add_argument( '-j', '--jobs', type= int, help='number of worker processes. Default: number of cpus' )
+	parser.add_argument( '--pixels', type= int, default= g_thumbPixels, help='longest side of a thumbnail' )
+	return parser.parse_args()
+
+def main():
+	argObject = parseCmdLine()
+	if not os.path.isdir( argObject.archiveRoot ):
+		_errorExit( "Archive root '%s' is not a directory" % argObject.archiveRoot )
+	stats = buildGallery( argObject.archiveRoot, jobs= argObject.jobs, pixels= argObject.pixels )
+	_infoTs( formatReport( stats ), True )
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,174 @@
+#!/usr/bin/python
+
+"""
+Live collection of the screenshots taken by a running UI test.
+
+Each combo gets its own sink directory which is passed to the test program through the test environment
+(SCREENSHOTS_DIR). While the test runs, a ScreenshotWatcher thread picks up every png as soon as it has
+been written completely, rotates it if necessary and moves it to the archive directory of the combo.
+So parallel combos no longer share one directory and the file I/O overlaps with the test execution
+instead of happening in one burst at the end.
+
+On Linux the watcher is driven by inotify (IN_CLOSE_WRITE, IN_MOVED_TO) through ctypes. Elsewhere,
+e.g. on the Mac, or when inotify is not available it polls the sink and treats a file as complete when
+its size and mtime did not change between two polls.
+"""
+
+import ctypes
+import ctypes.util
+import glob
+import inspect
+import os
+import select
+import shutil
+import struct
+import subprocess
+import sys
+import threading
+
+g_pngSuffix = '.png'
+
+IN_CLOSE_WRITE	= 0x00000008
+IN_MOVED_TO		= 0x00000080
+g_inotifyEventHeader = struct.Struct( 'iIII' ) # wd, mask, cookie, len
+
+def _dbx ( text ):
+    sys.stdout.write( '  Debug(%s - Ln %d): %s\n' % ( inspect.stack()[1][3], inspect.stack()[1][2], text ) )
+
+def ingestScreenshot( path, tgtDir ):
+	"""
+	Rotate landscape screenshots and move the file into tgtDir, replacing a file of the same name
+	which an earlier attempt may have left. return ( rotated, bytesMoved )
+	"""
+	rotated = False
+	if os.path.basename( path ).find( 'landscape' ) >= 0 :
+		with open( os.devnull, 'w' ) as devNull:
+			subprocess.check_call( [ 'sips', '-r', '-90', path ], stdout= devNull )
+		rotated = True
+	size = os.path.getsize( path )
+	shutil.move( path, os.path.join( tgtDir, os.path.basename( path ) ) )
+	return rotated, size
+
+def prepareSinkDir( sinkDir ):
+	"""return an empty sink directory, removing whatever a killed attempt may have left behind
+	"""
+	if os.path.isdir( sinkDir ):
+		shutil.rmtree( sinkDir )
+	os.makedirs( sinkDir )
+	return sinkDir
+
+def _openInotify( path ):
+	"""return ( fd, wd ) or None when inotify is not available on this platform
+	"""
+	if not sys.platform.startswith( 'linux' ):
+		return None
+	try:
+		libc = ctypes.CDLL( ctypes.util.find_library( 'c' ) or 'libc.so.6', use_errno= True )
+		fd = libc.inotify_init()
+		if fd < 0:
+			return None
+		wd = libc.inotify_add_watch( fd, path.encode( 'utf-8' ), IN_CLOSE_WRITE | IN_MOVED_TO )
+		if wd < 0:
+			os.close( fd )
+			return None
+	except ( OSError, AttributeError ) as exc:
+		_dbx( "inotify not usable: %s" % exc )
+		return None
+	return fd, wd
+
+class ScreenshotWatcher( threading.Thread ):
+	"""
+	Usage:
+		watcher = ScreenshotWatcher( sinkDir, tgtDir ); watcher.start()
+		... run the test ...
+		watcher.stop() # ingests what is left and returns the counters
+	"""
+
+	def __init__( self, sinkDir, tgtDir, mode= 'auto', pollSeconds= 0.5, onIngest= None ):
+		"""onIngest( tgtPath, size ) is called for every screenshot taken from the sink
+		"""
+		threading.Thread.__init__( self )
+		self.daemon = True
+		self.sinkDir = sinkDir
+		self.tgtDir = tgtDir
+		self.pollSeconds = pollSeconds
+		self.cntFiles = 0
+		self.cntRotated = 0
+		self.bytesMoved = 0
+		self.ingested = [] # target paths in order of arrival
+		self.onIngest = onIngest
+		self._stopEvent = threading.Event()
+		self._lock = threading.Lock()
+		self._inotify = _openInotify( sinkDir ) if mode in ( 'auto', 'inotify' ) else None
+		if mode == 'inotify' and self._inotify == None:
+			_dbx( "inotify requested but not available, falling back to polling" )
+		self.mode = 'inotify' if self._inotify else 'poll'
+
+	def _ingest( self, path ):
+		with self._lock:
+			if not os.path.isfile( path ): # already taken by the final sweep
+				return
+			try:
+				rotated, size = ingestScreenshot( path, self.tgtDir )
+			except ( OSError, IOError, subprocess.CalledProcessError ) as exc:
+				_dbx( "Could not ingest '%s': %s" % ( path, exc ) )
+				return
+			self.cntFiles += 1
+			self.cntRotated += 1 if rotated else 0
+			self.bytesMoved += size
+			self.ingested.append( os.path.join( self.tgtDir, os.path.basename( path ) ) )
+			if self.onIngest != None: self.onIngest( self.ingested[-1], size )
+
+	def _runInotify( self ):
+		fd, wd = self._inotify # the watch is in place since __init__, i.e. before the test starts writing
+		try:
+			while not self._stopEvent.is_set():
+				readable, _, _ = select.select( [ fd ], [], [], self.pollSeconds )
+				if len( readable ) == 0:
+					continue
+				buf = os.read( fd, 64 * 1024 )
+				offset = 0
+				while offset < len( buf ):
+					_, mask, _, nameLen = g_inotifyEventHeader.unpack_from( buf, offset )
+					offset += g_inotifyEventHeader.size
+					name = buf[ offset : offset + nameLen ].rstrip( b'\0' ).decode( 'utf-8' )
+					offset += nameLen
+					if name.endswith( g_pngSuffix ):
+						self._ingest( os.path.join( self.sinkDir, name ) )
+		finally:
+			os.close( fd )
+
+	def _runPolling( self ):
+		lastSeen = {}
+		while not self._stopEvent.wait( self.pollSeconds ):
+			seen = {}
+			for path in glob.glob( os.path.join( self.sinkDir, '*' + g_pngSuffix ) ):
+				try:
+					st = os.stat( path )
+				except OSError:
+					continue
+				seen[ path ] = ( st.st_size, st.st_mtime )
+				if lastSeen.get( path ) == seen[ path ]: # unchanged since last poll: writer is done
+					self._ingest( path )
+					del seen[ path ]
+			lastSeen = seen
+
+	def _sweep( self ):
+		for path in sorted( glob.glob( os.path.join( self.sinkDir, '*' + g_pngSuffix ) ) ):
+			self._ingest( path )
+
+	def run( self ):
+		if self.mode == 'inotify':
+			self._runInotify()
+		else:
+			self._runPolling()
+
+	def stop( self ):
+		"""
+		To be called once the test process has ended, so every file left in the sink is complete
+		return ( cntFiles, cntRotated, bytesMoved )
+		"""
+		self._stopEvent.set()
+		self.join()
+		self._sweep()
+		return self.cntFiles, self.cntRotated, self.bytesMoved
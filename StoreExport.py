@@ -0,0 +1,207 @@
+#!/usr/bin/python
+
+"""
+Build the per-locale upload tree for iTMS Transporter from the screenshots archive. Replaces pickImages.sh
+which copied four hardwired files for one device and locale at a time.
+
+What goes where is declared in a mapping file (json), see storeExportMapping.json:
+	exportRoot: where the upload tree is built. Can be overridden on the command line
+	devices, locales: defaults for all slots
+	slots: list of { "source": <screenshot name>, "slot": <file name in the store folder>
+		, optionally "devices": [...], "locales": [...] }
+
+For each locale we create <exportRoot>/<locale>/ holding <device>_<slot> for each device and slot. The source
+is looked up by device, locale and name in the archive index (ArchiveIndex.py). Archives without an index
+are expected to hold it in <archiveRoot>/<device>_<locale>/<source> (device and locale as mangled by
+makeExpandFriendlyPath).
+Files are hardlinked, falling back to a copy across file systems. Locales are processed in parallel.
+
+A manifest in the export root records size, mtime and content hash of each source, so a second run only
+regenerates slots whose source content changed, and removes the targets of slots no longer declared.
+"""
+
+import argparse
+import errno
+import hashlib
+import inspect
+import json
+import os
+import re
+import shutil
+import sys
+import time
+from multiprocessing.pool import ThreadPool
+
+import ArchiveIndex
+
+g_manifestFileName = '.exportManifest.json'
+
+def _dbx ( text ):
+    sys.stdout.write( '  Debug(%s - Ln %d): %s\n' % ( inspect.stack()[1][3], inspect.stack()[1][2], text ) )
+
+def _infoTs ( text, withTS = False ):
+	if withTS:
+		print( '\n%s (Ln %d) %s' % ( time.strftime("%H:%M:%S"), inspect.stack()[1][2], text ) )
+	else :
+		print( '\nINFO (Ln %d) %s' % ( inspect.stack()[1][2], text ) )
+
+def _errorExit ( text ):
+    sys.stderr.write( '\nERROR raised from %s - Ln %d: %s\n' % ( inspect.stack()[1][3], inspect.stack()[1][2], text ) )
+    sys.exit(1)
+
+def makeExpandFriendlyPath( string ):
+	# replace round brackets characters and space with underscore
+	return re.sub(  '[\(\) ]', '_', string )
+
+def readMapping( path ):
+	"""return the mapping as dictionary with the slot level defaults filled in
+	"""
+	try:
+		with open( path, 'r' ) as fh:
+			mapping = json.load( fh )
+	except ( IOError, ValueError ) as exc:
+		_errorExit( "Could not read mapping file '%s': %s" % ( path, exc ) )
+
+	for slot in mapping.get( 'slots', [] ):
+		if 'source' not in slot or 'slot' not in slot:
+			_errorExit( "Each slot in '%s' needs 'source' and 'slot'. Invalid: %s" % ( path, slot ) )
+		slot.setdefault( 'devices', mapping.get( 'devices', [] ) )
+		slot.setdefault( 'locales', mapping.get( 'locales', [] ) )
+	return mapping
+
+def fileHash( path ):
+	digest = hashlib.sha1()
+	with open( path, 'rb' ) as fh:
+		for block in iter( lambda: fh.read( 1024 * 1024 ), b'' ):
+			digest.update( block )
+	return digest.hexdigest()
+
+def linkOrCopy( srcPath, tgtPath ):
+	if os.path.lexists( tgtPath ):
+		os.remove( tgtPath )
+	try:
+		os.link( srcPath, tgtPath )
+		return 'linked'
+	except OSError as exc:
+		if exc.errno not in ( errno.EXDEV, errno.EPERM, errno.EMLINK ):
+			raise
+	shutil.copy2( srcPath, tgtPath )
+	return 'copied'
+
+def planTargets( mapping, archiveRoot ):
+	"""return dictionary locale -> list of ( target path relative to export root, source path )
+	"""
+	plan = {}
+	indexed = dict( ( ( entry[ 'dev' ], entry[ 'lang' ], entry[ 'name' ] ), os.path.join( archiveRoot, relPath ) )
+		for relPath, entry in ArchiveIndex.ArchiveIndex( archiveRoot ).entries().items() )
+	for slot in mapping.get( 'slots', [] ):
+		for locale in slot[ 'locales' ]:
+			for dev in slot[ 'devices' ]:
+				srcPath = indexed.get( ( dev, locale, slot[ 'source' ] ) )
+				if srcPath == None:
+					srcPath = os.path.join( archiveRoot, "%s_%s" % ( makeExpandFriendlyPath( dev ), makeExpandFriendlyPath( locale ) ), slot[ 'source' ] )
+				relTarget = os.path.join( locale, "%s_%s" % ( makeExpandFriendlyPath( dev ), slot[ 'slot' ] ) )
+				plan.setdefault( locale, [] ).append( ( relTarget, srcPath ) )
+	return plan
+
+def exportLocale( exportRoot, targets, manifest ):
+	"""
+	Bring the targets of one locale up to date. Runs in a worker thread, so it only reads the manifest
+	return ( dictionary relTarget -> new manifest entry or None for missing sources, counters )
+	"""
+	entries = {}
+	counters = { 'linked': 0, 'copied': 0, 'unchanged': 0, 'missing': 0 }
+	for relTarget, srcPath in targets:
+		tgtPath = os.path.join( exportRoot, relTarget )
+		try:
+			st = os.stat( srcPath )
+		except OSError:
+			counters[ 'missing' ] += 1
+			entries[ relTarget ] = None
+			continue
+
+		old = manifest.get( relTarget )
+		tgtExists = os.path.exists( tgtPath )
+		if old != None and tgtExists and old[ 'source' ] == srcPath and old[ 'size' ] == st.st_size and old[ 'mtime' ] == st.st_mtime:
+			counters[ 'unchanged' ] += 1
+			entries[ relTarget ] = old
+			continue
+
+		contentHash = fileHash( srcPath )
+		entry = { 'source': srcPath, 'size': st.st_size, 'mtime': st.st_mtime, 'hash': contentHash }
+		if old != None and tgtExists and old[ 'hash' ] == contentHash:
+			counters[ 'unchanged' ] += 1 # touched but same content
+		else:
+			if not os.path.isdir( os.path.dirname( tgtPath ) ):
+				os.makedirs( os.path.dirname( tgtPath ) )
+			counters[ linkOrCopy( srcPath, tgtPath ) ] += 1
+		entries[ relTarget ] = entry
+	return entries, counters
+
+def exportScreenshots( mapping, archiveRoot, exportRoot, jobs= 4 ):
+	"""return counters over all locales. See exportLocale
+	"""
+	manifestPath = os.path.join( exportRoot, g_manifestFileName )
+	manifest = {}
+	if os.path.isfile( manifestPath ):
+		try:
+			with open( manifestPath, 'r' ) as fh:
+				manifest = json.load( fh )
+		except ( IOError, ValueError ):
+			_dbx( "Ignoring unreadable manifest '%s', all slots will be regenerated" % manifestPath )
+	if not os.path.isdir( exportRoot ):
+		os.makedirs( exportRoot )
+
+	plan = planTargets( mapping, archiveRoot )
+	pool = ThreadPool( max( 1, min( jobs, len( plan ) ) ) )
+	try:
+		results = pool.map( lambda locale: exportLocale( exportRoot, plan[ locale ], manifest ), sorted( plan ) )
+	finally:
+		pool.close()
+		pool.join()
+
+	totals = { 'linked': 0, 'copied': 0, 'unchanged': 0, 'missing': 0, 'removed': 0 }
+	newManifest = {}
+	for entries, counters in results:
+		for key in counters: totals[ key ] += counters[ key ]
+		for relTarget, entry in entries.items():
+			if entry == None:
+				_dbx( "Source missing for '%s'" % relTarget )
+			else:
+				newManifest[ relTarget ] = entry
+
+	for relTarget in set( manifest ) - set( newManifest ): # slots no longer declared or without source now
+		tgtPath = os.path.join( exportRoot, relTarget )
+		if os.path.lexists( tgtPath ):
+			os.remove( tgtPath )
+			totals[ 'removed' ] += 1
+
+	with open( manifestPath + '.tmp', 'w' ) as fh:
+		json.dump( newManifest, fh, indent= 1, sort_keys= True )
+	os.rename( manifestPath + '.tmp', manifestPath )
+	return totals
+
+def formatReport( totals, exportRoot ):
+	return "Store export to '%s': %d linked, %d copied, %d unchanged, %d removed, %d source(s) missing" % ( exportRoot
+		, totals[ 'linked' ], totals[ 'copied' ], totals[ 'unchanged' ], totals[ 'removed' ], totals[ 'missing' ] )
+
+def parseCmdLine() :
+	parser = argparse.ArgumentParser()
+	parser.add_argument( '-m', '--mapping', help='mapping file, see storeExportMapping.json', required= True )
+	parser.add_argument( '-r', '--archiveRoot', help='root of the screenshots archive with the <device>_<locale> folders', required= True )
+	parser.add_argument( '-o', '--exportRoot', help='root of the upload tree. Default: exportRoot from the mapping file' )
+	parser.add_argument( '-j', '--jobs', type= int, default= 4, help='locales processed in parallel' )
+	return parser.parse_args()
+
+def main():
+	argObject = parseCmdLine()
+	mapping = readMapping( argObject.mapping )
+	exportRoot = argObject.exportRoot or mapping.get( 'exportRoot' )
+	if exportRoot == None:
+		_errorExit( "No export root given on command line or in '%s'" % argObject.mapping )
+	exportRoot = os.path.expanduser( exportRoot )
+	totals = exportScreenshots( mapping, argObject.archiveRoot, exportRoot, argObject.jobs )
+	_infoTs( formatReport( totals, exportRoot ), True )
+
+if __name__ == '__main__':
+	main()
@@ -43,18 +43,51 @@ import inspect
 import os 
 import re
 import shutil
+import signal
 import subprocess 
 import sys 
 import tempfile 
+import threading
 import time 
+import traceback
+import Queue
+
+import ArchiveIndex
+import BuildCache
+import ComboWatchdog
+import CompileIssues
+import ConcurrencyGovernor
+import DeviceBackend
+import DeviceCatalog
+import FailureIndex
+import MatrixConfig
+import PngOptimizer
+import ProgressEvents
+import ResourceMonitor
+import RunGallery
+import RetentionGC
+import RetryPolicy
+import ScreenshotWatcher
+import StoreExport
 
 g_screenshotsBakRoot=  os.path.join( os.environ[ 'HOME' ] , 'Desktop',  'TestAuto_screenshots' )
 g_buildTestOutputDefaultRoot	= os.path.join( "/tmp", "UITestAutomatationOutput" )
 g_userHome= os.path.expanduser( '~' )
-g_consoleBackupDir	= os.path.join( g_userHome, "UITestAutomatationRun_" + time.strftime( "%Y%m%D_%H%M%S" ) )
+g_consoleBackupDir	= os.path.join( g_userHome, "UITestAutomatationRun_" + time.strftime( "%Y%m%d_%H%M%S" ) )
+g_stateDir			= os.path.join( g_userHome, ".UITestAutomation" ) # persists across runs
+g_durationHistoryPath	= os.path.join( g_stateDir, "comboDurations.json" )
+g_flakeHistoryPath	= os.path.join( g_stateDir, "flakeHistory.json" )
+g_legacyScreenshotDir	= "/Users/bmlam/Temp/ManyTimes/Screenshots" # used to be hardwired in swift test program
+g_comboWorkerPrefix	= "combo " # names of the threads of runMatrix running a combo attempt
+g_workerJoinSeconds	= 30 # for the combo workers to wrap up once their xcodebuild is killed
 
 g_cntDisplayed = 0
 g_batchMode = False
+g_backend = None # DeviceBackend, set in main()
+g_reaper = None # RetentionGC.Reaper removing discarded trees in the background, started in setup()
+g_events = None # ProgressEvents.EventPublisher, set in main()
+g_archiveIndex = None # ArchiveIndex.ArchiveIndex of the screenshots archive, set in main()
+g_deviceUdids = {} # device name -> UDID, resolved by the preflight in main()
 
 def _dbx ( text ):
     sys.stdout.write( '  Debug(%s - Ln %d): %s\n' % ( inspect.stack()[1][3], inspect.stack()[1][2], text ) ) 
@@ -106,9 +139,82 @@ def parseCmdLine() :
 		, help='root location for screenshots. Subfolders based on appName, device and lang will be created', default=g_screenshotsBakRoot )
 
 	# long argument names from here
-	parser.add_argument( '--langDevFile', help='full path of the file listing languages and devices to test', required= True )
+	parser.add_argument( '--langDevFile', help='full path of the matrix config, json or lang:/dev: lines, see MatrixConfig.py', required= True )
 	parser.add_argument( '--schemeFile', help='relative path of the apps scheme file from projectRoot', required= True )
 
+	parser.add_argument( '--countdown', type= int, default= 4, help='seconds to wait for Ctl-c before the matrix starts' )
+
+	parser.add_argument( '--backend', choices= [ 'simctl', 'fake' ], default= 'simctl'
+		, help='how simulators are driven. fake runs an in-process model of simulators, e.g. to load test on Linux' )
+	parser.add_argument( '--fakeConfig', help='json file with the FakeSimBackend settings: bootLatency, testDuration, capacity, failureRates, timeScale ...' )
+
+	# selection, e.g. for --watch
+	parser.add_argument( '--onlyDevs', help='comma separated devices of the matrix to run, default all' )
+	parser.add_argument( '--onlyLangs', help='comma separated languages of the matrix to run, default all' )
+	parser.add_argument( '--onlyTesting', action= 'append', help='test identifier <target>/<class>/<method> to run, may be repeated. Default all' )
+
+	# watch mode
+	parser.add_argument( '--watch', action= 'store_true'
+		, help='keep running: on every change below projectRoot rebuild incrementally and run the selected combos again, without retries' )
+	parser.add_argument( '--watchInterval', type= float, default= 1.0, help='seconds between two looks at the project sources' )
+
+	# one test session per device
+	parser.add_argument( '--multiLocale', action= 'store_true'
+		, help='run all languages of a device in a single test session. The UI test gets TARGET_LANGS and relaunches the app per language' )
+
+	# concurrency
+	parser.add_argument( '--minJobs', type= int, default= 1, help='combos running in parallel at least' )
+	parser.add_argument( '--maxJobs', type= int, default= 1
+		, help='combos running in parallel at most. Above 1 the app is built once and the governor picks the number of parallel combos based on host load' )
+	parser.add_argument( '--maxLoadPerCpu', type= float, default= 1.0, help='governor lowers parallelism above this 1 minute load average per cpu' )
+	parser.add_argument( '--minFreeMB', type= float, default= 2048, help='governor lowers parallelism when less memory is available' )
+	parser.add_argument( '--governorInterval', type= float, default= 10, help='seconds between two governor samples' )
+	parser.add_argument( '--resourceInterval', type= float, default= 2.0, help='seconds between two samples of the processes of a combo for its CPU and RSS figures. 0 switches the sampling off' )
+
+	# build cache
+	parser.add_argument( '--buildCacheDir', default= os.path.join( g_stateDir, "buildCache" ), help='where built products are kept across runs' )
+	parser.add_argument( '--buildCacheMB', type= float, default= 10240, help='disk budget of the build cache' )
+	parser.add_argument( '--noBuildCache', action= 'store_true', help='build and test in one xcodebuild call per combo as before' )
+
+	# retention of run logs, derived data and archived screenshots
+	parser.add_argument( '--retentionDays', type= float, default= 30, help='discard run logs and derived data older than this' )
+	parser.add_argument( '--retentionKeep', type= int, default= 10, help='always keep this many newest items per location' )
+	parser.add_argument( '--retentionBudgetMB', type= float, default= 20480, help='disk budget of all these locations together' )
+	parser.add_argument( '--noRetention', action= 'store_true', help='do not discard anything' )
+
+	parser.add_argument( '--progressSocket', help='also publish the progress events on this Unix socket, see "%s status -h"' % os.path.basename( __file__ ) )
+
+	# device catalog
+	parser.add_argument( '--deviceCatalogTtl', type= float, default= DeviceCatalog.g_defaultTtlSeconds, help='seconds the cached simctl device list stays valid' )
+	parser.add_argument( '--refreshDeviceCatalog', action= 'store_true', help='ignore the cached simctl device list' )
+
+	# watchdog budgets
+	parser.add_argument( '--comboTimeout', type= float, default= 3600
+		, help='maximum seconds a single xcodebuild test run may take. The actual budget is derived from historical durations and capped by this' )
+	parser.add_argument( '--inactivityTimeout', type= float, default= 600
+		, help='maximum seconds without output from xcodebuild. The actual budget is derived from historical silences and capped by this' )
+	parser.add_argument( '--budgetFactor', type= float, default= 3.0
+		, help='multiple of the historical duration/silence granted to a combo before the watchdog kills it' )
+	parser.add_argument( '--watchdogTailLines', type= int, default= 50, help='number of output lines kept in the diagnostics of a killed combo' )
+
+	# screenshots
+	parser.add_argument( '--screenshotWatch', choices= [ 'auto', 'inotify', 'poll' ], default= 'auto'
+		, help='how the per combo screenshot sink is watched. auto uses inotify where available' )
+	parser.add_argument( '--legacyScreenshotDir', default= g_legacyScreenshotDir
+		, help='directory swept after each combo for test programs which do not honour SCREENSHOTS_DIR yet' )
+
+	parser.add_argument( '--optimizePngs', action= 'store_true', help='losslessly recompress the archived screenshots once all combos are done' )
+	parser.add_argument( '--pngJobs', type= int, help='worker processes for --optimizePngs and --gallery. Default: number of cpus' )
+	parser.add_argument( '--gallery', action= 'store_true', help='write a gallery.html contact sheet into the screenshots archive root at the end' )
+
+	parser.add_argument( '--storeExportMapping', help='mapping file for StoreExport.py. When given, the store upload tree is refreshed at the end' )
+	parser.add_argument( '--storeExportRoot', help='root of the store upload tree. Default: exportRoot from the mapping file' )
+
+	# retries
+	parser.add_argument( '--maxAttempts', type= int, default= 3, help='attempts per combo including the first one. 1 disables retries' )
+	parser.add_argument( '--retrySlots', type= int, default= 10
+		, help='maximum number of retries per run which are not known to be flaky. Retries of known flaky test cases are not counted' )
+
 	# batch vs no-batch
 	batchModeGroup = parser.add_mutually_exclusive_group(required=False)
 	batchModeGroup.add_argument('--batch', dest='batchMode', action='store_true')
@@ -128,56 +234,15 @@ def parseCmdLine() :
 	# derive settings
 	if result.buildTestOutputDir == None:  result.buildTestOutputDir = os.path.join( g_buildTestOutputDefaultRoot, result.appName )
 	if result.schemeFile != None:  result.schemeFile = os.path.join( result.projectRoot, result.schemeFile ) # not so nice, fixme
+	result.parallel = result.maxJobs > 1 # the scheme file cannot be shared by parallel combos, nor can an incremental build
+	result.buildOnce = result.parallel or result.watch or not result.noBuildCache # build-for-testing, then test-without-building per combo
+	result.editScheme = not result.parallel and not result.watch and not result.multiLocale # else env reaches the runner through TEST_RUNNER_ variables only
 	g_batchMode = result.batchMode
 	_infoTs( "batchMode: %s" % "y" if g_batchMode else "n" )
 	# _errorExit( "batchMode: %s" % "y" if g_batchMode else "n" )
 
 	return result
 
-def getListOfLangsAndDevicesFromFile(filePath):
-	"""Decompose the file content into list of languages and device types 
-	"""
-	_infoTs( "Reading languages and devices to test from %s" % filePath )
-
-	fieldSep = ':'
-	langLiteral = 'lang'
-	devLiteral  = 'dev'
-
-	try :
-		fh= open( filePath, 'r')
-	except IOError:
-		_errorExit( 'Could not read file %s' % filePath )
-
-	langs= []
-	devs= []
-
-	lineNo= 0
-	for lineIn in fh.readlines():
-		lineNo+= 1
-		line =lineIn.strip()
-		if not line.startswith("#"):
-			if len( line ) > 0:
-				fields = line .split ( fieldSep )
-				# _dbx( len( fields ) )
-				if len ( fields ) != 2:
-
-					_errorExit( "Each payload line in '%s' is must contain 2 fields separated by '%s'. Line %d is invalid" % ( filePath, fieldSep, lineNo) )
-
-				key, value = fields[0:2] # start from 0 and take 2
-				if key == devLiteral :
-					if value in devs :
-						_errorExit( "Device %s found again in line %d. Dupes are not permitted!" % (value, lineNo) )
-					devs.append( value )
-				elif key == langLiteral :
-					if value in langs :
-						_errorExit( "Lang %s found again in line %d. Dupes are not permitted!" % (value, lineNo) )
-					langs.append( value )
-				else:
-					_errorExit( "The keyword found in line %d of '%s' is invalid" % ( lineNo, filePath ) )
-
-	return devs, langs
-
-
 def myMkDir ( path ):
 	if os.path.isdir( path ):
 		return
@@ -211,27 +276,46 @@ def assertScreenshotsBackupDir ( path ):
 			_infoTs( "The directory has %d nodes. Examples: %s" % ( len( nodesInDir ), ';'.join( nodesInDir[0:3] ) ) )
 			answer = raw_input( "Enter 'yes' to proceed for removal or anything else to abort: " )
 			if answer == 'yes':
-				shutil.rmtree( path )
+				g_reaper.discard( path ) # removed in the background
 			else:
 				_errorExit( 'Script aborted.')
 			
 	myMkDir( path )
 
-def moveScreenshots( srcRoot, tgtDir ):
+def prepareComboDirs( matrix, screenshotsArchiveRoot ):
+	"""
+	give user a chance to keep the content of the archive folders of the combos. Runs on the main thread
+	before any combo starts, so the prompts of parallel combos do not interleave
+	"""
+	for combo in matrix.combos:
+		for lang in combo[ 'langs' ]:
+			pngTargetDir = os.path.join( screenshotsArchiveRoot, "%s_%s" % ( makeExpandFriendlyPath( combo[ 'dev' ] ), makeExpandFriendlyPath( lang ) ) )
+			assertScreenshotsBackupDir ( pngTargetDir )
+			g_archiveIndex.forgetDir( pngTargetDir )
+
+def moveScreenshots( srcRoot, tgtDir, dev, lang ):
 	"""
 	"""
 
 	cntFiles = 0
 	cntRotated = 0
+	bytesMoved = 0
 	srcDir = srcRoot
 	_dbx( "Moving png files from '%s' to '%s' ..." % ( srcDir, tgtDir ) )
 	for file in glob.glob( srcDir + '/*.png' ):
-		if file.find( 'landscape' ) >= 0 :
-			subprocess.check_call( [ 'sips', '-r', '-90', file ] )
-			cntRotated += 1
-		shutil.move( file, tgtDir )
+		rotated, size = ScreenshotWatcher.ingestScreenshot( file, tgtDir ) # a retry replaces the file of an earlier attempt
+		bytesMoved += size
+		g_archiveIndex.record( os.path.join( tgtDir, os.path.basename( file ) ), dev, lang, run= os.path.basename( g_consoleBackupDir ) )
+		if rotated: cntRotated += 1
 		cntFiles += 1
 	_dbx( "Files rotated: %d, moved: '%d'" % ( cntRotated, cntFiles ) )
+	return bytesMoved
+
+def archiveScreenshot( path, size, dev, lang ):
+	"""called by the screenshot watchers for each file they put into the archive
+	"""
+	g_archiveIndex.record( path, dev, lang, run= os.path.basename( g_consoleBackupDir ) )
+	publish( 'screenshot', dev= dev, lang= lang, file= os.path.basename( path ), bytes= size )
 
 def makeExpandFriendlyPath( string ):
 	# replace round brackets characters and space with underscore
@@ -254,13 +338,9 @@ def fileModTimeAs ( path, format ):
 def bootDevice( dev ):
 	"""
 	"""
-	cmdArgs = [ 'xcrun', 'simctl' 
-		, 'boot', dev
-		]
-	_dbx( "Running: %s" % " ".join( cmdArgs ) )
+	_dbx( "Booting %s (%s backend)" % ( dev, g_backend.name ) )
 
-	proc= subprocess.Popen( cmdArgs ,stdin=subprocess.PIPE ,stdout=subprocess.PIPE ,stderr=subprocess.PIPE)
-	stdOutput, errOutput= proc.communicate( )
+	ok, stdOutput, errOutput= g_backend.boot( dev )
 
 	handleConsoleOutput ( text= stdOutput, isStderr= False, showLines= 2 )
 
@@ -270,13 +350,7 @@ def bootDevice( dev ):
 def shutdownDevice( dev ):
 	"""
 	"""
-	cmdArgs = [ 'xcrun', 'simctl' 
-		, 'shutdown', dev
-		]
-	# _dbx( "Running: %s" % " ".join( cmdArgs ) )
-
-	proc= subprocess.Popen( cmdArgs ,stdin=subprocess.PIPE ,stdout=subprocess.PIPE ,stderr=subprocess.PIPE)
-	stdOutput, errOutput= proc.communicate( )
+	ok, stdOutput, errOutput= g_backend.shutdown( dev )
 
 	handleConsoleOutput ( text= stdOutput, isStderr= False, showLines= 2 )
 
@@ -287,20 +361,16 @@ def shutdownDevice( dev ):
 def closeSimulatorApp():
 	"""
 	"""
-	cmdArgs = [ 'osascript'
-		, '-e', 'tell app "Simulator" to quit'
-		]
-	_dbx( "Running: %s" % " ".join( cmdArgs ) )
+	_dbx( "Closing Simulator app (%s backend)" % g_backend.name )
 
-	proc= subprocess.Popen( cmdArgs ,stdin=subprocess.PIPE ,stdout=subprocess.PIPE ,stderr=subprocess.PIPE)
-	stdOutput, errOutput= proc.communicate( )
+	ok, stdOutput, errOutput= g_backend.closeSimulatorApp()
 
 	#outLines = stdOutput.split( "\n" )
 	#if outLines > 0: _infoTs( "Last lines of stdout:\n%s\n" % ( '\n'.join( outLines[ -3: ] ) ) )
 
 	if len( errOutput ) > 0 :
 		errLines = errOutput.split( "\n" )
-		_infoTs( "Last lines of stdout:\n%s\n" % ( '\n'.join( outLines[ -3: ] ) ) )
+		_infoTs( "Last lines of stderr:\n%s\n" % ( '\n'.join( errLines[ -3: ] ) ) )
 		fileTextAndShowPathOnConsole( text= errOutput, consoleMsgPrefix= "Stderr saved to", outPath= None )
 
 def deployAppToDevice( dev, bundlePath ):
@@ -313,13 +383,9 @@ def deployAppToDevice( dev, bundlePath ):
 	"""
 	shutdownDevice( dev ) # shutdown the device first to get a defined state!
 	bootDevice( dev ) 
-	cmdArgs = [ 'xcrun', 'simctl' 
-		, 'install', dev, bundlePath 
-		]
-	_dbx( "Running: %s" % " ".join( cmdArgs ) )
+	_dbx( "Installing %s on %s" % ( bundlePath, dev ) )
 
-	proc= subprocess.Popen( cmdArgs ,stdin=subprocess.PIPE ,stdout=subprocess.PIPE ,stderr=subprocess.PIPE)
-	stdOutput, errOutput= proc.communicate( )
+	ok, stdOutput, errOutput= g_backend.install( dev, bundlePath )
 
 	handleConsoleOutput ( text= stdOutput, isStderr= False, showLines= 3 )
 	if len( errOutput ) > 0 :
@@ -336,41 +402,141 @@ def fileTextAndShowPathOnConsole( text, consoleMsgPrefix, outPath= None ):
 	_infoTs( "%s '%s'" % ( consoleMsgPrefix, outPath ) )
 	outF.write( text )
 	outF.close( )
+	return len( text )
 
-def startUITestTarget( projectDir, lang, dev, outputDir, appName ):
+def publish( event, **fields ):
+	"""publish a progress event, see ProgressEvents
+	"""
+	if g_events != None: g_events.emit( event, **fields )
+
+def deviceRef( dev ):
+	"""the UDID of dev for simctl when the preflight resolved it, the name otherwise
+	"""
+	return g_deviceUdids.get( dev, dev )
+
+def destinationOf( dev ):
+	if dev in g_deviceUdids:
+		return 'platform=iOS Simulator,id=%s' % g_deviceUdids[ dev ]
+	return 'platform=iOS Simulator,OS=10.2,name=%s' % dev
+
+def buildForTesting( argObject, dev, incremental= False ):
+	"""
+	Build app and test bundles once, so the combos can run test-without-building against the same
+	derived data instead of each one building into it. When the build cache has the products of an
+	identical source tree we take these and skip the build. return False when the build failed
+	incremental is for the cycles of --watch after the first: no clean and no build cache, xcodebuild only
+	rebuilds what changed in the derived data of the cycle before
+	"""
+	productsDir = os.path.join( argObject.buildTestOutputDir, 'Build', 'Products' )
+	buildCache = None
+	if incremental:
+		if not argObject.noBuildCache: # the first cycle may have taken the products from the cache
+			BuildCache.BuildCache( argObject.buildCacheDir, budgetMB= argObject.buildCacheMB ).detachProducts( productsDir )
+	elif not argObject.noBuildCache:
+		buildCache = BuildCache.BuildCache( argObject.buildCacheDir, budgetMB= argObject.buildCacheMB )
+		cacheKey = buildCache.fingerprint( argObject.projectRoot, argObject.schemeFile
+			, keys= [ argObject.appName, 'iphonesimulator', BuildCache.xcodeVersion() ], excludedPaths= [ argObject.buildTestOutputDir ] )
+		if not argObject.cleanSwitch:
+			method = buildCache.restore( cacheKey, productsDir )
+			if method != None:
+				_infoTs( "Build skipped, products of fingerprint %s %s from the build cache" % ( cacheKey[ :12 ], method ), True )
+				publish( 'build_finished', seconds= 0.0, cached= True )
+				return True
+		buildCache.detachProducts( productsDir )
+
+	cmdArgs = [ 'xcodebuild' ]
+	if argObject.cleanSwitch and not incremental: cmdArgs.append( 'clean' )
+	cmdArgs += [ 'build-for-testing'
+		,'-derivedDataPath', argObject.buildTestOutputDir
+		,'-scheme',  argObject.appName 
+		,'-sdk', 'iphonesimulator' 
+		,'-destination', destinationOf( dev )
+		]
+	_infoTs( "Running: %s" % " ".join( cmdArgs ), True )
+	publish( 'build_started' )
+	buildResult = g_backend.runBuild( cmdArgs, budgets= ( argObject.comboTimeout, argObject.inactivityTimeout )
+		, tailLines= argObject.watchdogTailLines, cwd= argObject.projectRoot )
+	stdoutLog = os.path.join( g_consoleBackupDir, "Build_StdOUT" )
+	fileTextAndShowPathOnConsole( text= buildResult[ 'stdout' ], consoleMsgPrefix= "Stdout of xcodebuild saved to", outPath= stdoutLog )
+	if buildResult[ 'timedOut' ]:
+		fileTextAndShowPathOnConsole( text= buildResult[ 'diagnostics' ], consoleMsgPrefix= "Build timed out. Watchdog diagnostics saved to"
+			, outPath= os.path.join( g_consoleBackupDir, "Watchdog__Build" ) )
+		_infoTs( "Build for testing timed out" )
+		return False
+	compileReport = CompileIssues.reportBuild( buildResult[ 'stdout' ]
+		, baselinePath= os.path.join( g_stateDir, "compileBaseline_%s.json" % argObject.appName ), projectRoot= argObject.projectRoot )
+	fileTextAndShowPathOnConsole( text= compileReport, consoleMsgPrefix= "%s. Details saved to" % compileReport.split( "\n" )[0]
+		, outPath= os.path.join( g_consoleBackupDir, "Compile_issues.txt" ) )
+	if buildResult[ 'returncode' ] != 0:
+		stderrLog = os.path.join( g_consoleBackupDir, "Build_StdERR" )
+		fileTextAndShowPathOnConsole( text= buildResult[ 'stderr' ], consoleMsgPrefix= "Stderr of xcodebuild saved to", outPath= stderrLog )
+		_infoTs( "Build for testing failed with rc %d. See '%s'" % ( buildResult[ 'returncode' ], stderrLog ) )
+		return False
+	_infoTs( "Build for testing done in %.0f s" % buildResult[ 'elapsed' ], True )
+	publish( 'build_finished', seconds= round( buildResult[ 'elapsed' ], 1 ), cached= False )
+
+	if buildCache != None:
+		if not os.path.isdir( productsDir ):
+			_infoTs( "Nothing to cache, '%s' does not exist" % productsDir )
+			return True
+		evicted = buildCache.store( cacheKey, productsDir )
+		_dbx( "Products stored in build cache as %s, evicted: %s" % ( cacheKey[ :12 ], ", ".join( key[ :12 ] for key in evicted ) or 'none' ) )
+	return True
+
+def startUITestTarget( projectDir, lang, dev, outputDir, appName, budgets, tailLines, onlyTesting= None, attemptNo= 1, testEnv= {}, action= 'test', keepWarm= False, resourceInterval= 0 ):
 	"""
 	Sofar I only know how to call xcodebuild to build the app and test target and run the test target.
 	I have seen that the language set for the app previously using "xcrun " does get persisted in the Simulator.
 	It is indeed stupid to build again but until I know a more efficient way, I have to put up with
 	this monkey solution.
+
+	xcodebuild runs under the watchdog with budgets = ( totalBudget, inactivityBudget ). Besides the 
+	log paths we return the watchdog result so the caller can record duration and timeout.
+	onlyTesting restricts a retry to the given test identifiers (<target>/<class>/<method>).
+	testEnv is passed to the test runner, see DeviceBackend.runTests.
+	action is 'test-without-building' when buildForTesting() has been run before.
+	keepWarm leaves a booted simulator as it is instead of shutting it down first.
+	With resourceInterval the processes of the test are sampled, see ResourceMonitor. watchResult[ 'resources' ]
+	then has their usage, and in any case the bytes of the logs saved here.
 	"""
 
 	returnCode = False
-	savedDir = os.getcwd(); os.chdir( projectDir )
 
-	shutdownDevice( dev ) # since xcodebuild complained about dev in booted state
-	time.sleep( 1 )
-	cmdArgs = [ 'xcodebuild', 'test' 
+	if not keepWarm:
+		ok, stdOutput, errOutput = g_backend.prepareForTests( deviceRef( dev ) )
+		if len( errOutput ) > 0: handleConsoleOutput ( text= errOutput, isStderr= False, showLines= 4 )
+	cmdArgs = [ 'xcodebuild', action
 				,'-target',  appName + 'Tests'
 	   			,'-derivedDataPath', outputDir
 				,'-scheme',  appName 
            		,'-sdk', 'iphonesimulator' 
-           		,'-destination', 'platform=iOS Simulator,OS=10.2,name=%s' % dev
+           		,'-destination', destinationOf( dev )
 		]
+	for testId in onlyTesting or []:
+		cmdArgs.append( '-only-testing:%s' % testId )
 
 	devPretty= makeExpandFriendlyPath( dev )
 	langPretty= makeExpandFriendlyPath( lang )
+	if attemptNo > 1: langPretty += "_attempt%d" % attemptNo
 
-	proc= subprocess.Popen( cmdArgs ,stdin=subprocess.PIPE ,stdout=subprocess.PIPE ,stderr=subprocess.PIPE)
+	totalBudget, inactivityBudget = budgets
 	_infoTs( "Running: %s" % " ".join( cmdArgs ), True )
-	stdOutput, errOutput= proc.communicate( )
+	_dbx( "Watchdog budgets: total %.0f s, inactivity %.0f s" % ( totalBudget, inactivityBudget ) )
+	monitor = ResourceMonitor.ResourceMonitor( resourceInterval, simulatorKey= g_deviceUdids.get( dev ) ) if resourceInterval > 0 else None
+	watchResult = g_backend.runTests( deviceRef( dev ), cmdArgs, testEnv= testEnv, budgets= budgets, tailLines= tailLines, cwd= projectDir, monitor= monitor )
+	stdOutput, errOutput = watchResult[ 'stdout' ], watchResult[ 'stderr' ]
 	_infoTs( "Returned from xcodebuild", True )
+	watchResult[ 'resources' ] = dict( watchResult.get( 'resources' ) or {}, logBytes= 0 )
 
 	stdoutLog = os.path.join( g_consoleBackupDir, "UITest_StdOUT__%s_%s" % ( devPretty, langPretty ) )
-	fileTextAndShowPathOnConsole( text= stdOutput, consoleMsgPrefix= "Stdout of xcodebuild saved to", outPath= stdoutLog )
+	watchResult[ 'resources' ][ 'logBytes' ] += fileTextAndShowPathOnConsole( text= stdOutput, consoleMsgPrefix= "Stdout of xcodebuild saved to", outPath= stdoutLog )
 
 	stdoutLog = None; stderrLog = None
-	if checkXcbAllTestsPassed( xcbStdout = stdOutput ): 
+	if watchResult[ 'timedOut' ]:
+		# no questions asked: the matrix has to move on
+		stderrLog = os.path.join( g_consoleBackupDir, "Watchdog__%s_%s" % ( devPretty, langPretty ) )
+		watchResult[ 'resources' ][ 'logBytes' ] += fileTextAndShowPathOnConsole( text= watchResult[ 'diagnostics' ], consoleMsgPrefix= "Combo timed out. Watchdog diagnostics saved to", outPath= stderrLog )
+	elif checkXcbAllTestsPassed( xcbStdout = stdOutput ): 
 		_infoTs( " *** Combo ___%s -- %s___ passed test ****" % ( lang ,dev ) )
 		returnCode = True
 	else:
@@ -379,17 +545,9 @@ def startUITestTarget( projectDir, lang, dev, outputDir, appName ):
 			handleConsoleOutput ( text= errOutput, isStderr= False, showLines= 10, abortOnError= True ) # fixme: test abortOnError
 	
 			stderrLog = os.path.join( g_consoleBackupDir, "UITest_StdERR__%s_%s" % ( devPretty, langPretty ) )
-			fileTextAndShowPathOnConsole( text= errOutput, consoleMsgPrefix= "Stderr of xcodebuild saved to", outPath= stderrLog )
-	
-			if not g_batchMode:
-				answer = raw_input( "Continue processing? Enter 'y' to proceed or anything else to abort: " )
-				if answer == 'y':
-					None # back to common path
-				else:
-					_errorExit( "Script aborted on request" )
+			watchResult[ 'resources' ][ 'logBytes' ] += fileTextAndShowPathOnConsole( text= errOutput, consoleMsgPrefix= "Stderr of xcodebuild saved to", outPath= stderrLog )
 
-	os.chdir( savedDir )
-	return returnCode, stdoutLog, stderrLog
+	return returnCode, stdoutLog, stderrLog, watchResult
 
 def setLangTerrInScheme( schemeFilePath, langTerr ) :
 	"""
@@ -451,8 +609,48 @@ def setLangTerrInScheme( schemeFilePath, langTerr ) :
 
 	return backupPath
 
-def setup():
+def setOptionalEnvVarInScheme( schemeFilePath, key, value ):
+	"""
+	Like setLangTerrInScheme but for environment variables the scheme does not need to have. Schemes
+	without the variable are left alone, the value then only reaches the test runner via TEST_RUNNER_ .
+	return the path of the backup of the scheme file when it has been changed, else None
+	"""
+	inFH = open( schemeFilePath, 'r' )
+	contentOld = inFH.read()
+	inFH.close()
+	pattern = r'(<EnvironmentVariable\s+key\s*=\s*"%s"\s+value\s*=\s*)("[^"]*")' % re.escape( key )
+	contentNew = re.sub( pattern, lambda match: match.group(1) + '"%s"' % value, contentOld, count= 1 )
+	if contentNew == contentOld:
+		return None
+	# save the original to tmp and emit its path
+	backupPath = tempfile.mktemp()
+	shutil.copy( schemeFilePath, backupPath )
+	_infoTs( "Scheme file backed up to %s" % backupPath )
+	outFH = open( schemeFilePath, 'w' )
+	outFH.write( contentNew ) 
+	outFH.close()
+	return backupPath
+
+def setup( argObject ):
 	myMkDir( g_consoleBackupDir )	
+	myMkDir( g_stateDir )
+	global g_reaper
+	g_reaper = RetentionGC.Reaper()
+	g_reaper.start()
+	# the archive and its combo folders are discarded next to where they are, with or without --noRetention
+	archiveRoot = os.path.abspath( argObject.screenshotsArchiveRoot )
+	g_reaper.reapLeftovers( [ os.path.dirname( archiveRoot ), archiveRoot ] )
+
+def startRetention( argObject ):
+	"""
+	prune old run logs and derived data in the background. What this run uses is protected. The screenshot
+	archive needs no pool since assertScreenshotsBackupDir empties it at the start of every run
+	"""
+	pools = [ { 'name': 'run logs', 'dir': g_userHome, 'pattern': 'UITestAutomatationRun_*', 'protected': [ g_consoleBackupDir ] }
+		, { 'name': 'derived data', 'dir': g_buildTestOutputDefaultRoot, 'protected': [ argObject.buildTestOutputDir ] }
+		]
+	return RetentionGC.startCollector( pools, g_reaper, maxAgeDays= argObject.retentionDays, keepLast= argObject.retentionKeep
+		, budgetMB= argObject.retentionBudgetMB )
 
 def checkXcbAllTestsPassed( xcbStdout ):
 	"""
@@ -465,7 +663,7 @@ Executed 1 test, with 0 failures (0 unexpected) in 12.504 (12.507) seconds
 	"""
 	#_dbx( "got lines: %d" % xcbStdout.count( "\n" ) )
 	#groups      1                                         2                                    3                                                                               45
-	pattern = r"^(.*\s+)(Test Suite 'All tests' passed at )(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d+\.)\s+(Executed \d+ test, with 0 failures \(\d+ unexpected\) in .* seconds\s)(.*$)" 
+	pattern = r"^(.*\s+)(Test Suite 'All tests' passed at )(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d+\.)\s+(Executed \d+ tests?, with 0 failures \(\d+ unexpected\) in .* seconds\s)(.*$)" 
 	match = re.match( pattern, xcbStdout, re.DOTALL )
 
 	if match == None:
@@ -481,6 +679,250 @@ Executed 1 test, with 0 failures (0 unexpected) in 12.504 (12.507) seconds
 
 	return True
 
+def runComboAttempt( argObject, combo, budgets, screenshotsArchiveRoot ):
+	"""
+	Run one attempt of the combo: configure the scheme, run the UI test target under the watchdog and
+	collect the screenshots. The outcome of the test cases is appended to combo[ 'attemptResults' ].
+	In parallel mode this runs in a worker thread, so it leaves the shared state to the caller.
+
+	With --multiLocale a combo is a session covering combo[ 'langs' ]. The test runner gets them as
+	TARGET_LANGS and is expected to relaunch the app once per language with launch arguments like
+	"-AppleLanguages (de) -AppleLocale de_DE" and to write the screenshots of a language into
+	SCREENSHOTS_DIR/<lang>. Each of these folders goes to the <dev>_<lang> archive folder as usual.
+	"""
+	dev, lang = combo[ 'dev' ], combo[ 'lang' ]
+	sessionLangs = combo[ 'langs' ]
+	attemptNo = len( combo[ 'attemptResults' ] ) + 1
+	publish( 'phase', dev= dev, lang= lang, phase= 'prepare' )
+
+	if argObject.editScheme: # parallel combos get TARGET_LANG through the test environment only
+		backupFile= setLangTerrInScheme( schemeFilePath= argObject.schemeFile, langTerr= lang ) 
+
+	devPretty= makeExpandFriendlyPath( dev )
+	langPretty= makeExpandFriendlyPath( lang )
+	# each combo gets its own sink which is emptied into the archive while the test is running
+	sinkDir = ScreenshotWatcher.prepareSinkDir( os.path.join( argObject.buildTestOutputDir, 'ScreenshotSinks', "%s_%s" % ( devPretty, langPretty ) ) )
+	if argObject.editScheme: setOptionalEnvVarInScheme( schemeFilePath= argObject.schemeFile, key= 'SCREENSHOTS_DIR', value= sinkDir )
+	watchers = []
+	pngTargetDirs = []
+	for sessionLang in sessionLangs:
+		pngTargetDir = os.path.join( screenshotsArchiveRoot, "%s_%s" % ( devPretty, makeExpandFriendlyPath( sessionLang ) ) )
+		# emptied by prepareComboDirs before the first attempt. A retry adds to the first attempt's screenshots
+		if argObject.watch: myMkDir( pngTargetDir ) # a cycle replaces the screenshots of the one before
+		langSinkDir = sinkDir
+		if argObject.multiLocale: langSinkDir = ScreenshotWatcher.prepareSinkDir( os.path.join( sinkDir, sessionLang ) )
+		watcher = ScreenshotWatcher.ScreenshotWatcher( langSinkDir, pngTargetDir, mode= argObject.screenshotWatch
+			, onIngest= lambda path, size, sessionLang= sessionLang: archiveScreenshot( path, size, dev, sessionLang ) )
+		watcher.start()
+		_dbx( "Watching screenshot sink '%s' (%s)" % ( langSinkDir, watcher.mode ) )
+		watchers.append( watcher )
+		pngTargetDirs.append( pngTargetDir )
+
+	publish( 'phase', dev= dev, lang= lang, phase= 'test' )
+
+	testEnv = { 'TARGET_LANG': sessionLangs[0], 'SCREENSHOTS_DIR': sinkDir }
+	if argObject.multiLocale: testEnv[ 'TARGET_LANGS' ] = ','.join( sessionLangs )
+	success, stdoutLog, stderrLog, watchResult = startUITestTarget( projectDir= argObject.projectRoot
+		, outputDir= argObject.buildTestOutputDir
+		, lang= lang, dev= dev, appName= argObject.appName
+		, budgets= budgets, tailLines= argObject.watchdogTailLines
+		, onlyTesting= combo[ 'onlyTesting' ], attemptNo= attemptNo
+		, testEnv= testEnv
+		, action= 'test-without-building' if argObject.buildOnce else 'test', keepWarm= argObject.watch
+		, resourceInterval= argObject.resourceInterval )
+
+	publish( 'phase', dev= dev, lang= lang, phase= 'collect' )
+	watchResult[ 'resources' ][ 'screenshotBytes' ] = 0
+	for watcher in watchers:
+		cntFiles, cntRotated, bytesMoved = watcher.stop()
+		_dbx( "Screenshots ingested from sink '%s': %d (rotated: %d, %d bytes)" % ( watcher.sinkDir, cntFiles, cntRotated, bytesMoved ) )
+		watchResult[ 'resources' ][ 'screenshotBytes' ] += bytesMoved
+
+	combo[ 'attemptResults' ].append( RetryPolicy.parseTestCaseResults( watchResult[ 'stdout' ], defaultTarget= argObject.appName + 'UITests' ) )
+
+	if os.path.isdir( argObject.legacyScreenshotDir ) and not argObject.multiLocale:
+		watchResult[ 'resources' ][ 'screenshotBytes' ] += moveScreenshots( srcRoot= argObject.legacyScreenshotDir, tgtDir= pngTargetDirs[0], dev= dev, lang= sessionLangs[0] )
+
+	_infoTs( "Done with simulator %s and lang %s (attempt %d)" % ( dev, lang, attemptNo ) )
+	if not argObject.parallel and not argObject.watch: closeSimulatorApp() # would take down the simulators of other combos, or the warm ones
+
+	return success, stdoutLog, stderrLog, watchResult
+
+def comboWorker( argObject, combo, budgets, screenshotsArchiveRoot, resultQueue ):
+	"""thread body. Whatever happens, the main loop gets an answer, even for _errorExit
+	"""
+	try:
+		resultQueue.put( ( combo, runComboAttempt( argObject, combo, budgets, screenshotsArchiveRoot ), None ) )
+	except BaseException:
+		resultQueue.put( ( combo, None, sys.exc_info() ) )
+
+def stopRunningCombos():
+	"""
+	kill the process groups of the combos still running, which Ctl-c does not reach, and give their workers
+	time to wrap up
+	"""
+	cntGroups = ComboWatchdog.killLiveGroups()
+	workers = [ thread for thread in threading.enumerate() if thread.name.startswith( g_comboWorkerPrefix ) ]
+	for worker in workers:
+		worker.join( g_workerJoinSeconds )
+	_dbx( "Killed %d process group(s), %d combo worker(s) stopped" % ( cntGroups, len( workers ) ) )
+
+def pickNextCombo( pendingCombos, deferredCombos, busyDevs ):
+	"""
+	return the next combo whose device is not busy, or None. Deferred retries only start once no first
+	attempt is pending any more
+	"""
+	candidates = pendingCombos if len( pendingCombos ) > 0 else deferredCombos
+	for ix, combo in enumerate( candidates ):
+		if combo[ 'dev' ] not in busyDevs:
+			return candidates.pop( ix )
+	return None
+
+def watchLoop( argObject, matrix, screenshotsArchiveRoot, durationHistory, flakeHistory, governor ):
+	"""
+	--watch: keep the simulators booted, and on every change of the project sources rebuild into the same
+	derived data, i.e. incrementally, and run the selected combos once more. Runs until Ctl-c, which kills
+	the combos running at that moment
+	"""
+	devs = matrix.devs()
+	for dev in devs: bootDevice( deviceRef( dev ) )
+	retryPolicy = RetryPolicy.RetryPolicy( maxAttempts= 1, retrySlots= 0, flakeHistory= flakeHistory ) # feedback first
+	excludedPaths = [ argObject.buildTestOutputDir, screenshotsArchiveRoot, g_consoleBackupDir ]
+	snapshot = None
+	cycle = 0
+	try:
+		while True:
+			newSnapshot = BuildCache.treeSnapshot( argObject.projectRoot, excludedPaths )
+			changed = [] if snapshot == None else BuildCache.changedPaths( snapshot, newSnapshot )
+			if snapshot != None and len( changed ) == 0:
+				time.sleep( argObject.watchInterval )
+				continue
+			snapshot = newSnapshot # taken before the build, so a save during the build triggers another cycle
+			cycle += 1
+			cycleStartTime = time.time()
+			if len( changed ) > 0:
+				_infoTs( "Cycle %d, changed: %s%s" % ( cycle, ", ".join( changed[ :5 ] ), " and %d more" % ( len( changed ) - 5 ) if len( changed ) > 5 else "" ), True )
+			publish( 'run_started', combos= len( matrix.combos ), devs= devs, langs= matrix.langs(), runDir= g_consoleBackupDir, jobs= argObject.maxJobs, cycle= cycle )
+			if not buildForTesting( argObject, devs[0], incremental= cycle > 1 ):
+				publish( 'run_finished', seconds= round( time.time() - cycleStartTime, 1 ), outcomes= { 'build failed': 1 }, cycle= cycle )
+				_infoTs( "Waiting for the next change" )
+				continue
+			comboLines, outcomeCounts = runMatrix( argObject, matrix, screenshotsArchiveRoot, durationHistory, flakeHistory, retryPolicy, governor )
+			publish( 'run_finished', seconds= round( time.time() - cycleStartTime, 1 ), outcomes= outcomeCounts, cycle= cycle )
+			g_archiveIndex.compact() # every cycle records the screenshots again
+			_infoTs( "Cycle %d done in %.1f s, screenshots in '%s':\n%s\nWaiting for the next change" % ( cycle, time.time() - cycleStartTime
+				, screenshotsArchiveRoot, "\n".join( comboLines ) ), True )
+	except KeyboardInterrupt:
+		signal.signal( signal.SIGINT, signal.SIG_IGN ) # a second Ctl-c would cut the clean up short
+		_infoTs( "Watch mode ended after %d cycle(s)" % cycle )
+		stopRunningCombos() # else their xcodebuild keeps the simulator
+	closeSimulatorApp()
+	g_events.close()
+
+def runMatrix( argObject, matrix, screenshotsArchiveRoot, durationHistory, flakeHistory, retryPolicy, governor ):
+	"""
+	Run the combos of the matrix, highest priority first and as many at a time as the governor allows,
+	retrying as the retry policy says. return ( summary line per combo, dictionary outcome -> number of combos )
+	"""
+	testSummaryLines = []
+	# ranAll: an attempt ran all test cases of the combo to the end, so the test cases of its results are all there are
+	pendingCombos = [ dict( matrixCombo, attemptResults= [], onlyTesting= argObject.onlyTesting, ranAll= False ) for matrixCombo in matrix.combos ]
+	deferredCombos = [] # retried once all combos had their first attempt
+	runningCombos = {} # dev -> combo. One combo per device at a time
+	resultQueue = Queue.Queue()
+	for combo in pendingCombos:
+		publish( 'combo_queued', dev= combo[ 'dev' ], lang= combo[ 'lang' ], attempt= 1
+			, expected= ComboWatchdog.expectedDuration( durationHistory, "%s|%s|%s" % ( argObject.appName, combo[ 'dev' ], combo[ 'lang' ] ) ) )
+	outcomeCounts = {}
+	while len( pendingCombos ) > 0 or len( deferredCombos ) > 0 or len( runningCombos ) > 0:
+		limit = governor.currentLimit( running= len( runningCombos ) )
+		while len( runningCombos ) < limit:
+			combo = pickNextCombo( pendingCombos, deferredCombos, busyDevs= runningCombos )
+			if combo == None: break
+			comboKey = "%s|%s|%s" % ( argObject.appName, combo[ 'dev' ], combo[ 'lang' ] )
+			budgets = ComboWatchdog.deriveBudgets( durationHistory, comboKey
+				, maxTotal= combo[ 'timeout' ] or argObject.comboTimeout, maxInactivity= combo[ 'inactivityTimeout' ] or argObject.inactivityTimeout
+				, factor= argObject.budgetFactor )
+			runningCombos[ combo[ 'dev' ] ] = combo
+			combo[ 'startedAt' ] = time.time()
+			publish( 'combo_started', dev= combo[ 'dev' ], lang= combo[ 'lang' ], attempt= len( combo[ 'attemptResults' ] ) + 1 )
+			worker = threading.Thread( target= comboWorker, args= ( argObject, combo, budgets, screenshotsArchiveRoot, resultQueue )
+				, name= g_comboWorkerPrefix + combo[ 'dev' ] )
+			worker.daemon = True
+			worker.start()
+
+		try:
+			combo, attemptResult, excInfo = resultQueue.get( timeout= governor.sampleSeconds )
+		except Queue.Empty:
+			continue # time for the governor to have another look
+		dev, lang = combo[ 'dev' ], combo[ 'lang' ]
+		comboKey = "%s|%s|%s" % ( argObject.appName, dev, lang )
+		del runningCombos[ dev ]
+		if excInfo != None:
+			traceback.print_exception( *excInfo )
+			raise excInfo[1]
+		success, stdoutLog, stderrLog, watchResult = attemptResult
+		combo.setdefault( 'resources', [] ).append( watchResult[ 'resources' ] ) # of each attempt
+		if combo[ 'onlyTesting' ] in ( None, argObject.onlyTesting ) and not watchResult[ 'timedOut' ] and len( combo[ 'attemptResults' ][ -1 ] ) > 0:
+			combo[ 'ranAll' ] = True
+
+		if combo[ 'onlyTesting' ] == None: # partial reruns would skew the budgets
+			outcome = "succeeded" if success else "failed" 
+			if watchResult[ 'timedOut' ]: outcome = "timed out"
+			ComboWatchdog.recordDuration( durationHistory, comboKey, watchResult[ 'elapsed' ], watchResult[ 'maxSilence' ], outcome, watchResult[ 'resources' ] )
+			ComboWatchdog.saveDurationHistory( g_durationHistoryPath, durationHistory )
+
+		if not success:
+			when, onlyTesting = retryPolicy.planRetry( comboKey= comboKey, attemptNo= len( combo[ 'attemptResults' ] ), testResults= combo[ 'attemptResults' ][ -1 ] )
+			if when != None:
+				_infoTs( "Will retry combo %s - %s %s. Test(s): %s" % ( dev, lang
+					, "right away" if when == 'now' else "at the end", "all" if onlyTesting == None else ', '.join( onlyTesting ) ) )
+				combo[ 'onlyTesting' ] = onlyTesting
+				publish( 'combo_finished', dev= dev, lang= lang, attempt= len( combo[ 'attemptResults' ] )
+					, outcome= "timed out" if watchResult[ 'timedOut' ] else "failed", seconds= round( time.time() - combo[ 'startedAt' ], 1 ), final= False )
+				publish( 'combo_queued', dev= dev, lang= lang, attempt= len( combo[ 'attemptResults' ] ) + 1, expected= None )
+				if when == 'now': pendingCombos.insert( 0, combo )
+				else: deferredCombos.append( combo )
+				continue
+
+		classifications = RetryPolicy.classifyAttempts( combo[ 'attemptResults' ] )
+		for testId, classification in classifications.items():
+			RetryPolicy.recordClassification( flakeHistory, comboKey, testId, classification )
+		RetryPolicy.saveFlakeHistory( g_flakeHistoryPath, flakeHistory )
+
+		outcome = RetryPolicy.comboOutcome( combo[ 'attemptResults' ], combo[ 'ranAll' ], watchResult[ 'timedOut' ] )
+		comboSuccess = outcome in ( "succeeded", "flaky" )
+
+		resources = ResourceMonitor.combineUsage( combo[ 'resources' ] )
+		publish( 'combo_finished', dev= dev, lang= lang, attempt= len( combo[ 'attemptResults' ] ), outcome= outcome
+			, seconds= round( time.time() - combo[ 'startedAt' ], 1 ), final= True, resources= resources )
+		outcomeCounts[ outcome ] = outcomeCounts.get( outcome, 0 ) + 1
+
+		summaryLine = "Combo %s - %s " % ( dev, lang ) 
+		summaryLine += outcome
+		if len( combo[ 'attemptResults' ] ) > 1: summaryLine += " after %d attempts" % len( combo[ 'attemptResults' ] )
+		if watchResult[ 'timedOut' ]: summaryLine += " (%s budget, %.0f s)" % ( watchResult[ 'timedOut' ], watchResult[ 'elapsed' ] )
+		flakyTests = sorted( testId for testId, classification in classifications.items() if classification == 'flaky' )
+		if len( flakyTests ) > 0: summaryLine += ". flaky: %s" % ', '.join( flakyTests )
+		if ResourceMonitor.formatUsage( resources ): summaryLine += ". %s" % ResourceMonitor.formatUsage( resources )
+		failedTests = sorted( testId for testId, classification in classifications.items() if classification == 'fail' )
+		if len( failedTests ) > 0: summaryLine += ". failed: %s" % ', '.join( failedTests )
+		if not combo[ 'ranAll' ] and not watchResult[ 'timedOut' ]: summaryLine += ". not all test cases ran"
+		if not comboSuccess:
+			if stdoutLog != None: summaryLine += ". stdout: %s" % stdoutLog
+			if stderrLog != None: summaryLine += ". stderr: %s" % stderrLog
+		_dbx( summaryLine )
+		testSummaryLines.append( summaryLine )
+
+		if not comboSuccess and not g_batchMode and not argObject.watch and not watchResult[ 'timedOut' ]:
+			answer = raw_input( "Continue processing? Enter 'y' to proceed or anything else to abort: " )
+			if answer == 'y':
+				None # back to common path
+			else:
+				_errorExit( "Script aborted on request" )
+
+	return testSummaryLines, outcomeCounts
+
 def main():
 	nextStep="""
 Arrange screenshots output folders in the hierarchy <device>/<locale> since for itms transporter we will
@@ -489,74 +931,132 @@ images from all locales into one single folder!
 """
 
 	# _errorExit( nextStep )
+	if len( sys.argv ) > 1 and sys.argv[1] == 'status':
+		ProgressEvents.statusMain( sys.argv[ 2: ], runDirsGlob= os.path.join( g_userHome, "UITestAutomatationRun_*" ) )
+		return
 	startTime= time.strftime("%H:%M:%S")
 
 	scriptBasename = os.path.basename( __file__ )
 	argObject = parseCmdLine()
 
-	setup()
+	setup( argObject )
 
 	_infoTs( "Build and test output dir will be '%s'" % argObject.buildTestOutputDir )
 	screenshotsArchiveRoot = argObject.screenshotsArchiveRoot 
 	assertScreenshotsBackupDir ( screenshotsArchiveRoot )
+	global g_archiveIndex
+	g_archiveIndex = ArchiveIndex.ArchiveIndex( screenshotsArchiveRoot )
 
 	_infoTs( "Screenshots for all device and lang pairing will be backed up to '%s'" % screenshotsArchiveRoot )
 
-	devs, langs = getListOfLangsAndDevicesFromFile ( argObject.langDevFile )
+	matrix = MatrixConfig.loadMatrix( argObject.langDevFile ).select( argObject.onlyDevs, argObject.onlyLangs )
+	devs, langs = matrix.devs(), matrix.langs()
+	if len( matrix.combos ) == 0:
+		_errorExit( "No combo to run in '%s'" % argObject.langDevFile )
+	cntLangCombos = len( matrix.combos )
+	if argObject.multiLocale: matrix = matrix.perDevice()
 	_infoTs( 'Will iterate over these lang(s) : \t%s' % '__ ; __ **'.join( langs ) )
 	_infoTs( 'Will iterate over these dev(s) : \t%s'  % '__ ; __'.join( devs ) )
-
-	waitSeconds = 4
+	if cntLangCombos != len( devs ) * len( langs ) or argObject.multiLocale:
+		_infoTs( 'Will run these %d combo(s) only:\n\t%s' % ( len( matrix.combos ), '\n\t'.join( matrix.describe() ) ) )
+
+	global g_backend
+	g_backend = DeviceBackend.createBackend( argObject.backend, diagnosticsDir= g_consoleBackupDir, fakeConfigPath= argObject.fakeConfig, devices= devs )
+
+	if not argObject.noRetention:
+		startRetention( argObject )
+
+	global g_events
+	g_events = ProgressEvents.EventPublisher( os.path.join( g_consoleBackupDir, ProgressEvents.g_eventsFileName ), socketPath= argObject.progressSocket )
+	try:
+		resolvedDevs, problems, seconds = DeviceCatalog.preflight( g_backend, devs
+			, cachePath= os.path.join( g_stateDir, "deviceCatalog_%s.json" % g_backend.name )
+			, ttlSeconds= argObject.deviceCatalogTtl, refresh= argObject.refreshDeviceCatalog )
+	except ( RuntimeError, ValueError ) as exc:
+		_errorExit( "Could not list the simulators: %s" % exc )
+	if len( problems ) > 0:
+		_errorExit( "Device preflight failed, fix '%s':\n\t%s" % ( argObject.langDevFile, "\n\t".join( problems ) ) )
+	global g_deviceUdids
+	g_deviceUdids = dict( ( dev, entry[ 'udid' ] ) for dev, entry in resolvedDevs.items() )
+	_infoTs( "Device preflight resolved %d device(s) in %.3f s" % ( len( resolvedDevs ), seconds ) )
+	# only now, so a run which did not get past the preflight leaves no run_started without run_finished
+	publish( 'run_started', combos= len( matrix.combos ), devs= devs, langs= langs, runDir= g_consoleBackupDir, jobs= argObject.maxJobs )
+	runStartTime = time.time()
+
+	waitSeconds = argObject.countdown if not argObject.watch else 0
 	_infoTs( '*** Counting down %d seconds. Ctl-c or processing will continue' % waitSeconds )
 	for i in range( waitSeconds, 0, -1 ): print( i ); time.sleep(1) 
 
-	if True:
+	if not argObject.watch: # keeps whatever simulator is warm
 		closeSimulatorApp()
 
 		# bundlePath= performBuild( appName= argObject.appName , projectDir= argObject.projectRoot , buildOutputDir= argObject.buildTestOutputDir , doClean= argObject.cleanSwitch )
 		# if bundlePath == None:
 		#	_errorExit( "No bundle path returned!" )
 		# deployAppToDevice( dev= dev, bundlePath= bundlePath )
-	else:
-		_infoTs( "skipped build to shortcut test!!" )
-	testSummaryLines = []; testSummaryLines.append( "Test summary:" ) 
-	for dev in devs:
-		for lang in langs:
-
-			if True:
-				backupFile= setLangTerrInScheme( schemeFilePath= argObject.schemeFile, langTerr= lang ) 
-
-			else:
-				_infoTs( "skipped Deploying App to shortcut test!!" )
-
-			success, stdoutLog, stderrLog = startUITestTarget( projectDir= argObject.projectRoot
-				, outputDir= argObject.buildTestOutputDir
-				, lang= lang, dev= dev, appName= argObject.appName )
-			
-			summaryLine = "Combo %s - %s " % ( dev, lang ) 
-			summaryLine += "succeeded" if success else "failed" 
-			if not success:
-				if stdoutLog != None: summaryLine += ". stdout: %s" % stdoutLog
-				if stderrLog != None: summaryLine += ". stderr: %s" % stderrLog
-			_dbx( summaryLine )
-			testSummaryLines.append( summaryLine )
-
-			devPretty= makeExpandFriendlyPath( dev )
-			langPretty= makeExpandFriendlyPath( lang )
-			pngTargetDir = os.path.join( screenshotsArchiveRoot, "%s_%s" % ( devPretty, langPretty ) )
-			# give user a chance to keep the content of the target directory
-			assertScreenshotsBackupDir ( pngTargetDir )
-
-			pngSourceDir = "/Users/bmlam/Temp/ManyTimes/Screenshots"  # this is hardwired in swift test program
-			moveScreenshots( srcRoot= pngSourceDir, tgtDir= pngTargetDir )
+	durationHistory = ComboWatchdog.loadDurationHistory( g_durationHistoryPath )
+	flakeHistory = RetryPolicy.loadFlakeHistory( g_flakeHistoryPath )
+	retryPolicy = RetryPolicy.RetryPolicy( maxAttempts= argObject.maxAttempts, retrySlots= argObject.retrySlots, flakeHistory= flakeHistory )
+
+	governor = ConcurrencyGovernor.ConcurrencyGovernor( minJobs= argObject.minJobs, maxJobs= argObject.maxJobs
+		, maxLoadPerCpu= argObject.maxLoadPerCpu, minFreeMB= argObject.minFreeMB, sampleSeconds= argObject.governorInterval
+		, logPath= os.path.join( g_consoleBackupDir, "governor.log" ) )
+	if argObject.watch:
+		watchLoop( argObject, matrix, screenshotsArchiveRoot, durationHistory, flakeHistory, governor )
+		return
+	if argObject.buildOnce and not buildForTesting( argObject, devs[0] ):
+		_errorExit( "Build for testing failed, see above" )
+
+	testSummaryLines = [ "Test summary:" ]
+	prepareComboDirs( matrix, screenshotsArchiveRoot )
+	comboLines, outcomeCounts = runMatrix( argObject, matrix, screenshotsArchiveRoot, durationHistory, flakeHistory, retryPolicy, governor )
+	testSummaryLines += comboLines
+
+	if argObject.parallel: closeSimulatorApp()
+
+	if argObject.optimizePngs:
+		pngReport = PngOptimizer.formatReport( PngOptimizer.optimizeArchive( screenshotsArchiveRoot, argObject.pngJobs ) )
+		testSummaryLines.append( pngReport )
+		g_archiveIndex.refresh()
+
+	if argObject.gallery: # after the optimisation, which changes the content hashes
+		testSummaryLines.append( RunGallery.formatReport( RunGallery.buildGallery( screenshotsArchiveRoot, devs= devs, langs= langs, jobs= argObject.pngJobs
+			, title= "%s screenshots of %s" % ( argObject.appName, os.path.basename( g_consoleBackupDir ) ) ) ) )
+
+	if argObject.storeExportMapping != None: # after the optimisation so we link the final files
+		mapping = StoreExport.readMapping( argObject.storeExportMapping )
+		exportRoot = argObject.storeExportRoot or mapping.get( 'exportRoot' )
+		if exportRoot == None:
+			_errorExit( "No store export root given on command line or in '%s'" % argObject.storeExportMapping )
+		exportRoot = os.path.expanduser( exportRoot )
+		exportTotals = StoreExport.exportScreenshots( mapping, screenshotsArchiveRoot, exportRoot )
+		testSummaryLines.append( StoreExport.formatReport( exportTotals, exportRoot ) )
+
+	publish( 'run_finished', seconds= round( time.time() - runStartTime, 1 ), outcomes= outcomeCounts )
+	g_events.close()
+	g_archiveIndex.compact()
 
-			_infoTs( "Done with simulator %s and lang %s" % ( dev, lang ) )
-			closeSimulatorApp()
 	#_dbx( "lines: %d" % len( testSummaryLines ) )
 	summaryText = "\n".join( testSummaryLines ) 
 	_infoTs( summaryText )
 	testSummaryLog = os.path.join( g_consoleBackupDir, "test_summary.txt" )
 	fileTextAndShowPathOnConsole( text = summaryText, consoleMsgPrefix = "A copy of the summary above is written to ", outPath= testSummaryLog )
+
+	failureIndex = FailureIndex.loadIndex( FailureIndex.g_indexPath ) # this run only, "FailureIndex.py update" scans them all
+	FailureIndex.updateIndex( failureIndex, [ g_consoleBackupDir ] )
+	FailureIndex.saveIndex( FailureIndex.g_indexPath, failureIndex )
 	_infoTs( "%s completed normally. StartTime was %s\n%s" % ( scriptBasename, startTime, '*'*80 ) , True )
 	
-main() # program entry point
+def _terminate( signum, frame ):
+	raise KeyboardInterrupt # clean up like on Ctl-c
+
+if __name__ == '__main__':
+	signal.signal( signal.SIGTERM, _terminate )
+	try:
+		main() # program entry point
+	except KeyboardInterrupt:
+		signal.signal( signal.SIGINT, signal.SIG_IGN ) # a second Ctl-c would cut the clean up short
+		# xcodebuild and simctl run in sessions of their own, which Ctl-c does not reach
+		_infoTs( "Interrupted, killed %d running child process group(s)" % ComboWatchdog.killLiveGroups() )
+		sys.stdout.flush(); sys.stderr.flush()
+		os._exit( 130 ) # combo workers may still be collecting, tearing down python 2 under its threads can crash
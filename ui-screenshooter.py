@@ -25,6 +25,8 @@ import shutil
 import subprocess 
 import time 
 
+import MatrixConfig
+
 g_screenshotsBakRoot=  os.path.join( os.environ[ 'HOME' ] , 'Desktop',  'TestAuto_screenshots' )
 g_bundleDir			= "" # set later
 g_traceResultsDir	= "" # set later
@@ -78,48 +80,6 @@ def assertUIPlayBook ( path ):
 		_errorExit( "Playbook '%s' not found or accessible" % path )
 	_infoTs( "Ok, will use '%s' as UI script." % path )
 
-def getListOfLangsAndDevicesFromFile(filePath):
-	"""Decompose the file content into list of languages and device types 
-	"""
-
-	fieldSep = ':'
-	langLiteral = 'lang'
-	devLiteral  = 'dev'
-
-	try :
-		fh= open( filePath, 'r')
-	except IOError:
-		_errorExit( 'Could not read file %s' % filePath )
-
-	langs= []
-	devs= []
-
-	lineNo= 0
-	for lineIn in fh.readlines():
-		lineNo+= 1
-		line =lineIn.strip()
-		if not line.startswith("#"):
-			if len( line ) > 0:
-				fields = line .split ( fieldSep )
-				# _dbx( len( fields ) )
-				if len ( fields ) != 2:
-
-					_errorExit( "Each payload line in '%s' is must contain 2 fields separated by '%s'. Line %d is invalid" % ( filePath, fieldSep, lineNo) )
-
-				key, value = fields[0:2] # start from 0 and take 2
-				if key == devLiteral :
-					if value in devs :
-						_errorExit( "Device %s found again in line %d. Dupes are not permitted!" % (value, lineNo) )
-					devs.append( value )
-				elif key == langLiteral :
-					if value in langs :
-						_errorExit( "Device %s found again in line %d. Dupes are not permitted!" % (value, lineNo) )
-					langs.append( value )
-				else:
-					_errorExit( "The keyword found in line %d of '%s' is invalid" % ( lineNo, filePath ) )
-
-	return devs, langs
-
 def performBuild ( projectDir, buildOutputDir, doClean = True ):
 	""" A wrapper around `xcodebuild` that tells it to build the app in the temp
 	directory. If your app uses workspaces or special schemes, you'll need to
@@ -267,29 +227,29 @@ def main():
 	assertScreenshotsBackupRoot ( screenshotsBakDir )
 	_infoTs( "Screenshots will be backed to '%s'" % screenshotsBakDir )
 
-	devs, langs = getListOfLangsAndDevicesFromFile ( './listOfLangsAndDevices.txt' )
-	_infoTs( 'Will iterate over these lang(s) : \t%s' % '; '.join( langs ) )
-	_infoTs( 'Will iterate over these dev(s) : \t%s'  % '; '.join( devs ) )
+	matrix = MatrixConfig.loadMatrix( './listOfLangsAndDevices.txt' )
+	_infoTs( 'Will iterate over these lang(s) : \t%s' % '; '.join( matrix.langs() ) )
+	_infoTs( 'Will iterate over these dev(s) : \t%s'  % '; '.join( matrix.devs() ) )
 
 	performBuild( argObject.project_dir, argObject.build_output, argObject.cleanSwitch )
 
-	for dev in devs:
-		for lang in langs:
-			recreateTraceOutputDir( g_traceResultsDir )
+	for combo in matrix.combos:
+		dev, lang = combo[ 'dev' ], combo[ 'lang' ]
+		recreateTraceOutputDir( g_traceResultsDir )
 
-			# instruments will create trace.trace under traceOutputLoc on each run
-			traceTraceDir = os.path.join( argObject.build_output, 'trace.trace' )  
-			if os.path.isdir( traceTraceDir ): shutil.rmtree( traceTraceDir )
+		# instruments will create trace.trace under traceOutputLoc on each run
+		traceTraceDir = os.path.join( argObject.build_output, 'trace.trace' )  
+		if os.path.isdir( traceTraceDir ): shutil.rmtree( traceTraceDir )
 
-			# instruments creates "Run 1", "Run1 (2)", "Run1 (3)" etc under the given location
-			run1Dir = os.path.join( argObject.build_output, 'Run 1' )  
-			if os.path.isdir( run1Dir ): shutil.rmtree( run1Dir )
+		# instruments creates "Run 1", "Run1 (2)", "Run1 (3)" etc under the given location
+		run1Dir = os.path.join( argObject.build_output, 'Run 1' )  
+		if os.path.isdir( run1Dir ): shutil.rmtree( run1Dir )
 
-			startSimulatorAndPlayUIScript( lang= lang, dev= dev, ui_script= argObject.ui_script , bundleDir= g_bundleDir, instrumOutputLoc= argObject.build_output )
-			backupScreenshots( argObject.build_output, screenshotsBakDir, lang, dev )
+		startSimulatorAndPlayUIScript( lang= lang, dev= dev, ui_script= argObject.ui_script , bundleDir= g_bundleDir, instrumOutputLoc= argObject.build_output )
+		backupScreenshots( argObject.build_output, screenshotsBakDir, lang, dev )
 
-			_infoTs( "Closing simulator %s" % dev )
-			closeSimulator()
+		_infoTs( "Closing simulator %s" % dev )
+		closeSimulator()
 
 	_infoTs( "\n\n%s completed normally." % scriptBasename , True )
 			